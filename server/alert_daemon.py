@@ -0,0 +1,69 @@
+# alert_daemon.py - Run the alert engine in its own process
+#
+# Start the web app with RUN_ALERT_ENGINE=False and REDIS_URL set, then:
+#     python alert_daemon.py
+# Alerts created, deleted or re-activated in the web app reach the daemon
+# over Redis as they happen, and triggered alerts are published back and
+# delivered by whichever web worker holds the user's websocket. Without
+# Redis the daemon would only pick up alert changes on its index reload
+# (up to index_refresh_interval, 300s, later), so it refuses to start.
+import asyncio
+import logging
+import sys
+
+# uvloop is optional (installed with uvicorn[standard]) - fall back to the default loop
+try:
+    import uvloop
+    UVLOOP_AVAILABLE = True
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
+from database import Database
+from services.golemdb_service import create_tokenTalk_golem_hybrid, GolemConfig
+from services.enhanced_notification_service import create_enhanced_notification_service
+from services.shared_state import shared_state
+from services.alert_engine import alert_engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+async def main():
+    """Initialize storage and notifications, then run the monitoring loop"""
+    await shared_state.init()
+    if not shared_state.enabled:
+        logger.error("❌ Alert daemon needs REDIS_URL - without it alert changes from the web app "
+                     "and websocket delivery can't reach this process")
+        await shared_state.close()
+        raise SystemExit(1)
+    
+    sqlite_db = Database()
+    await sqlite_db.init_database()
+    
+    hybrid_db = await create_tokenTalk_golem_hybrid(sqlite_db, GolemConfig())
+    alert_engine.notifications = create_enhanced_notification_service(hybrid_db.golem)
+    
+    logger.info("🚨 Alert daemon running as %s", shared_state.worker_id)
+    try:
+        await alert_engine.start_monitoring()
+    finally:
+        alert_engine.stop_monitoring()
+        await alert_engine.notifications.close()
+        await hybrid_db.close()
+        await alert_engine.db.close()
+        await shared_state.close()
+
+def run():
+    """Run main() on uvloop when available, driving it through asyncio.Runner on 3.12+"""
+    if UVLOOP_AVAILABLE and sys.version_info >= (3, 12):
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(main())
+    else:
+        if UVLOOP_AVAILABLE:
+            uvloop.install()
+        asyncio.run(main())
+
+if __name__ == "__main__":
+    try:
+        run()
+    except KeyboardInterrupt:
+        logger.info("🛑 Alert daemon stopped")
@@ -1,14 +1,20 @@
 # api/alerts.py - Alerts API endpoints
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from typing import List
 from datetime import datetime
 
-from database import db, AlertCondition
+from database import db, Alert, AlertCondition
 from models import AlertResponse, CreateAlertRequest, AlertListResponse
 from services.nlp_service import nlp_service
+from services.alert_engine import alert_engine
+from utils import serialization
 
 router = APIRouter()
 
+def _json_response(payload) -> Response:
+    """Encode response dataclasses directly, skipping FastAPI's jsonable_encoder pass"""
+    return Response(content=serialization.dumps_bytes(payload), media_type="application/json")
+
 @router.get("/")
 async def get_all_alerts():
     """Get all alerts (for admin/debugging)"""
@@ -28,10 +34,10 @@ async def get_all_alerts():
                 triggered_at=alert.triggered_at.isoformat() if alert.triggered_at else None
             ))
         
-        return AlertListResponse(
+        return _json_response(AlertListResponse(
             alerts=alert_responses,
             total=len(alert_responses)
-        )
+        ))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get alerts: {str(e)}")
 
@@ -54,10 +60,10 @@ async def get_user_alerts(user_id: str):
                 triggered_at=alert.triggered_at.isoformat() if alert.triggered_at else None
             ))
         
-        return AlertListResponse(
+        return _json_response(AlertListResponse(
             alerts=alert_responses,
             total=len(alert_responses)
-        )
+        ))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get user alerts: {str(e)}")
 
@@ -90,6 +96,13 @@ async def create_alert(request: CreateAlertRequest):
             condition=condition,
             message=request.message
         )
+        alert_engine.add_alert(Alert(
+            id=alert_id,
+            user_id=request.user_id,
+            user_email=request.user_email,
+            condition=condition,
+            message=request.message
+        ))
         
         return {
             "success": True,
@@ -120,6 +133,7 @@ async def update_alert_status(alert_id: str, status: str):
             )
         
         await db.update_alert_status(alert_id, status)
+        alert_engine.update_status(alert_id, status)
         
         return {
             "success": True,
@@ -139,7 +153,9 @@ async def delete_alert(alert_id: str, user_id: str):
     try:
         success = await db.delete_alert(alert_id, user_id)
         
-        if not success:
+        if success:
+            alert_engine.remove_alert(alert_id)
+        else:
             raise HTTPException(
                 status_code=404, 
                 detail="Alert not found or you don't have permission to delete it"
@@ -216,9 +232,17 @@ async def create_multiple_alerts(requests: List[CreateAlertRequest]):
                 # Create alert
                 alert_id = await db.create_alert(
                     user_id=request.user_id,
+                    user_email=request.user_email,
                     condition=condition,
                     message=request.message
                 )
+                alert_engine.add_alert(Alert(
+                    id=alert_id,
+                    user_id=request.user_id,
+                    user_email=request.user_email,
+                    condition=condition,
+                    message=request.message
+                ))
                 
                 created_alerts.append({
                     "index": i,
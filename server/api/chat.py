@@ -5,9 +5,10 @@ from typing import List, Dict, Optional
 import json
 from datetime import datetime
 
-from database import Database, AlertCondition, get_database
+from database import Database, Alert, AlertCondition, get_database
 from models import AlertResponse
 from services.nlp_service import nlp_service
+from services.alert_engine import alert_engine
 from config import settings
 
 router = APIRouter()
@@ -25,6 +26,7 @@ class TestParsingRequest(BaseModel):
 class ComplexMessageRequest(BaseModel):
     message: str
     user_id: str = "default_user"
+    user_email: Optional[str] = None
     context: Optional[Dict] = None
 
 
@@ -73,6 +75,13 @@ async def chat_message(
                     condition=condition,
                     message=request.message
                 )
+                alert_engine.add_alert(Alert(
+                    id=alert_id,
+                    user_id=request.user_id,
+                    user_email=request.user_email,
+                    condition=condition,
+                    message=request.message
+                ))
                 
                 alert_created = True
                 
@@ -240,11 +249,21 @@ async def handle_complex_message(
                 secondary_condition=parsed_condition.secondary_condition
             )
             
+            # Fall back to the address on file when the request doesn't carry one
+            user_email = request.user_email or await db.get_user_email(request.user_id) or ""
             alert_id = await db.create_alert(
                 user_id=request.user_id,
+                user_email=user_email,
                 condition=condition,
                 message=request.message
             )
+            alert_engine.add_alert(Alert(
+                id=alert_id,
+                user_id=request.user_id,
+                user_email=user_email,
+                condition=condition,
+                message=request.message
+            ))
             
             return {
                 "response": f"🚨 Complex alert created! {response_text}",
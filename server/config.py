@@ -20,12 +20,25 @@ class Settings:
     
     # Resend Email Configuration
     RESEND_API_KEY = os.getenv("RESEND_API_KEY", "")
+    RESEND_API_URL = "https://api.resend.com/emails"
+    RESEND_BATCH_API_URL = "https://api.resend.com/emails/batch"
     FROM_EMAIL = os.getenv("FROM_EMAIL", "contact@xidjumba.com")
     ENABLE_EMAIL_NOTIFICATIONS = os.getenv("ENABLE_EMAIL_NOTIFICATIONS", "True").lower() == "true"
     
+    # In-memory notification history (most recent kept)
+    NOTIFICATION_BUFFER = int(os.getenv("NOTIFICATION_BUFFER", "10000"))
+    USER_NOTIFICATION_BUFFER = int(os.getenv("USER_NOTIFICATION_BUFFER", "50"))
+    
     # Database
     DATABASE_URL = "sqlite:///./stonewatch.db"
     
+    # Shared state across uvicorn workers (optional, e.g. redis://localhost:6379/0)
+    REDIS_URL = os.getenv("REDIS_URL", "")
+    
+    # Run the alert engine inside the web process (set False when using alert_daemon.py,
+    # which requires REDIS_URL so alert changes reach it immediately)
+    RUN_ALERT_ENGINE = os.getenv("RUN_ALERT_ENGINE", "True").lower() == "true"
+    
     # Environment
     DEBUG = os.getenv("DEBUG", "True").lower() == "true"
     
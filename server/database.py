@@ -3,8 +3,9 @@ import sqlite3
 import aiosqlite
 import asyncio
 import json
+from contextlib import asynccontextmanager
 from typing import List, Dict, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from datetime import datetime
 import uuid
 
@@ -16,6 +17,17 @@ class AlertCondition:
     timeframe: str = "24h"
     secondary_condition: Optional[Dict] = None  # For complex conditions like "while BTC stays stable"
 
+def condition_to_dict(condition: AlertCondition) -> Dict:
+    """Plain-dict form of a condition (cheaper than dataclasses.asdict's deep copy)"""
+    secondary = condition.secondary_condition
+    return {
+        "tokens": list(condition.tokens),
+        "condition_type": condition.condition_type,
+        "threshold": condition.threshold,
+        "timeframe": condition.timeframe,
+        "secondary_condition": dict(secondary) if secondary is not None else None,
+    }
+
 @dataclass
 class Alert:
     id: str
@@ -31,6 +43,31 @@ class Alert:
         if self.created_at is None:
             self.created_at = datetime.now()
 
+def alert_to_dict(alert: Alert) -> Dict:
+    """JSON-safe form of an alert, for handing it to another process"""
+    return {
+        "id": alert.id,
+        "user_id": alert.user_id,
+        "user_email": alert.user_email,
+        "condition": condition_to_dict(alert.condition),
+        "status": alert.status,
+        "created_at": alert.created_at.isoformat() if alert.created_at else None,
+        "message": alert.message,
+    }
+
+def alert_from_dict(data: Dict) -> Alert:
+    """Rebuild an alert serialized with alert_to_dict"""
+    created_at = data.get("created_at")
+    return Alert(
+        id=data["id"],
+        user_id=data["user_id"],
+        user_email=data.get("user_email") or "",
+        condition=AlertCondition(**data["condition"]),
+        status=data.get("status", "active"),
+        created_at=datetime.fromisoformat(created_at) if created_at else None,
+        message=data.get("message", ""),
+    )
+
 @dataclass
 class User:
     user_id: str
@@ -42,13 +79,73 @@ class User:
         if self.created_at is None:
             self.created_at = datetime.now()
 
+# Applied to every connection; journal_mode=WAL persists in the database file
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # readers don't block on the writer
+    "PRAGMA synchronous=NORMAL",    # fsync at checkpoints, safe with WAL
+    "PRAGMA cache_size=-65536",     # 64 MiB page cache
+    "PRAGMA busy_timeout=5000",
+)
+
+TRIGGER_LOG_FLUSH_INTERVAL = 0.5  # seconds
+
 class Database:
     def __init__(self, db_path: str = "tokenTalk.db"):
         self.db_path = db_path
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._conn_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()  # one write transaction at a time on the shared connection
+        self._pending_trigger_logs = []
+        self._trigger_flush_task: Optional[asyncio.Task] = None
+    
+    async def _get_connection(self) -> aiosqlite.Connection:
+        """Open the shared connection on first use"""
+        if self._conn is None:
+            async with self._conn_lock:
+                if self._conn is None:
+                    conn = await aiosqlite.connect(self.db_path)
+                    for pragma in CONNECTION_PRAGMAS:
+                        await conn.execute(pragma)
+                    self._conn = conn
+        return self._conn
+    
+    @asynccontextmanager
+    async def _connection(self):
+        """Yield the shared connection (kept open across calls)"""
+        yield await self._get_connection()
+    
+    @asynccontextmanager
+    async def _transaction(self):
+        """Yield the shared connection inside BEGIN ... COMMIT, rolling back on error.
+
+        Writers queue on a lock so another coroutine's commit can't land
+        in the middle of a transaction.
+        """
+        async with self._write_lock:
+            db = await self._get_connection()
+            await db.execute("BEGIN")
+            try:
+                yield db
+            except BaseException:
+                await db.rollback()
+                raise
+            await db.commit()
+    
+    async def close(self):
+        """Flush pending trigger logs and close the shared connection"""
+        # Let a scheduled or running flush finish - cancelling it mid-write would
+        # roll back rows it has already taken off the buffer
+        if self._trigger_flush_task:
+            await self._trigger_flush_task
+        await self.flush_alert_triggers()
+        
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
     
     async def init_database(self):
         """Initialize SQLite database with required tables"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
             # Users table
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -103,12 +200,11 @@ class Database:
                 )
             """)
             
-            await db.commit()
-            print("✅ Database initialized successfully")
+        print("✅ Database initialized successfully")
     
     async def get_or_create_user(self, user_id: str, email: str = None) -> User:
         """Get existing user or create new one"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             # Try to get existing user
             async with db.execute(
                 "SELECT user_id, email, email_notifications, created_at FROM users WHERE user_id = ?",
@@ -123,33 +219,32 @@ class Database:
                         email_notifications=bool(row[2]),
                         created_at=datetime.fromisoformat(row[3]) if row[3] else datetime.now()
                     )
-            
-            # Create new user
+        
+        # Create new user
+        async with self._transaction() as db:
             await db.execute(
                 "INSERT INTO users (user_id, email) VALUES (?, ?)",
                 (user_id, email)
             )
-            await db.commit()
-            
-            return User(user_id=user_id, email=email)
+        
+        return User(user_id=user_id, email=email)
     
     async def update_user_email(self, user_id: str, email: str) -> bool:
         """Update user's email address"""
-        async with aiosqlite.connect(self.db_path) as db:
-            # Create user if doesn't exist
-            await self.get_or_create_user(user_id, email)
-            
+        # Create user if doesn't exist
+        await self.get_or_create_user(user_id, email)
+        
+        async with self._transaction() as db:
             # Update email
             cursor = await db.execute(
                 "UPDATE users SET email = ? WHERE user_id = ?",
                 (email, user_id)
             )
-            await db.commit()
-            return cursor.rowcount > 0
+        return cursor.rowcount > 0
     
     async def get_user_email(self, user_id: str) -> Optional[str]:
         """Get user's email address"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             async with db.execute(
                 "SELECT email FROM users WHERE user_id = ?",
                 (user_id,)
@@ -160,18 +255,17 @@ class Database:
     async def create_alert(self, user_id: str, user_email:str,condition: AlertCondition, message: str = "") -> str:
         """Create a new alert"""
         alert_id = str(uuid.uuid4())
-        condition_json = json.dumps(asdict(condition))
+        condition_json = json.dumps(condition_to_dict(condition))
         
-        async with aiosqlite.connect(self.db_path) as db:
-            # Ensure user exists
-            await self.get_or_create_user(user_id)
-            
+        # Ensure user exists
+        await self.get_or_create_user(user_id)
+        
+        async with self._transaction() as db:
             # Create alert
             await db.execute("""
                 INSERT INTO alerts (id, user_id, user_email,condition_json, message)
                 VALUES (?, ?, ?, ?, ?)
             """, (alert_id, user_id, user_email ,condition_json, message))
-            await db.commit()
             
         print(f"✅ Created alert {alert_id[:8]} for user {user_id}")
         return alert_id
@@ -179,7 +273,7 @@ class Database:
 
     async def get_active_alerts(self) -> List[Alert]:
         """Get all active alerts"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             # ✅ UPDATED QUERY - Added JOIN to get email
             async with db.execute("""
                 SELECT a.id, a.user_id, a.condition_json, a.status, a.message, a.created_at, a.triggered_at, u.email
@@ -209,7 +303,7 @@ class Database:
     
     async def get_user_alerts(self, user_id: str) -> List[Alert]:
         """Get all alerts for a specific user"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             # ✅ UPDATED QUERY - Added JOIN to get email
             async with db.execute("""
                 SELECT a.id, a.user_id, a.condition_json, a.status, a.message, a.created_at, a.triggered_at, u.email
@@ -237,9 +331,35 @@ class Database:
             
             return alerts
     
+    async def get_alert(self, alert_id: str) -> Optional[Alert]:
+        """Get a single alert by id"""
+        async with self._connection() as db:
+            async with db.execute("""
+                SELECT a.id, a.user_id, a.condition_json, a.status, a.message, a.created_at, a.triggered_at, u.email
+                FROM alerts a
+                LEFT JOIN users u ON a.user_id = u.user_id
+                WHERE a.id = ?
+            """, (alert_id,)) as cursor:
+                row = await cursor.fetchone()
+        
+        if not row:
+            return None
+        
+        condition = AlertCondition(**json.loads(row[2]))
+        return Alert(
+            id=row[0],
+            user_id=row[1],
+            user_email=row[7] or "",
+            condition=condition,
+            status=row[3],
+            message=row[4],
+            created_at=datetime.fromisoformat(row[5]) if row[5] else datetime.now(),
+            triggered_at=datetime.fromisoformat(row[6]) if row[6] else None
+        )
+    
     async def update_alert_status(self, alert_id: str, status: str):
         """Update alert status (active, paused, triggered, expired)"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
             if status == "triggered":
                 await db.execute("""
                     UPDATE alerts 
@@ -252,35 +372,76 @@ class Database:
                     SET status = ?
                     WHERE id = ?
                 """, (status, alert_id))
-            await db.commit()
+    
+    async def record_triggers(self, triggers: List[tuple]):
+        """Mark alerts triggered and log their price snapshots in one transaction.
+
+        `triggers` is a list of (alert_id, price_data) pairs.
+        """
+        if not triggers:
+            return
+        
+        async with self._transaction() as db:
+            await db.executemany("""
+                UPDATE alerts 
+                SET status = 'triggered', triggered_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, [(alert_id,) for alert_id, _ in triggers])
+            await db.executemany("""
+                INSERT INTO alert_triggers (alert_id, price_data)
+                VALUES (?, ?)
+            """, [(alert_id, json.dumps(price_data)) for alert_id, price_data in triggers])
     
     async def delete_alert(self, alert_id: str, user_id: str) -> bool:
         """Delete an alert (only if user owns it)"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
             cursor = await db.execute("""
                 DELETE FROM alerts 
                 WHERE id = ? AND user_id = ?
             """, (alert_id, user_id))
-            await db.commit()
-            return cursor.rowcount > 0
+        return cursor.rowcount > 0
     
     async def log_price_data(self, symbol: str, price: float, timestamp: int):
         """Log price data for analytics"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._transaction() as db:
             await db.execute("""
                 INSERT INTO price_history (symbol, price, timestamp)
                 VALUES (?, ?, ?)
             """, (symbol, price, timestamp))
-            await db.commit()
     
     async def log_alert_trigger(self, alert_id: str, price_data: Dict):
-        """Log when an alert triggers"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute("""
+        """Log when an alert triggers (buffered, written in batches)"""
+        self._pending_trigger_logs.append((alert_id, json.dumps(price_data)))
+        if self._trigger_flush_task is None:
+            self._trigger_flush_task = asyncio.create_task(self._flush_alert_triggers_later())
+    
+    async def _flush_alert_triggers_later(self):
+        """Flush the buffer after a short delay, until logs stop arriving.
+
+        _trigger_flush_task stays set until the last write finishes, so
+        close() can wait for it.
+        """
+        try:
+            while self._pending_trigger_logs:
+                await asyncio.sleep(TRIGGER_LOG_FLUSH_INTERVAL)
+                try:
+                    await self.flush_alert_triggers()
+                except Exception as e:
+                    print(f"❌ Failed to write alert trigger log: {e}")
+        finally:
+            self._trigger_flush_task = None
+    
+    async def flush_alert_triggers(self):
+        """Write all buffered trigger logs with one executemany"""
+        if not self._pending_trigger_logs:
+            return
+        
+        rows, self._pending_trigger_logs = self._pending_trigger_logs, []
+        async with self._transaction() as db:
+            await db.executemany("""
                 INSERT INTO alert_triggers (alert_id, price_data)
                 VALUES (?, ?)
-            """, (alert_id, json.dumps(price_data)))
-            await db.commit()
+            """, rows)
 
 # Database instance
 db = Database()
@@ -1,12 +1,16 @@
 # main.py - Updated with GolemDB integration and modern FastAPI lifespan
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 from contextlib import asynccontextmanager
 import uvicorn
 import asyncio
+import copy
 import logging
-import json
+import os
+import sys
 from datetime import datetime
+from typing import Dict
 
 from api.alerts import router as alerts_router
 from api.prices import router as prices_router
@@ -16,10 +20,13 @@ from api.users import router as users_router
 from database import db, Database
 from services.nlp_service import nlp_service
 from config import settings
+from utils.cache import async_ttl_cache
+from utils import serialization
 
 # NEW: GolemDB imports
 from services.golemdb_service import create_tokenTalk_golem_hybrid, GolemConfig
 from services.enhanced_notification_service import create_enhanced_notification_service
+from services.shared_state import shared_state
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +37,50 @@ hybrid_db = None
 enhanced_notifications = None
 alert_engine = None
 
+def _print_startup_banner(golemdb_status: Dict):
+    """Write the startup banner to stdout in a single write"""
+    golemdb_mode = "blockchain" if not golemdb_status["golemdb"]["status"]["mock_mode"] else "mock"
+    golemdb_enabled = golemdb_status["golemdb"]["enabled"]
+    
+    lines = [
+        "",
+        "="*70,
+        "🚀 tokenTalk API with GolemDB Started Successfully!",
+        "="*70,
+        "📖 API Documentation: http://localhost:8000/docs",
+        "🥽 Health Check:      http://localhost:8000/health",
+        "💰 Price API:         http://localhost:8000/api/prices/",
+        "🚨 Alerts API:        http://localhost:8000/api/alerts/",
+        "💬 Chat API:          http://localhost:8000/api/chat/",
+        "👤 Users API:         http://localhost:8000/api/users/",
+        "🔗 GolemDB Status:    http://localhost:8000/api/golemdb/status",
+        "📊 GolemDB Analytics: http://localhost:8000/api/golemdb/analytics/{user_id}",
+        "📡 WebSocket:         ws://localhost:8000/ws?user_id=YOUR_ID",
+        "🔍 Monitoring:        http://localhost:8000/api/monitoring/services",
+        "🧪 Test Alert:        POST http://localhost:8000/api/test/trigger-fake-alert",
+        f"🔗 GolemDB: {'✅ ENABLED' if golemdb_enabled else '❌ DISABLED'} ({golemdb_mode} mode)",
+    ]
+    
+    if golemdb_enabled and golemdb_mode == "blockchain":
+        blockchain_info = golemdb_status["golemdb"]["status"].get("blockchain", {})
+        if blockchain_info:
+            lines.append(f"💎 Blockchain Address: {blockchain_info.get('address', 'N/A')}")
+            lines.append(f"💰 Balance: {blockchain_info.get('balance_eth', 0):.4f} ETH")
+    elif golemdb_enabled and golemdb_mode == "mock":
+        lines.append("💡 Mock mode active - all features work, no blockchain required!")
+    
+    if settings.has_resend_key():
+        lines.append("📧 Email Alerts:      ✅ ENABLED via Resend")
+    else:
+        lines.append("📧 Email Alerts:      ❌ Disabled (no Resend key)")
+    
+    lines.append("✨ Enhanced Features:  Personalized notifications with user insights")
+    lines.append("="*70)
+    lines.append("")
+    
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Modern FastAPI lifespan handler"""
@@ -53,6 +104,10 @@ async def lifespan(app: FastAPI):
         enhanced_notifications = create_enhanced_notification_service(hybrid_db.golem)
         logger.info("✅ Enhanced notification service initialized")
         
+        # Optional Redis shared state so alerts reach sockets held by any worker
+        await shared_state.init()
+        await shared_state.subscribe_alerts(enhanced_notifications.deliver_to_local_websockets)
+        
         # Initialize NLP service
         await nlp_service.init()
         logger.info("✅ NLP service initialized")
@@ -63,46 +118,19 @@ async def lifespan(app: FastAPI):
         # Update alert engine to use enhanced notifications
         alert_engine.notifications = enhanced_notifications
         
-        # Start alert engine in background
-        asyncio.create_task(alert_engine.start_monitoring())
-        logger.info("✅ Alert engine started with enhanced notifications")
+        # Start alert engine in background, unless alert_daemon.py runs it
+        if settings.RUN_ALERT_ENGINE:
+            asyncio.create_task(alert_engine.start_monitoring())
+            logger.info("✅ Alert engine started with enhanced notifications")
+        else:
+            logger.info("⏭️ Alert engine disabled in web process (RUN_ALERT_ENGINE=False)")
+            if not shared_state.enabled:
+                logger.warning("⚠️ RUN_ALERT_ENGINE=False without REDIS_URL - alert_daemon.py won't start "
+                               "and alert changes won't reach it")
         
         # Get GolemDB status for startup message
         golemdb_status = await hybrid_db.get_status()
-        golemdb_mode = "blockchain" if not golemdb_status["golemdb"]["status"]["mock_mode"] else "mock"
-        golemdb_enabled = golemdb_status["golemdb"]["enabled"]
-        
-        print("\n" + "="*70)
-        print("🚀 tokenTalk API with GolemDB Started Successfully!")
-        print("="*70)
-        print("📖 API Documentation: http://localhost:8000/docs")
-        print("🥽 Health Check:      http://localhost:8000/health")
-        print("💰 Price API:         http://localhost:8000/api/prices/")
-        print("🚨 Alerts API:        http://localhost:8000/api/alerts/")
-        print("💬 Chat API:          http://localhost:8000/api/chat/")
-        print("👤 Users API:         http://localhost:8000/api/users/")
-        print("🔗 GolemDB Status:    http://localhost:8000/api/golemdb/status")
-        print("📊 GolemDB Analytics: http://localhost:8000/api/golemdb/analytics/{user_id}")
-        print("📡 WebSocket:         ws://localhost:8000/ws?user_id=YOUR_ID")
-        print("🔍 Monitoring:        http://localhost:8000/api/monitoring/services")
-        print("🧪 Test Alert:        POST http://localhost:8000/api/test/trigger-fake-alert")
-        
-        print(f"🔗 GolemDB: {'✅ ENABLED' if golemdb_enabled else '❌ DISABLED'} ({golemdb_mode} mode)")
-        if golemdb_enabled and golemdb_mode == "blockchain":
-            blockchain_info = golemdb_status["golemdb"]["status"].get("blockchain", {})
-            if blockchain_info:
-                print(f"💎 Blockchain Address: {blockchain_info.get('address', 'N/A')}")
-                print(f"💰 Balance: {blockchain_info.get('balance_eth', 0):.4f} ETH")
-        elif golemdb_enabled and golemdb_mode == "mock":
-            print("💡 Mock mode active - all features work, no blockchain required!")
-        
-        if settings.has_resend_key():
-            print("📧 Email Alerts:      ✅ ENABLED via Resend")
-        else:
-            print("📧 Email Alerts:      ❌ Disabled (no Resend key)")
-            
-        print("✨ Enhanced Features:  Personalized notifications with user insights")
-        print("="*70 + "\n")
+        _print_startup_banner(golemdb_status)
         
     except Exception as e:
         logger.error(f"❌ Startup failed: {e}")
@@ -122,10 +150,22 @@ async def lifespan(app: FastAPI):
     await nlp_service.close()
     logger.info("✅ NLP service closed")
     
+    # Close the notification service's HTTP session
+    if enhanced_notifications:
+        await enhanced_notifications.close()
+    
     # Close GolemDB service
     if hybrid_db:
         await hybrid_db.close()
         logger.info("✅ GolemDB service closed")
+    
+    # Flush buffered trigger logs and close the shared SQLite connections
+    if alert_engine:
+        await alert_engine.db.close()
+    await db.close()
+    
+    # Release engine leadership and close Redis
+    await shared_state.close()
 
 app = FastAPI(
     title="tokenTalk API", 
@@ -133,7 +173,8 @@ app = FastAPI(
     description="AI-powered crypto price alerts with GolemDB blockchain integration",
     docs_url="/docs",
     redoc_url="/redoc",
-    lifespan=lifespan  # Modern lifespan handler
+    lifespan=lifespan,  # Modern lifespan handler
+    default_response_class=ORJSONResponse if serialization.ORJSON_AVAILABLE else JSONResponse
 )
 
 # Include API routers
@@ -190,6 +231,7 @@ async def root():
     }
 
 @app.get("/health")
+@async_ttl_cache(ttl=1.0)
 async def health_check():
     """Enhanced health check with GolemDB status"""
     try:
@@ -262,6 +304,10 @@ async def test_golemdb_profile(user_id: str, email: str):
         return {"success": True, "user_id": user_id, "message": "Profile synced to GolemDB"}
     return {"error": "GolemDB not initialized"}
 
+# Keepalive reply is fixed-shape - splice the timestamp into a pre-encoded frame
+PONG_PREFIX = '{"type":"pong","timestamp":"'
+PONG_SUFFIX = '"}'
+
 # WebSocket endpoint for real-time notifications
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket, user_id: str = Query(default="anonymous")):
@@ -272,7 +318,7 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str = Query(default=
     try:
         # Send welcome message with GolemDB status
         golemdb_enabled = hybrid_db.golem_enabled if hybrid_db else False
-        await websocket.send_text(json.dumps({
+        await websocket.send_text(serialization.dumps({
             "type": "connection_established",
             "message": f"Connected to tokenTalk with GolemDB as {user_id}",
             "user_id": user_id,
@@ -291,18 +337,15 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str = Query(default=
             data = await websocket.receive_text()
             
             try:
-                message = json.loads(data)
+                message = serialization.loads(data)
                 message_type = message.get("type", "unknown")
                 
                 if message_type == "ping":
-                    await websocket.send_text(json.dumps({
-                        "type": "pong",
-                        "timestamp": datetime.now().isoformat()
-                    }))
+                    await websocket.send_text(PONG_PREFIX + datetime.now().isoformat() + PONG_SUFFIX)
                 elif message_type == "get_status":
                     # Send enhanced status
                     status = await hybrid_db.get_status() if hybrid_db else {}
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_text(serialization.dumps({
                         "type": "status_response",
                         "data": {
                             "golemdb": status,
@@ -311,14 +354,14 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str = Query(default=
                         }
                     }))
                 else:
-                    await websocket.send_text(json.dumps({
+                    await websocket.send_text(serialization.dumps({
                         "type": "echo",
                         "original_message": data,
                         "timestamp": datetime.now().isoformat()
                     }))
                     
-            except json.JSONDecodeError:
-                await websocket.send_text(json.dumps({
+            except serialization.JSONDecodeError:
+                await websocket.send_text(serialization.dumps({
                     "type": "echo",
                     "message": f"Received: {data}",
                     "timestamp": datetime.now().isoformat()
@@ -335,6 +378,7 @@ async def get_alert_engine_status():
     return await alert_engine.get_monitoring_stats()
 
 @app.get("/api/monitoring/services")
+@async_ttl_cache(ttl=1.0)
 async def get_services_status():
     """Get status of all services including GolemDB"""
     try:
@@ -353,30 +397,52 @@ async def get_services_status():
         return {"error": str(e), "status": "error"}
 
 # Testing endpoints  
+_FAKE_ALERT_TEMPLATE = {
+    "alert_id": "test-alert-123",
+    "user_id": None,
+    "user_email": None,
+    "message": "Test alert triggered via API",
+    "condition": {
+        "type": "price_above",
+        "tokens": ["ETH"],
+        "threshold": 4000.0
+    },
+    "triggered_at": None,
+    "prices": {
+        "ETH": {
+            "current_price": 4050.0,
+            "formatted": "$4,050.00"
+        }
+    }
+}
+
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-flight
+_background_tasks = set()
+
+def _spawn_background(coro):
+    """Run a coroutine in the background, logging any failure"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_task_done)
+    return task
+
+def _on_background_task_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background task failed: {task.exception()}")
+
 @app.post("/api/test/trigger-fake-alert")
 async def trigger_fake_alert(user_id: str = "test_user", user_email: str = "test@email.com"):
     """Trigger a fake alert for testing enhanced notifications"""
     try:
-        fake_alert_data = {
-            "alert_id": "test-alert-123",
-            "user_id": user_id,
-            "user_email": user_email,
-            "message": "Test alert triggered via API",
-            "condition": {
-                "type": "price_above",
-                "tokens": ["ETH"],
-                "threshold": 4000.0
-            },
-            "triggered_at": datetime.now().isoformat(),
-            "prices": {
-                "ETH": {
-                    "current_price": 4050.0,
-                    "formatted": "$4,050.00"
-                }
-            }
-        }
+        # Deep copy - the notification path may mutate the nested condition/prices dicts
+        fake_alert_data = copy.deepcopy(_FAKE_ALERT_TEMPLATE)
+        fake_alert_data["user_id"] = user_id
+        fake_alert_data["user_email"] = user_email
+        fake_alert_data["triggered_at"] = datetime.now().isoformat()
         
-        await enhanced_notifications.send_alert_notification(fake_alert_data)
+        # Fire-and-forget so the endpoint returns without waiting on email/GolemDB
+        _spawn_background(enhanced_notifications.send_alert_notification(fake_alert_data))
         
         return {
             "success": True,
@@ -425,44 +491,10 @@ async def startup_event():
         # Update alert engine to use enhanced notifications
         alert_engine.notifications = enhanced_notifications
         
-        # Start alert engine in background
-        asyncio.create_task(alert_engine.start_monitoring())
-        logger.info("✅ Alert engine started with enhanced notifications")
-        
-        # Get GolemDB status for startup message
-        golemdb_status = await hybrid_db.get_status()
-        golemdb_mode = "blockchain" if not golemdb_status["golemdb"]["status"]["mock_mode"] else "mock"
-        golemdb_enabled = golemdb_status["golemdb"]["enabled"]
-        
-        print("\n" + "="*70)
-        print("🚀 tokenTalk API with GolemDB Started Successfully!")
-        print("="*70)
-        print("📖 API Documentation: http://localhost:8000/docs")
-        print("🥽 Health Check:      http://localhost:8000/health")
-        print("💰 Price API:         http://localhost:8000/api/prices/")
-        print("🚨 Alerts API:        http://localhost:8000/api/alerts/")
-        print("💬 Chat API:          http://localhost:8000/api/chat/")
-        print("👤 Users API:         http://localhost:8000/api/users/")
-        print("🔗 GolemDB Status:    http://localhost:8000/api/golemdb/status")
-        print("📊 GolemDB Analytics: http://localhost:8000/api/golemdb/analytics/{user_id}")
-        print("📡 WebSocket:         ws://localhost:8000/ws?user_id=YOUR_ID")
-        print("🔍 Monitoring:        http://localhost:8000/api/monitoring/services")
-        print("🧪 Test Alert:        POST http://localhost:8000/api/test/trigger-fake-alert")
-        
-        print(f"🔗 GolemDB: {'✅ ENABLED' if golemdb_enabled else '❌ DISABLED'} ({golemdb_mode} mode)")
-        if golemdb_enabled and golemdb_mode == "blockchain":
-            blockchain_info = golemdb_status["golemdb"]["status"].get("blockchain", {})
-            if blockchain_info:
-                print(f"💎 Blockchain Address: {blockchain_info.get('address', 'N/A')}")
-                print(f"💰 Balance: {blockchain_info.get('balance_eth', 0):.4f} ETH")
-        
-        if settings.has_resend_key():
-            print("📧 Email Alerts:      ✅ ENABLED via Resend")
-        else:
-            print("📧 Email Alerts:      ❌ Disabled (no Resend key)")
-            
-        print("✨ Enhanced Features:  Personalized notifications with user insights")
-        print("="*70 + "\n")
+        # Start alert engine in background, unless alert_daemon.py runs it
+        if settings.RUN_ALERT_ENGINE:
+            asyncio.create_task(alert_engine.start_monitoring())
+            logger.info("✅ Alert engine started with enhanced notifications")
         
     except Exception as e:
         logger.error(f"❌ Startup failed: {e}")
@@ -482,16 +514,73 @@ async def shutdown_event():
     await nlp_service.close()
     logger.info("✅ NLP service closed")
     
+    # Close the notification service's HTTP session
+    if enhanced_notifications:
+        await enhanced_notifications.close()
+    
     # Close GolemDB service
     if hybrid_db:
         await hybrid_db.close()
         logger.info("✅ GolemDB service closed")
+    
+    # Flush buffered trigger logs and close the shared SQLite connections
+    if alert_engine:
+        await alert_engine.db.close()
+    await db.close()
 
-if __name__ == "__main__":
-    uvicorn.run(
-        "main:app", 
-        host="0.0.0.0", 
-        port=8000, 
-        reload=True,
+def _pick_server_backends():
+    """Use uvloop/httptools when installed (uvicorn[standard]), else uvicorn's pure-Python defaults"""
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"  # e.g. Windows, where uvloop isn't available
+    
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
+    
+    return loop, http
+
+def _serve_single(loop: str, http: str):
+    """Run one worker via uvicorn.Server, driving uvloop through asyncio.Runner on 3.12+"""
+    config = uvicorn.Config(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop=loop,
+        http=http,
+        ws="websockets",
         log_level="info"
-    )
\ No newline at end of file
+    )
+    server = uvicorn.Server(config)
+    
+    if loop == "uvloop" and sys.version_info >= (3, 12):
+        import uvloop
+        with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+            runner.run(server.serve())
+    else:
+        server.run()
+
+if __name__ == "__main__":
+    loop, http = _pick_server_backends()
+    reload = "--reload" in sys.argv  # dev only - reload forces a single worker
+    workers = 1 if reload else int(os.environ.get("WEB_CONCURRENCY", 1))
+    
+    if workers == 1 and not reload:
+        _serve_single(loop, http)
+    else:
+        # uvicorn's supervisor handles reload and multi-process workers
+        uvicorn.run(
+            "main:app", 
+            host="0.0.0.0", 
+            port=8000, 
+            loop=loop,
+            http=http,
+            ws="websockets",
+            workers=workers,
+            reload=reload,
+            log_level="info"
+        )
@@ -2,7 +2,7 @@
 from dataclasses import dataclass
 from typing import List, Optional, Dict
 
-@dataclass
+@dataclass(slots=True)
 class AlertResponse:
     id: str
     message: str
@@ -20,7 +20,7 @@ class CreateAlertRequest:
     message: str  # Natural language: "Alert me when ETH hits $4000"
     # We'll parse this with NLP later
 
-@dataclass
+@dataclass(slots=True)
 class AlertListResponse:
     alerts: List[AlertResponse]
     total: int
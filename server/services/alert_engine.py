@@ -1,27 +1,74 @@
 # services/alert_engine.py - Real-time alert monitoring engine
 import asyncio
+import heapq
 import logging
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from typing import Dict, List, Optional
-import json
 
-from database import Database, Alert
+from database import Database, Alert, alert_to_dict, alert_from_dict
 from services.redstone_client import RedStoneClient
 # from services.notification_service import NotificationService
 from config import settings
 from services.enhanced_notification_service import EnhancedNotificationService
+from services.shared_state import shared_state
+from services.alert_evaluator import (
+    CONDITION_OPS, NO_PRICE, OP_PRICE_CHANGE, OP_RELATIVE_CHANGE, ConditionBatch
+)
+from utils.price_table import PriceTable
 
 logger = logging.getLogger(__name__)
 
+TIMEFRAME_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+# Relative distance to threshold for the fastest / slowest check cadence
+NEAR_DISTANCE = 0.01
+FAR_DISTANCE = 0.10
+
+def timeframe_to_seconds(timeframe: str) -> int:
+    """Convert an alert timeframe like "30m", "24h" or "7d" to seconds (default 24h)"""
+    try:
+        return int(timeframe[:-1]) * TIMEFRAME_UNITS[timeframe[-1].lower()]
+    except (KeyError, ValueError, IndexError, TypeError):
+        return 86400
+
 class AlertEngine:
     def __init__(self):
         self.db = Database()
         self.redstone = RedStoneClient()
         self.notifications = EnhancedNotificationService()
         self.running = False
-        self.monitoring_interval = 30  # seconds
-        self.price_cache = {}
+        self.is_leader = False
+        self.monitoring_interval = 30  # seconds - default check interval and history step
+        self.price_cache = PriceTable(history_interval=self.monitoring_interval)
         self.last_price_fetch = None
+        self.price_ttl = 10  # seconds a fetched price is reused (below min_check_interval)
+        
+        # Adaptive scheduling: alerts close to their threshold are checked at the
+        # old fixed cadence, distant ones rarely, so RedStone never sees more
+        # fetches than fixed polling. Heap of (due_at, alert_id) with lazy deletion.
+        self.min_check_interval = self.monitoring_interval  # seconds, for alerts within NEAR_DISTANCE
+        self.max_check_interval = 300  # seconds, for alerts beyond FAR_DISTANCE
+        self._schedule: List = []
+        self._next_check: Dict[str, float] = {}
+        self._inflight_prices: Dict[str, asyncio.Future] = {}
+        self._pending_price_tokens = set()
+        self._price_batch_task: Optional[asyncio.Task] = None
+        
+        # In-memory index of active alerts, held only by the running leader and kept
+        # current by the alerts API (directly, or via shared_state from other
+        # processes) so the cycle doesn't rescan SQLite; periodically reloaded
+        self.active_alerts: Dict[str, Alert] = {}
+        self.alerts_by_token: Dict[str, List[Alert]] = {}  # token -> alerts watching it
+        self.index_refresh_interval = 300  # seconds
+        self._index_loaded_at = None
+        self._index_stale = True
+        self._background_tasks = set()
+        
+        # Triggered alerts are delivered by a small pool of workers
+        self.notification_workers = 4
+        self._notify_queue: asyncio.Queue = asyncio.Queue(maxsize=1024)
+        self._notify_workers: List[asyncio.Task] = []
         self.stats = {
             "alerts_checked": 0,
             "alerts_triggered": 0,
@@ -32,12 +79,26 @@ class AlertEngine:
     async def start_monitoring(self):
         """Start the real-time monitoring loop"""
         self.running = True
-        logger.info("🚨 Alert Engine started - monitoring every %d seconds", self.monitoring_interval)
+        logger.info(
+            "🚨 Alert Engine started - checking alerts every %d-%d seconds by distance to threshold",
+            self.min_check_interval, self.max_check_interval
+        )
+        
+        # With several workers only the leader runs cycles; the rest stand by
+        await shared_state.init()
+        await shared_state.subscribe_index_changes(self.apply_index_change)
+        leader_ttl = max(60, self.monitoring_interval * 2)
         
         while self.running:
             try:
-                await self._monitoring_cycle()
-                await asyncio.sleep(self.monitoring_interval)
+                was_leader = self.is_leader
+                self.is_leader = await shared_state.acquire_leader(leader_ttl)
+                if self.is_leader and not was_leader:
+                    # Changes made while standing by went to the old leader
+                    self.mark_index_stale()
+                if self.is_leader:
+                    await self._monitoring_cycle()
+                await asyncio.sleep(self.min_check_interval)
             except Exception as e:
                 logger.error(f"Alert monitoring error: {e}")
                 self.stats["errors"] += 1
@@ -46,283 +107,499 @@ class AlertEngine:
     def stop_monitoring(self):
         """Stop the monitoring loop"""
         self.running = False
+        for worker in self._notify_workers:
+            worker.cancel()
+        self._notify_workers = []
         logger.info("🛑 Alert Engine stopped")
     
+    # Active alert index
+    async def load_active_alerts(self):
+        """(Re)load the active alert index from the database"""
+        alerts = await self.db.get_active_alerts()
+        self.active_alerts = {alert.id: alert for alert in alerts}
+        self.alerts_by_token = {}
+        for alert in alerts:
+            self._index_alert_tokens(alert)
+        
+        # Keep existing schedules, check newly seen alerts right away
+        now = time.monotonic()
+        self._next_check = {
+            alert_id: self._next_check.get(alert_id, now) for alert_id in self.active_alerts
+        }
+        self._schedule = [(due, alert_id) for alert_id, due in self._next_check.items()]
+        heapq.heapify(self._schedule)
+        self._index_loaded_at = time.monotonic()
+        self._index_stale = False
+        logger.debug(f"Loaded {len(self.active_alerts)} active alerts into the index")
+    
+    async def _ensure_alert_index(self):
+        """Reload the index when it's stale or past its refresh interval"""
+        if (
+            self._index_stale
+            or self._index_loaded_at is None
+            or time.monotonic() - self._index_loaded_at >= self.index_refresh_interval
+        ):
+            await self.load_active_alerts()
+    
+    def mark_index_stale(self):
+        """Reload the index from the database on the next cycle"""
+        self._index_stale = True
+    
+    def add_alert(self, alert: Alert):
+        """Track a newly created alert"""
+        if self._owns_index():
+            self._index_new_alert(alert)
+        else:
+            self._publish_index_change({"op": "add", "alert": alert_to_dict(alert)})
+    
+    def remove_alert(self, alert_id: str):
+        """Stop tracking a deleted alert"""
+        if self._owns_index():
+            self._drop_alert(alert_id)
+        else:
+            self._publish_index_change({"op": "remove", "alert_id": alert_id})
+    
+    def update_status(self, alert_id: str, status: str):
+        """Reflect an alert status change in the index"""
+        if self._owns_index():
+            self._apply_status(alert_id, status)
+        else:
+            self._publish_index_change({"op": "status", "alert_id": alert_id, "status": status})
+    
+    def apply_index_change(self, change: Dict):
+        """Apply an alert change published by another process"""
+        if not self._owns_index():
+            return  # Standby - the index is reloaded on taking over
+        
+        op = change.get("op")
+        if op == "add":
+            self._index_new_alert(alert_from_dict(change["alert"]))
+        elif op == "remove":
+            self._drop_alert(change["alert_id"])
+        elif op == "status":
+            self._apply_status(change["alert_id"], change["status"])
+        else:
+            self.mark_index_stale()
+    
+    def _owns_index(self) -> bool:
+        """Only the running leader keeps an index; other processes forward changes"""
+        return self.running and self.is_leader
+    
+    def _index_new_alert(self, alert: Alert):
+        if alert.status == "active":
+            self._drop_alert(alert.id)
+            self.active_alerts[alert.id] = alert
+            self._index_alert_tokens(alert)
+            self._schedule_check(alert.id, time.monotonic())
+    
+    def _apply_status(self, alert_id: str, status: str):
+        if status == "active":
+            if alert_id not in self.active_alerts:
+                # Re-activated alert - we don't hold its definition, reload next cycle
+                self.mark_index_stale()
+        else:
+            self._drop_alert(alert_id)
+    
+    def _drop_alert(self, alert_id: str):
+        alert = self.active_alerts.pop(alert_id, None)
+        self._next_check.pop(alert_id, None)  # heap entry is skipped when popped
+        if alert:
+            self._unindex_alert_tokens(alert)
+    
+    def _publish_index_change(self, change: Dict):
+        """Forward a change to the engine leader in another process (alert_daemon.py, another worker)"""
+        if shared_state.enabled:
+            self._run_in_background(shared_state.publish_index_change(change))
+    
+    def _index_alert_tokens(self, alert: Alert):
+        for token in set(alert.condition.tokens):
+            self.alerts_by_token.setdefault(token, []).append(alert)
+    
+    def _unindex_alert_tokens(self, alert: Alert):
+        for token in set(alert.condition.tokens):
+            watchers = self.alerts_by_token.get(token)
+            if not watchers:
+                continue
+            watchers[:] = [a for a in watchers if a.id != alert.id]
+            if not watchers:
+                del self.alerts_by_token[token]
+    
+    # Adaptive check schedule
+    def _schedule_check(self, alert_id: str, due_at: float):
+        self._next_check[alert_id] = due_at
+        heapq.heappush(self._schedule, (due_at, alert_id))
+    
+    def _pop_due_alerts(self, now: float) -> List[Alert]:
+        """Pop every alert whose next check is due"""
+        due = []
+        while self._schedule and self._schedule[0][0] <= now:
+            due_at, alert_id = heapq.heappop(self._schedule)
+            if self._next_check.get(alert_id) != due_at:
+                continue  # Rescheduled or removed since this entry was pushed
+            alert = self.active_alerts.get(alert_id)
+            if alert:
+                due.append(alert)
+        return due
+    
+    def _next_check_delay(self, alert: Alert) -> float:
+        """Seconds until the alert's next check, from how close it is to firing.
+
+        Threshold alerts within NEAR_DISTANCE of their threshold are checked
+        every min_check_interval, those beyond FAR_DISTANCE every
+        max_check_interval, linearly in between. Change-based alerts keep the
+        regular monitoring interval.
+        """
+        condition = alert.condition
+        if condition.condition_type not in ("price_above", "price_below") or not condition.threshold:
+            return self.monitoring_interval
+        
+        distances = [
+            abs(price - condition.threshold) / abs(condition.threshold)
+            for price in (self.price_cache.get(token) for token in condition.tokens)
+            if price is not None
+        ]
+        if not distances:
+            return self.monitoring_interval
+        
+        span = (min(distances) - NEAR_DISTANCE) / (FAR_DISTANCE - NEAR_DISTANCE)
+        span = min(max(span, 0.0), 1.0)
+        return self.min_check_interval + span * (self.max_check_interval - self.min_check_interval)
+    
+    def _run_in_background(self, coro) -> asyncio.Task:
+        """Run a coroutine without awaiting it, logging failures"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._on_background_task_done)
+        return task
+    
+    def _on_background_task_done(self, task: asyncio.Task):
+        self._background_tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Background alert engine task failed: {task.exception()}")
+    
     async def _monitoring_cycle(self):
-        """Single monitoring cycle - check all alerts"""
+        """Single monitoring cycle - check the alerts that are due"""
         cycle_start = datetime.now()
+        cycle_clock = time.monotonic()
+        due = []
+        evaluated = {}
         
         try:
-            # Get all active alerts
-            alerts = await self.db.get_active_alerts()
+            await self._ensure_alert_index()
+            due = self._pop_due_alerts(time.monotonic())
             
-            if not alerts:
-                logger.debug("No active alerts to monitor")
+            if not due:
+                logger.debug("No alerts due for a check")
                 return
             
-            # Get unique tokens from all alerts
-            tokens_needed = set()
-            for alert in alerts:
-                tokens_needed.update(alert.condition.tokens)
+            # One RedStone batch for every token the due alerts watch
+            tokens_needed = {token for alert in due for token in alert.condition.tokens}
+            updated = await self._update_price_cache(list(tokens_needed))
+            
+            # Any alert watching a freshly priced token gets evaluated for free,
+            # not just the due ones; all in one batch pass
+            evaluated = {alert.id: alert for alert in due}
+            for token in updated:
+                for alert in self.alerts_by_token.get(token, ()):
+                    evaluated[alert.id] = alert
+            
+            triggered = self._evaluate_alerts(list(evaluated.values()), updated)
             
-            # Fetch current prices
-            await self._update_price_cache(list(tokens_needed))
+            self.stats["alerts_checked"] += len(evaluated)
             
-            # Check each alert
+            # Stamp every match with one timestamp and persist all status changes +
+            # audit rows in one transaction before notifying. If the write fails the
+            # alerts stay active and are retried next cycle, with nobody notified yet.
             alerts_triggered = 0
-            for alert in alerts:
+            triggered_at = datetime.now().isoformat() if triggered else None
+            payloads = [(alert, self._alert_data(alert, triggered_at)) for alert in triggered]
+            if payloads:
+                await self.db.record_triggers([(alert.id, data["prices"]) for alert, data in payloads])
+            
+            for alert, alert_data in payloads:
                 try:
-                    if await self._evaluate_alert(alert):
-                        await self._trigger_alert(alert)
-                        alerts_triggered += 1
-                        
-                    self.stats["alerts_checked"] += 1
-                    
+                    await self._trigger_alert(alert, alert_data)
+                    alerts_triggered += 1
                 except Exception as e:
-                    logger.error(f"Error evaluating alert {alert.id[:8]}: {e}")
+                    logger.error(f"Error triggering alert {alert.id[:8]}: {e}")
                     self.stats["errors"] += 1
             
             # Update stats
-            cycle_duration = (datetime.now() - cycle_start).total_seconds()
+            cycle_duration = time.monotonic() - cycle_clock
             self.stats["last_run"] = cycle_start.isoformat()
             self.stats["alerts_triggered"] += alerts_triggered
             
-            logger.info(f"✅ Monitoring cycle: {len(alerts)} alerts checked, {alerts_triggered} triggered ({cycle_duration:.2f}s)")
+            log = logger.info if alerts_triggered else logger.debug
+            log(f"✅ Monitoring cycle: {len(evaluated)} alerts checked, {alerts_triggered} triggered ({cycle_duration:.2f}s)")
             
         except Exception as e:
             logger.error(f"Monitoring cycle failed: {e}")
             self.stats["errors"] += 1
+        finally:
+            # Reschedule everything still active by its distance to firing
+            now = time.monotonic()
+            for alert in {**{a.id: a for a in due}, **evaluated}.values():
+                if alert.id in self.active_alerts:
+                    self._schedule_check(alert.id, now + self._next_check_delay(alert))
+    
+    async def _update_price_cache(self, tokens: List[str]) -> Dict[str, float]:
+        """Update price cache for required tokens, returning their current prices.
+
+        Prices younger than price_ttl are served from the cache. Tokens already
+        being fetched share that in-flight request, and tokens requested in the
+        same event-loop tick are batched into one get_multiple_prices call.
+        """
+        now_ts = datetime.now().timestamp()
+        result = {}
+        waiting = {}
+        to_fetch = []
+        
+        for token in set(tokens):
+            updated_at = self.price_cache.updated(token)
+            if updated_at is not None and now_ts - updated_at < self.price_ttl:
+                result[token] = self.price_cache.get(token)
+            elif token in self._inflight_prices:
+                waiting[token] = self._inflight_prices[token]
+            else:
+                to_fetch.append(token)
+        
+        if to_fetch:
+            loop = asyncio.get_running_loop()
+            for token in to_fetch:
+                waiting[token] = self._inflight_prices[token] = loop.create_future()
+            self._pending_price_tokens.update(to_fetch)
+            if self._price_batch_task is None:
+                # _flush_price_batch clears _price_batch_task as it starts, so keep a strong ref elsewhere
+                self._price_batch_task = self._run_in_background(self._flush_price_batch())
+        
+        if waiting:
+            prices = await asyncio.gather(*(asyncio.shield(fut) for fut in waiting.values()))
+            for token, price in zip(waiting, prices):
+                if price is not None:
+                    result[token] = price
+        
+        return result
     
-    async def _update_price_cache(self, tokens: List[str]):
-        """Update price cache for required tokens"""
+    async def _flush_price_batch(self):
+        """Fetch every token queued during this tick in one RedStone call"""
+        await asyncio.sleep(0)  # Let callers in the same tick join the batch
+        
+        tokens = list(self._pending_price_tokens)
+        self._pending_price_tokens.clear()
+        self._price_batch_task = None
+        
         try:
             # Use multiple prices endpoint for efficiency
             prices = await self.redstone.get_multiple_prices(tokens)
             
+            now = datetime.now()
+            now_ts = now.timestamp()
+            now_ms = now_ts * 1000
+            shared_prices = {}
             for symbol, data in prices.items():
                 if not data.get("error") and data.get("price", 0) > 0:
-                    self.price_cache[symbol] = {
+                    timestamp = data.get("timestamp", now_ms)
+                    self.price_cache.set(symbol, data["price"], timestamp, now_ts)
+                    shared_prices[symbol] = {
                         "price": data["price"],
-                        "timestamp": data.get("timestamp", datetime.now().timestamp() * 1000),
-                        "updated_at": datetime.now()
+                        "timestamp": timestamp
                     }
             
-            self.last_price_fetch = datetime.now()
+            # Let the other workers see the leader's prices without refetching
+            await shared_state.store_prices(shared_prices)
+            
+            self.last_price_fetch = now
             logger.debug(f"Updated prices for {len(prices)} tokens")
             
+            for token in tokens:
+                future = self._inflight_prices.pop(token, None)
+                if future and not future.done():
+                    price = shared_prices.get(token)
+                    future.set_result(price["price"] if price else None)
+            
         except Exception as e:
             logger.error(f"Error updating price cache: {e}")
-            raise
+            for token in tokens:
+                future = self._inflight_prices.pop(token, None)
+                if future and not future.done():
+                    future.set_exception(e)
     
     async def _evaluate_alert(self, alert: Alert) -> bool:
         """Evaluate if an alert condition is met"""
-        condition = alert.condition
-        
-        try:
-            if condition.condition_type == "price_above":
-                return await self._check_price_above(alert)
-            elif condition.condition_type == "price_below":
-                return await self._check_price_below(alert)
-            elif condition.condition_type == "price_change":
-                return await self._check_price_change(alert)
-            elif condition.condition_type == "relative_change":
-                return await self._check_relative_change(alert)
-            else:
-                logger.warning(f"Unknown condition type: {condition.condition_type}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Error evaluating alert condition: {e}")
-            return False
+        return bool(self._evaluate_alerts([alert]))
     
-    async def _check_price_above(self, alert: Alert) -> bool:
-        """Check if token price is above threshold"""
-        condition = alert.condition
+    def _evaluate_alerts(self, alerts: List[Alert], prices: Optional[Dict[str, float]] = None) -> List[Alert]:
+        """Evaluate alerts in one batch, returning those whose condition is met.
+
+        Each (alert, token) pair becomes a row for services.alert_evaluator;
+        `prices` limits rows to those tokens, otherwise cached prices are used.
+        """
+        batch = ConditionBatch()
+        owners = []  # row -> (alert, token)
         
-        for token in condition.tokens:
-            if token not in self.price_cache:
-                logger.warning(f"No price data for {token}")
+        for alert in alerts:
+            condition = alert.condition
+            op = CONDITION_OPS.get(condition.condition_type)
+            if op is None:
+                logger.warning(f"Unknown condition type: {condition.condition_type}")
                 continue
-                
-            current_price = self.price_cache[token]["price"]
             
-            if current_price >= condition.threshold:
-                logger.info(f"🔔 Price alert triggered: {token} ${current_price:,.2f} >= ${condition.threshold:,.2f}")
-                return True
-        
-        return False
-    
-    async def _check_price_below(self, alert: Alert) -> bool:
-        """Check if token price is below threshold"""
-        condition = alert.condition
-        
-        for token in condition.tokens:
-            if token not in self.price_cache:
-                logger.warning(f"No price data for {token}")
+            # One malformed alert must not abort the batch for every other alert
+            try:
+                threshold = float(condition.threshold)
+                sec_threshold = 0.0
+                if op == OP_RELATIVE_CHANGE and condition.secondary_condition:
+                    sec_threshold = float(condition.secondary_condition.get("threshold", 0.03))
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Skipping alert {alert.id} with an invalid threshold: {e}")
                 continue
-                
-            current_price = self.price_cache[token]["price"]
             
-            if current_price <= condition.threshold:
-                logger.info(f"🔔 Price alert triggered: {token} ${current_price:,.2f} <= ${condition.threshold:,.2f}")
-                return True
+            hist_seconds = timeframe_to_seconds(condition.timeframe)
+            sec_price = sec_hist = NO_PRICE
+            if op == OP_RELATIVE_CHANGE and condition.secondary_condition:
+                secondary_token = condition.secondary_condition.get("token", "BTC")
+                sec_price = self.price_cache.get(secondary_token)
+                sec_hist = self.price_cache.price_ago(secondary_token, hist_seconds)
+                sec_price = NO_PRICE if sec_price is None else sec_price
+                sec_hist = NO_PRICE if sec_hist is None else sec_hist
+            
+            for token in condition.tokens:
+                price = prices.get(token) if prices is not None else self.price_cache.get(token)
+                if price is None:
+                    continue
+                
+                hist = NO_PRICE
+                if op >= OP_PRICE_CHANGE:
+                    hist = self.price_cache.price_ago(token, hist_seconds)
+                    hist = NO_PRICE if hist is None else hist
+                
+                batch.add(op, price, threshold, hist, sec_price, sec_hist, sec_threshold)
+                owners.append((alert, token))
         
-        return False
-    
-    async def _check_price_change(self, alert: Alert) -> bool:
-        """Check if token price change percentage threshold is met"""
-        condition = alert.condition
+        hits = batch.evaluate()
         
-        # For price change alerts, we need historical data
-        # For hackathon simplicity, we'll use a basic implementation
-        for token in condition.tokens:
-            if token not in self.price_cache:
+        triggered = []
+        seen = set()
+        for row, hit in enumerate(hits):
+            alert, token = owners[row]
+            if not hit or alert.id in seen:
                 continue
-            
-            # Get price from 24h ago (simplified - in production, use proper historical data)
-            current_price = self.price_cache[token]["price"]
-            
-            # For demo purposes, simulate 24h price by checking against a reference
-            # In production, you'd store historical prices in database
-            historical_price = await self._get_historical_price(token, condition.timeframe)
-            
-            if historical_price:
-                price_change = (current_price - historical_price) / historical_price
-                
-                # Check if change exceeds threshold (negative threshold for drops)
-                if condition.threshold < 0 and price_change <= condition.threshold:
-                    logger.info(f"🔔 Price drop alert: {token} dropped {abs(price_change)*100:.1f}%")
-                    return True
-                elif condition.threshold > 0 and price_change >= condition.threshold:
-                    logger.info(f"🔔 Price rise alert: {token} rose {price_change*100:.1f}%")
-                    return True
+            seen.add(alert.id)
+            triggered.append(alert)
+            self._log_condition_met(alert, token, batch.prices[row], batch.thresholds[row], batch.hist_prices[row])
         
-        return False
+        return triggered
     
-    async def _check_relative_change(self, alert: Alert) -> bool:
-        """Check complex relative change conditions"""
+    def _log_condition_met(self, alert: Alert, token: str, price: float, threshold: float, hist_price: float):
         condition = alert.condition
+        if condition.condition_type == "price_above":
+            logger.info(f"🔔 Price alert triggered: {token} ${price:,.2f} >= ${threshold:,.2f}")
+        elif condition.condition_type == "price_below":
+            logger.info(f"🔔 Price alert triggered: {token} ${price:,.2f} <= ${threshold:,.2f}")
+        elif condition.condition_type == "price_change":
+            change = (price - hist_price) / hist_price
+            direction = "dropped" if change < 0 else "rose"
+            logger.info(f"🔔 Price change alert: {token} {direction} {abs(change)*100:.1f}%")
+        else:
+            secondary_token = (condition.secondary_condition or {}).get("token", "BTC")
+            logger.info(f"🔔 Complex alert triggered: {token} drop while {secondary_token} stable")
+    
+    def _alert_data(self, alert: Alert, triggered_at: Optional[str] = None) -> Dict:
+        """Notification payload for a triggered alert, with its tokens' current prices"""
+        alert_data = {
+            "alert_id": alert.id,
+            "user_id": alert.user_id,
+            "user_email":alert.user_email,
+            "message": alert.message,
+            "condition": {
+                "type": alert.condition.condition_type,
+                "tokens": alert.condition.tokens,
+                "threshold": alert.condition.threshold
+            },
+            "triggered_at": triggered_at or datetime.now().isoformat(),
+            "prices": {}
+        }
         
-        # Check primary condition (e.g., "DeFi tokens drop 15%")
-        primary_triggered = False
-        
-        for token in condition.tokens:
-            if token not in self.price_cache:
-                continue
-                
-            # Simplified implementation for hackathon
-            current_price = self.price_cache[token]["price"]
-            historical_price = await self._get_historical_price(token, condition.timeframe)
-            
-            if historical_price:
-                price_change = (current_price - historical_price) / historical_price
-                
-                if price_change <= condition.threshold:  # Usually negative for drops
-                    primary_triggered = True
-                    break
-        
-        if not primary_triggered:
-            return False
+        # Add current prices to alert data
+        for token in alert.condition.tokens:
+            price = self.price_cache.get(token)
+            if price is not None:
+                alert_data["prices"][token] = {
+                    "current_price": price,
+                    "formatted": f"${price:,.2f}"
+                }
         
-        # Check secondary condition (e.g., "while BTC stays stable")
-        if condition.secondary_condition:
-            secondary_token = condition.secondary_condition.get("token", "BTC")
-            stability_threshold = condition.secondary_condition.get("threshold", 0.03)
-            
-            if secondary_token in self.price_cache:
-                current_price = self.price_cache[secondary_token]["price"]
-                historical_price = await self._get_historical_price(secondary_token, condition.timeframe)
-                
-                if historical_price:
-                    price_change = abs((current_price - historical_price) / historical_price)
-                    
-                    if price_change <= stability_threshold:  # BTC stayed stable
-                        logger.info(f"🔔 Complex alert triggered: DeFi drop while {secondary_token} stable")
-                        return True
-        
-        return False
+        return alert_data
     
-    async def _get_historical_price(self, token: str, timeframe: str) -> Optional[float]:
-        """Get historical price for comparison (simplified for hackathon)"""
-        # In production, this would query your database for historical prices
-        # For hackathon demo, we'll simulate with some basic logic
-        
-        if token not in self.price_cache:
-            return None
+    async def _trigger_alert(self, alert: Alert, alert_data: Dict):
+        """Trigger an alert already recorded with db.record_triggers - queue
+        notifications and stop monitoring it"""
+        # Hand off to the notification workers so email/GolemDB latency
+        # doesn't hold up the rest of the cycle
+        await self._queue_notification(alert_data)
         
-        current_price = self.price_cache[token]["price"]
+        # Stop monitoring it right away
+        self.update_status(alert.id, "triggered")
         
-        # Simulate some price volatility for demo purposes
-        # In reality, you'd have actual historical data
-        import random
-        volatility = random.uniform(0.95, 1.05)  # ±5% random historical price
-        simulated_historical = current_price * volatility
+        logger.info(f"🔔 Alert {alert.id[:8]} triggered for user {alert.user_id}")
+    
+    # Notification workers
+    async def _queue_notification(self, alert_data: Dict):
+        """Queue a triggered alert for delivery, waiting for room if the queue is full.
+
+        Never drops: the alert is about to be marked triggered, so a lost
+        notification would never be retried.
+        """
+        if not self._notify_workers:
+            self._notify_workers = [
+                asyncio.create_task(self._notify_worker()) for _ in range(self.notification_workers)
+            ]
         
-        return simulated_historical
+        if self._notify_queue.full():
+            logger.warning(f"⚠️ Notification queue full - waiting to queue alert {alert_data['alert_id'][:8]}")
+        await self._notify_queue.put(alert_data)
     
-    async def _trigger_alert(self, alert: Alert):
-        """Trigger an alert - send notifications and update status"""
-        try:
-            # Prepare alert data
-            alert_data = {
-                "alert_id": alert.id,
-                "user_id": alert.user_id,
-                "user_email":alert.user_email,
-                "message": alert.message,
-                "condition": {
-                    "type": alert.condition.condition_type,
-                    "tokens": alert.condition.tokens,
-                    "threshold": alert.condition.threshold
-                },
-                "triggered_at": datetime.now().isoformat(),
-                "prices": {}
-            }
-            
-            # Add current prices to alert data
-            for token in alert.condition.tokens:
-                if token in self.price_cache:
-                    alert_data["prices"][token] = {
-                        "current_price": self.price_cache[token]["price"],
-                        "formatted": f"${self.price_cache[token]['price']:,.2f}"
-                    }
-            
-            # Send notification
-            await self.notifications.send_alert_notification(alert_data)
-            
-            # Update alert status in database
-            await self.db.update_alert_status(alert.id, "triggered")
-            
-            # Log the alert trigger for audit
-            await self.db.log_alert_trigger(alert.id, alert_data["prices"])
-            
-            logger.info(f"🔔 Alert {alert.id[:8]} triggered for user {alert.user_id}")
-            
-        except Exception as e:
-            logger.error(f"Error triggering alert {alert.id[:8]}: {e}")
-            raise
+    async def _notify_worker(self):
+        while True:
+            alert_data = await self._notify_queue.get()
+            try:
+                await self.notifications.send_alert_notification(alert_data)
+            except Exception as e:
+                logger.error(f"Error sending notification for alert {alert_data['alert_id'][:8]}: {e}")
+                self.stats["errors"] += 1
+            finally:
+                self._notify_queue.task_done()
     
     async def get_monitoring_stats(self) -> Dict:
         """Get current monitoring statistics"""
+        cached_tokens = self.price_cache.symbols()
+        if not self.is_leader and shared_state.enabled:
+            # Standby workers report the leader's prices
+            cached_tokens = list((await shared_state.get_prices()).keys())
+        
         return {
             "running": self.running,
+            "leader": self.is_leader,
+            "worker_id": shared_state.worker_id,
             "monitoring_interval": self.monitoring_interval,
             "stats": self.stats.copy(),
-            "price_cache_size": len(self.price_cache),
+            "active_alerts": len(self.active_alerts),
+            "price_cache_size": len(cached_tokens),
             "last_price_fetch": self.last_price_fetch.isoformat() if self.last_price_fetch else None,
-            "cached_tokens": list(self.price_cache.keys())
+            "cached_tokens": cached_tokens
         }
     
     async def force_check_alert(self, alert_id: str) -> Dict:
         """Force check a specific alert (for testing)"""
         try:
-            # Get the alert
-            alerts = await self.db.get_active_alerts()
-            target_alert = None
-            
-            for alert in alerts:
-                if alert.id == alert_id:
-                    target_alert = alert
-                    break
+            # Get the alert - only the leader's index is current, elsewhere read the database
+            if self._owns_index():
+                await self._ensure_alert_index()
+                target_alert = self.active_alerts.get(alert_id)
+            else:
+                target_alert = await self.db.get_alert(alert_id)
+                if target_alert and target_alert.status != "active":
+                    target_alert = None
             
             if not target_alert:
                 return {"error": "Alert not found or not active"}
@@ -343,10 +620,12 @@ class AlertEngine:
             # Add current prices
             for token in target_alert.condition.tokens:
                 if token in self.price_cache:
-                    result["current_prices"][token] = self.price_cache[token]["price"]
+                    result["current_prices"][token] = self.price_cache.get(token)
             
             if triggered:
-                await self._trigger_alert(target_alert)
+                alert_data = self._alert_data(target_alert)
+                await self.db.record_triggers([(alert_id, alert_data["prices"])])
+                await self._trigger_alert(target_alert, alert_data)
                 result["notification_sent"] = True
             
             return result
@@ -0,0 +1,98 @@
+# services/alert_evaluator.py - Numeric batch evaluation of alert conditions
+#
+# Kept free of async, logging and Alert objects so the kernel can be JIT
+# compiled. The engine flattens alerts into one row per (alert, token).
+import math
+from array import array
+
+# Numba is optional - without it the same kernel runs as plain Python
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+OP_PRICE_ABOVE = 0
+OP_PRICE_BELOW = 1
+OP_PRICE_CHANGE = 2
+OP_RELATIVE_CHANGE = 3
+
+CONDITION_OPS = {
+    "price_above": OP_PRICE_ABOVE,
+    "price_below": OP_PRICE_BELOW,
+    "price_change": OP_PRICE_CHANGE,
+    "relative_change": OP_RELATIVE_CHANGE,
+}
+
+NO_PRICE = math.nan  # missing historical / secondary price
+
+def _evaluate_rows(ops, prices, hist_prices, thresholds,
+                   sec_prices, sec_hist_prices, sec_thresholds, out):
+    """Set out[r] = 1 where row r's condition is met.
+
+    price_change compares the change since hist_price against a signed
+    threshold (negative for drops). relative_change needs its token to
+    drop past the threshold while the secondary token moved no more than
+    sec_threshold; rows without a secondary token never match.
+    """
+    for r in range(len(ops)):
+        op = ops[r]
+        price = prices[r]
+        threshold = thresholds[r]
+        hit = False
+
+        if op == OP_PRICE_ABOVE:
+            hit = price >= threshold
+        elif op == OP_PRICE_BELOW:
+            hit = price <= threshold
+        else:
+            hist = hist_prices[r]
+            if not math.isnan(hist) and hist != 0.0:
+                change = (price - hist) / hist
+                if op == OP_PRICE_CHANGE:
+                    hit = (threshold < 0 and change <= threshold) or (threshold > 0 and change >= threshold)
+                elif change <= threshold:
+                    sec_hist = sec_hist_prices[r]
+                    if not math.isnan(sec_hist) and sec_hist != 0.0 and not math.isnan(sec_prices[r]):
+                        hit = abs((sec_prices[r] - sec_hist) / sec_hist) <= sec_thresholds[r]
+
+        out[r] = 1 if hit else 0
+
+if NUMBA_AVAILABLE:
+    _evaluate_rows = njit(cache=True)(_evaluate_rows)
+
+class ConditionBatch:
+    """Row-oriented buffers for one evaluation pass"""
+
+    __slots__ = ("ops", "prices", "hist_prices", "thresholds",
+                 "sec_prices", "sec_hist_prices", "sec_thresholds")
+
+    def __init__(self):
+        self.ops = array("b")
+        self.prices = array("d")
+        self.hist_prices = array("d")
+        self.thresholds = array("d")
+        self.sec_prices = array("d")
+        self.sec_hist_prices = array("d")
+        self.sec_thresholds = array("d")
+
+    def add(self, op: int, price: float, threshold: float, hist_price: float = NO_PRICE,
+            sec_price: float = NO_PRICE, sec_hist_price: float = NO_PRICE, sec_threshold: float = 0.0):
+        self.ops.append(op)
+        self.prices.append(price)
+        self.thresholds.append(threshold)
+        self.hist_prices.append(hist_price)
+        self.sec_prices.append(sec_price)
+        self.sec_hist_prices.append(sec_hist_price)
+        self.sec_thresholds.append(sec_threshold)
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def evaluate(self) -> array:
+        """Evaluate every row, returning a 0/1 array aligned with the rows"""
+        out = array("b", bytes(len(self.ops)))
+        if self.ops:
+            _evaluate_rows(self.ops, self.prices, self.hist_prices, self.thresholds,
+                           self.sec_prices, self.sec_hist_prices, self.sec_thresholds, out)
+        return out
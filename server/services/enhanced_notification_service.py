@@ -1,63 +1,178 @@
 # services/enhanced_notification_service.py - GolemDB-powered notifications
 import asyncio
 import logging
-from typing import Dict, List, Optional
-from datetime import datetime, timedelta
-import json
+import sys
+import aiohttp
+from collections import Counter, deque
+from starlette.websockets import WebSocketDisconnect
+from itertools import islice
+from typing import Dict, List, Optional, Set
+from datetime import datetime
+from html import escape
+from string import Template
 
 from config import settings
+from database import db
 from services.golemdb_service import TokenTalkGolemService
+from services.shared_state import shared_state
+from utils import serialization
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+INSIGHTS_TTL = 30 * 60  # seconds
+SUMMARY_TTL = 24 * 60 * 60  # how long a summary can be reused for unchanged history
+GOLEM_LOG_BATCH_SIZE = 64  # notification events per GolemDB write
+GOLEM_LOG_QUEUE_SIZE = 4096
+
+# Send failures that mean the client is gone (uvicorn's ClientDisconnected is an OSError)
+WEBSOCKET_GONE_ERRORS = (WebSocketDisconnect, RuntimeError, OSError)
+
+# Basic alert text by condition type: (title, message)
+ALERT_TEMPLATES = {
+    "price_above": (
+        "🔥 Price Alert: {tokens} Above Target!",
+        "{tokens} has reached {threshold}!\n\nCurrent prices: {prices}"
+    ),
+    "price_below": (
+        "📉 Price Alert: {tokens} Below Target!",
+        "{tokens} has dropped to {threshold}!\n\nCurrent prices: {prices}"
+    ),
+}
+DEFAULT_ALERT_TEMPLATE = (
+    "🚨 Alert Triggered!",
+    "Alert condition met for {tokens}\n\nCurrent prices: {prices}"
+)
+
+# Email templates - built once; user-supplied values are HTML-escaped on substitution
+EMAIL_BADGES = {
+    "expert": '<span style="background: #28a745; color: white; padding: 3px 8px; border-radius: 3px; font-size: 12px;">🎯 Expert Trader</span>',
+    "learning": '<span style="background: #ffc107; color: black; padding: 3px 8px; border-radius: 3px; font-size: 12px;">📈 Learning Mode</span>',
+}
+
+EMAIL_INSIGHTS_TEMPLATE = Template("""
+            <div class="insights" style="background-color: #f0f8ff; padding: 15px; border-radius: 5px; margin: 15px 0;">
+                <h3 style="color: #2c3e50;">📊 Your tokenTalk Insights</h3>
+                <ul style="margin: 10px 0;">
+                    <li><strong>Total Alerts Created:</strong> $total_alerts</li>
+                    <li><strong>Success Rate:</strong> $success_pct</li>
+                    $favorites_html
+                </ul>
+                <p style="font-size: 12px; color: #666;">
+                    💎 Your data is stored securely on GolemDB blockchain for cross-platform access.
+                </p>
+            </div>
+            """)
+
+EMAIL_TEMPLATE = Template("""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <title>tokenTalk Alert</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5;">
+            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 8px 8px 0 0; text-align: center;">
+                    <h1>🪨 tokenTalk</h1>
+                    <h2>$title</h2>
+                    $badge_html
+                </div>
+                <div style="padding: 20px;">
+                    <p>Your personalized crypto price alert has been triggered!</p>
+                    <p><strong>Alert Message:</strong> $message</p>
+                    
+                    <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 15px 0;">
+                        <h3>💰 Current Prices:</h3>
+                        <ul>$prices_html</ul>
+                    </div>
+                    
+                    $insights_html
+                    
+                    <p><strong>Triggered at:</strong> $triggered_at</p>
+                    <p>Stay ahead of the market with tokenTalk's AI-powered alerts! 🚀</p>
+                </div>
+                <div style="text-align: center; color: #666; font-size: 12px; padding-top: 20px; border-top: 1px solid #eee;">
+                    <p>This alert was sent by tokenTalk - AI-powered crypto alerts with blockchain-secured insights</p>
+                    <p>Powered by RedStone oracles • GolemDB blockchain • Delivered via Resend</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """)
+
 class EnhancedNotificationService:
     """Notification service enhanced with GolemDB insights"""
     
     def __init__(self, golem_service: Optional[TokenTalkGolemService] = None):
         self.golem_service = golem_service
-        self.notifications = []
-        self.user_connections = {}
+        self.notifications = deque(maxlen=settings.NOTIFICATION_BUFFER)
+        self.user_notifications: Dict[str, deque] = {}  # user_id -> recent notifications
+        self._next_id = 0
+        self.user_connections: Dict[str, Set] = {}  # user_id -> websockets
+        self._connection_users: Dict = {}  # websocket -> user_id, for removal without a user_id
         self.email_stats = {"sent": 0, "failed": 0, "last_sent": None}
+        self.session: Optional[aiohttp.ClientSession] = None  # pooled connections to Resend
+        self._golem_log_queue: asyncio.Queue = asyncio.Queue(maxsize=GOLEM_LOG_QUEUE_SIZE)
+        self._golem_log_task: Optional[asyncio.Task] = None
+        self._golem_log_write: Optional[asyncio.Task] = None  # the worker's current batch write
         
         # Enhanced features
-        self.user_insights = {}
+        self.user_insights = TTLCache(maxsize=10_000, ttl=INSIGHTS_TTL)
+        self._analytics_summaries = TTLCache(maxsize=10_000, ttl=SUMMARY_TTL)  # user_id -> (fingerprint, insights)
         self.notification_preferences = {}
     
     async def send_alert_notification(self, alert_data: Dict):
         """Enhanced alert notification with GolemDB insights"""
         try:
             user_id = alert_data["user_id"]
+            now = datetime.now()
             
-            # Get user insights from GolemDB
-            insights = await self._get_user_insights(user_id)
-            
-            # Personalize notification based on insights
-            notification = await self._create_personalized_notification(alert_data, insights)
+            if self.golem_service:
+                # Get user insights from GolemDB and personalize with them
+                insights = await self._get_user_insights(user_id)
+                notification = await self._create_personalized_notification(alert_data, insights)
+            else:
+                insights = {"source": "none"}
+                notification = self._format_basic_alert_notification(alert_data)
+                notification["personalization"] = {}
             
             # Store notification with enhanced data
             enhanced_notification = {
-                "id": len(self.notifications) + 1,
+                "id": self._next_id + 1,
                 "alert_id": alert_data["alert_id"],
                 "user_id": user_id,
                 "user_email": alert_data["user_email"],
                 "message": notification["message"],
                 "type": "alert_triggered",
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now.isoformat(),
                 "data": alert_data,
                 "insights": insights,
                 "personalization": notification.get("personalization", {})
             }
             
+            self._next_id += 1
             self.notifications.append(enhanced_notification)
+            user_buffer = self.user_notifications.get(user_id)
+            if user_buffer is None:
+                user_buffer = self.user_notifications[user_id] = deque(maxlen=settings.USER_NOTIFICATION_BUFFER)
+            user_buffer.append(enhanced_notification)
+            
+            # Send via all channels concurrently - a slow email doesn't hold up the
+            # websocket push, and one failing channel doesn't cancel the others
+            channels = {
+                "websocket": self._send_to_user_websockets(user_id, notification),
+                "email": self._send_enhanced_email(alert_data, notification, insights),
+                "console": self._send_console_notification(notification, now),
+            }
             
-            # Send via multiple channels
-            await self._send_to_user_websockets(user_id, notification)
-            await self._send_enhanced_email(alert_data, notification, insights)
-            await self._send_console_notification(notification)
+            # Log to GolemDB for cross-platform sync (queued, written in batches)
+            self._log_notification_to_golemdb(enhanced_notification)
             
-            # Log to GolemDB for cross-platform sync
-            if self.golem_service:
-                await self._log_notification_to_golemdb(enhanced_notification)
+            results = await asyncio.gather(*channels.values(), return_exceptions=True)
+            for channel, result in zip(channels, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Notification channel {channel} failed: {result}")
             
             logger.info(f"📨 Enhanced notification sent for alert {alert_data['alert_id'][:8]}")
             
@@ -70,26 +185,25 @@ class EnhancedNotificationService:
         if not self.golem_service:
             return {"source": "none"}
         
+        cached = self.user_insights.get(user_id)
+        if cached is not None:
+            return cached
+        
         try:
             # Get user analytics from GolemDB
             analytics = await self.golem_service.get_user_analytics(user_id)
             
-            insights = {
-                "source": "golemdb",
-                "total_alerts": len([a for a in analytics if a.get("type") == "alert_config"]),
-                "total_triggers": len([a for a in analytics if a.get("event_type") == "alert_triggered"]),
-                "favorite_tokens": self._extract_favorite_tokens(analytics),
-                "alert_frequency": self._calculate_alert_frequency(analytics),
-                "success_rate": self._calculate_success_rate(analytics),
-                "last_activity": self._get_last_activity(analytics)
-            }
+            # Skip re-summarizing when the history hasn't changed since last time
+            fingerprint = self._analytics_fingerprint(analytics)
+            summary = self._analytics_summaries.get(user_id)
+            if summary is not None and summary[0] == fingerprint:
+                insights = summary[1]
+            else:
+                insights = self._summarize_analytics(analytics)
+                self._analytics_summaries.set(user_id, (fingerprint, insights))
             
             # Cache insights for performance
-            self.user_insights[user_id] = {
-                "data": insights,
-                "cached_at": datetime.now(),
-                "expires_at": datetime.now() + timedelta(minutes=30)
-            }
+            self.user_insights.set(user_id, insights)
             
             return insights
             
@@ -97,44 +211,74 @@ class EnhancedNotificationService:
             logger.debug(f"Error getting user insights: {e}")
             return {"source": "error", "error": str(e)}
     
-    def _extract_favorite_tokens(self, analytics: List[Dict]) -> List[str]:
-        """Extract user's favorite tokens from their history"""
-        token_counts = {}
+    @staticmethod
+    def _analytics_fingerprint(analytics: List[Dict]) -> tuple:
+        """Cheap change detector for a user's history: size and newest event"""
+        if not analytics:
+            return (0, None)
+        last = analytics[-1]
+        return (len(analytics), last.get("created_at") or last.get("timestamp"))
+    
+    def _summarize_analytics(self, analytics: List[Dict]) -> Dict:
+        """Build the insights dict from the user's GolemDB history in one pass"""
+        token_counts = Counter()
+        first_config = last_config = None
+        dated_configs = 0
+        total_alerts = 0
+        total_triggers = 0
+        last_activity = None
         
         for event in analytics:
             if event.get("type") == "alert_config":
-                condition = event.get("condition", {})
-                tokens = condition.get("tokens", [])
-                for token in tokens:
-                    token_counts[token] = token_counts.get(token, 0) + 1
-        
-        # Return top 3 most watched tokens
-        sorted_tokens = sorted(token_counts.items(), key=lambda x: x[1], reverse=True)
-        return [token for token, count in sorted_tokens[:3]]
+                total_alerts += 1
+                token_counts.update(event.get("condition", {}).get("tokens", ()))
+                created_at = event.get("created_at")
+                if created_at:
+                    dated_configs += 1
+                    if first_config is None or created_at < first_config:
+                        first_config = created_at
+                    if last_config is None or created_at > last_config:
+                        last_config = created_at
+            elif event.get("event_type") == "alert_triggered":
+                total_triggers += 1
+            
+            # ISO-8601 strings compare chronologically
+            timestamp = event.get("created_at") or event.get("timestamp")
+            if timestamp and (last_activity is None or timestamp > last_activity):
+                last_activity = timestamp
+        
+        # Top 3 most watched tokens
+        favorite_tokens = [token for token, _ in token_counts.most_common(3)]
+        success_rate = min(total_triggers / total_alerts, 1.0) if total_alerts else 0.0  # Cap at 100%
+        
+        return {
+            "source": "golemdb",
+            "total_alerts": total_alerts,
+            "total_triggers": total_triggers,
+            "favorite_tokens": favorite_tokens,
+            "alert_frequency": self._calculate_alert_frequency(total_alerts, dated_configs, first_config, last_config),
+            "success_rate": success_rate,
+            "last_activity": last_activity,
+            # Preformatted for the notification message and email
+            "success_pct": f"{success_rate*100:.0f}%",
+            "favorite_tokens_text": ", ".join(favorite_tokens)
+        }
     
-    def _calculate_alert_frequency(self, analytics: List[Dict]) -> str:
+    def _calculate_alert_frequency(self, total_alerts: int, dated_configs: int,
+                                   first_config: Optional[str], last_config: Optional[str]) -> str:
         """Calculate how often user creates alerts"""
-        alert_configs = [a for a in analytics if a.get("type") == "alert_config"]
-        
-        if len(alert_configs) < 2:
+        if total_alerts < 2:
             return "new_user"
         
-        # Calculate average days between alerts
-        dates = []
-        for config in alert_configs:
-            try:
-                created_at = datetime.fromisoformat(config.get("created_at", ""))
-                dates.append(created_at)
-            except:
-                continue
-        
-        if len(dates) < 2:
+        if dated_configs < 2:
             return "unknown"
         
-        dates.sort()
-        avg_days = sum(
-            (dates[i] - dates[i-1]).days for i in range(1, len(dates))
-        ) / (len(dates) - 1)
+        # Average days between alerts
+        try:
+            span = datetime.fromisoformat(last_config) - datetime.fromisoformat(first_config)
+        except (TypeError, ValueError):
+            return "unknown"
+        avg_days = span.days / (dated_configs - 1)
         
         if avg_days < 1:
             return "very_active"
@@ -145,39 +289,18 @@ class EnhancedNotificationService:
         else:
             return "occasional"
     
-    def _calculate_success_rate(self, analytics: List[Dict]) -> float:
-        """Calculate alert success rate (triggered vs created)"""
-        alerts_created = len([a for a in analytics if a.get("type") == "alert_config"])
-        alerts_triggered = len([a for a in analytics if a.get("event_type") == "alert_triggered"])
-        
-        if alerts_created == 0:
-            return 0.0
-        
-        return min(alerts_triggered / alerts_created, 1.0)  # Cap at 100%
-    
-    def _get_last_activity(self, analytics: List[Dict]) -> Optional[str]:
-        """Get user's last activity timestamp"""
-        if not analytics:
-            return None
-        
-        latest_event = max(
-            analytics,
-            key=lambda x: x.get("created_at", x.get("timestamp", "1970-01-01")),
-            default=None
-        )
-        
-        return latest_event.get("created_at", latest_event.get("timestamp")) if latest_event else None
-    
     async def _create_personalized_notification(self, alert_data: Dict, insights: Dict) -> Dict:
         """Create personalized notification based on user insights"""
         condition = alert_data["condition"]
-        prices = alert_data["prices"]
         
         # Base notification
         notification = self._format_basic_alert_notification(alert_data)
         
         # Add personalization based on insights
         personalization = {}
+        if insights.get("source") != "golemdb":
+            notification["personalization"] = personalization
+            return notification
         
         # Frequency-based personalization
         frequency = insights.get("alert_frequency", "unknown")
@@ -203,15 +326,14 @@ class EnhancedNotificationService:
         success_rate = insights.get("success_rate", 0)
         if success_rate > 0.8:
             personalization["user_type"] = "expert"
-            notification["message"] += f"\n\n🎯 Great timing! Your alerts have a {success_rate*100:.0f}% success rate."
+            notification["message"] += f"\n\n🎯 Great timing! Your alerts have a {insights['success_pct']} success rate."
         elif success_rate < 0.2 and insights.get("total_alerts", 0) > 3:
             personalization["user_type"] = "learning"
             notification["message"] += "\n\n📈 Consider adjusting your thresholds for better results."
         
         # Add current portfolio context if available
-        if len(favorite_tokens) > 0:
-            portfolio_context = f"\n\n📊 Your watched tokens: {', '.join(favorite_tokens)}"
-            notification["message"] += portfolio_context
+        if favorite_tokens:
+            notification["message"] += f"\n\n📊 Your watched tokens: {insights['favorite_tokens_text']}"
         
         notification["personalization"] = personalization
         return notification
@@ -219,22 +341,19 @@ class EnhancedNotificationService:
     def _format_basic_alert_notification(self, alert_data: Dict) -> Dict:
         """Basic alert formatting (from your existing code)"""
         condition = alert_data["condition"]
-        prices = alert_data["prices"]
-        
-        price_messages = []
-        for token, price_data in prices.items():
-            price_messages.append(f"{token}: {price_data['formatted']}")
-        price_text = ", ".join(price_messages)
-        
-        if condition["type"] == "price_above":
-            title = f"🔥 Price Alert: {', '.join(condition['tokens'])} Above Target!"
-            message = f"{', '.join(condition['tokens'])} has reached ${condition['threshold']:,.2f}!\n\nCurrent prices: {price_text}"
-        elif condition["type"] == "price_below":
-            title = f"📉 Price Alert: {', '.join(condition['tokens'])} Below Target!"
-            message = f"{', '.join(condition['tokens'])} has dropped to ${condition['threshold']:,.2f}!\n\nCurrent prices: {price_text}"
+        template = ALERT_TEMPLATES.get(condition["type"])
+        
+        fields = {
+            "tokens": ", ".join(condition["tokens"]),
+            "prices": ", ".join(f"{token}: {price_data['formatted']}" for token, price_data in alert_data["prices"].items()),
+        }
+        if template is None:
+            template = DEFAULT_ALERT_TEMPLATE
         else:
-            title = f"🚨 Alert Triggered!"
-            message = f"Alert condition met for {', '.join(condition['tokens'])}\n\nCurrent prices: {price_text}"
+            fields["threshold"] = f"${condition['threshold']:,.2f}"
+        
+        title = template[0].format(**fields)
+        message = template[1].format(**fields)
         
         return {"title": title, "message": message, "type": "alert", "priority": "high"}
     
@@ -244,17 +363,13 @@ class EnhancedNotificationService:
             return
         
         try:
-            from database import db
             # user_email = await db.get_user_email(alert_data["user_email"])
-            logger.info("user data :{", alert_data,"}")
+            logger.debug(f"user data: {alert_data}")
             user_email = await db.get_user_email(alert_data["user_id"])
-            logger.info("the email is being sent to: ", user_email)
+            logger.info(f"the email is being sent to: {user_email}")
             if not user_email:
                 return
             
-            import resend
-            resend.api_key = settings.RESEND_API_KEY
-            
             # Create enhanced HTML email
             html_content = self._create_enhanced_email_html(notification, alert_data, insights)
             
@@ -266,7 +381,7 @@ class EnhancedNotificationService:
                 "text": notification["message"]
             }
             
-            response = resend.Emails.send(params)
+            await self._post_resend_email(params)
             
             self.email_stats["sent"] += 1
             self.email_stats["last_sent"] = datetime.now().isoformat()
@@ -277,90 +392,88 @@ class EnhancedNotificationService:
             logger.error(f"Failed to send enhanced email: {e}")
             self.email_stats["failed"] += 1
     
+    async def _post_resend_email(self, params: Dict) -> Dict:
+        """Send through the Resend REST API on a shared, non-blocking session"""
+        if not self.session:
+            self.session = aiohttp.ClientSession(
+                headers={"Authorization": f"Bearer {settings.RESEND_API_KEY}"},
+                timeout=aiohttp.ClientTimeout(total=15)
+            )
+        
+        async with self.session.post(settings.RESEND_API_URL, json=params) as response:
+            if response.status >= 400:
+                raise RuntimeError(f"Resend API error {response.status}: {await response.text()}")
+            return await response.json()
+    
+    async def close(self):
+        """Stop the GolemDB log worker, flushing queued events, and close the Resend HTTP session"""
+        if self._golem_log_task:
+            self._golem_log_task.cancel()
+            self._golem_log_task = None
+            
+            # Cancelling the worker doesn't cancel its write - let that finish
+            # (re-sending its batch could log events twice), then flush the backlog
+            if self._golem_log_write:
+                try:
+                    await self._golem_log_write
+                except Exception as e:
+                    logger.error(f"Error logging notifications to GolemDB: {e}")
+                self._golem_log_write = None
+            
+            pending = []
+            while not self._golem_log_queue.empty():
+                pending.append(self._golem_log_queue.get_nowait())
+            if pending:
+                await self.golem_service.log_events_batch(pending)
+        
+        if self.session:
+            await self.session.close()
+            self.session = None
+    
     def _create_enhanced_email_html(self, notification: Dict, alert_data: Dict, insights: Dict) -> str:
         """Create enhanced HTML email with insights"""
-        prices_html = ""
-        for token, price_data in alert_data.get("prices", {}).items():
-            prices_html += f"<li><strong>{token}:</strong> {price_data['formatted']}</li>"
+        prices_html = "".join(
+            f"<li><strong>{escape(token)}:</strong> {escape(price_data['formatted'])}</li>"
+            for token, price_data in alert_data.get("prices", {}).items()
+        )
         
         # Add insights section
         insights_html = ""
         if insights.get("source") == "golemdb":
-            favorite_tokens = insights.get("favorite_tokens", [])
-            success_rate = insights.get("success_rate", 0)
-            total_alerts = insights.get("total_alerts", 0)
-            
-            insights_html = f"""
-            <div class="insights" style="background-color: #f0f8ff; padding: 15px; border-radius: 5px; margin: 15px 0;">
-                <h3 style="color: #2c3e50;">📊 Your tokenTalk Insights</h3>
-                <ul style="margin: 10px 0;">
-                    <li><strong>Total Alerts Created:</strong> {total_alerts}</li>
-                    <li><strong>Success Rate:</strong> {success_rate*100:.0f}%</li>
-                    {f'<li><strong>Favorite Tokens:</strong> {", ".join(favorite_tokens)}</li>' if favorite_tokens else ''}
-                </ul>
-                <p style="font-size: 12px; color: #666;">
-                    💎 Your data is stored securely on GolemDB blockchain for cross-platform access.
-                </p>
-            </div>
-            """
+            favorite_tokens_text = insights.get("favorite_tokens_text", "")
+            insights_html = EMAIL_INSIGHTS_TEMPLATE.substitute(
+                total_alerts=insights.get("total_alerts", 0),
+                success_pct=insights.get("success_pct", "0%"),
+                favorites_html=(
+                    f"<li><strong>Favorite Tokens:</strong> {escape(favorite_tokens_text)}</li>"
+                    if favorite_tokens_text else ""
+                )
+            )
         
         # Personalization badge
-        personalization = notification.get("personalization", {})
-        user_type = personalization.get("user_type", "")
-        badge_html = ""
-        
-        if user_type == "expert":
-            badge_html = '<span style="background: #28a745; color: white; padding: 3px 8px; border-radius: 3px; font-size: 12px;">🎯 Expert Trader</span>'
-        elif user_type == "learning":
-            badge_html = '<span style="background: #ffc107; color: black; padding: 3px 8px; border-radius: 3px; font-size: 12px;">📈 Learning Mode</span>'
-        
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>tokenTalk Alert</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 8px 8px 0 0; text-align: center;">
-                    <h1>🪨 tokenTalk</h1>
-                    <h2>{notification["title"]}</h2>
-                    {badge_html}
-                </div>
-                <div style="padding: 20px;">
-                    <p>Your personalized crypto price alert has been triggered!</p>
-                    <p><strong>Alert Message:</strong> {alert_data.get("message", "Price alert triggered")}</p>
-                    
-                    <div style="background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 15px 0;">
-                        <h3>💰 Current Prices:</h3>
-                        <ul>{prices_html}</ul>
-                    </div>
-                    
-                    {insights_html}
-                    
-                    <p><strong>Triggered at:</strong> {alert_data.get("triggered_at", datetime.now().isoformat())}</p>
-                    <p>Stay ahead of the market with tokenTalk's AI-powered alerts! 🚀</p>
-                </div>
-                <div style="text-align: center; color: #666; font-size: 12px; padding-top: 20px; border-top: 1px solid #eee;">
-                    <p>This alert was sent by tokenTalk - AI-powered crypto alerts with blockchain-secured insights</p>
-                    <p>Powered by RedStone oracles • GolemDB blockchain • Delivered via Resend</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        user_type = notification.get("personalization", {}).get("user_type", "")
+        
+        return EMAIL_TEMPLATE.substitute(
+            title=escape(notification["title"]),
+            badge_html=EMAIL_BADGES.get(user_type, ""),
+            message=escape(alert_data.get("message", "Price alert triggered")),
+            prices_html=prices_html,
+            insights_html=insights_html,
+            triggered_at=escape(alert_data.get("triggered_at") or datetime.now().isoformat())
+        )
     
-    async def _log_notification_to_golemdb(self, notification: Dict):
-        """Log notification to GolemDB for cross-platform sync"""
+    def _log_notification_to_golemdb(self, notification: Dict):
+        """Queue a notification event for the GolemDB log worker"""
         if not self.golem_service:
             return
         
+        if self._golem_log_task is None:
+            self._golem_log_task = asyncio.create_task(self._golem_log_worker())
+        
         try:
-            # Store notification event
-            await self.golem_service.log_event(
-                event_type="notification_sent",
-                event_data={
+            self._golem_log_queue.put_nowait({
+                "event_type": "notification_sent",
+                "event_data": {
                     "notification_id": notification["id"],
                     "user_id": notification["user_id"],
                     "alert_id": notification["alert_id"],
@@ -368,86 +481,119 @@ class EnhancedNotificationService:
                     "personalization": notification.get("personalization", {}),
                     "channels": ["websocket", "email", "console"]
                 },
-                user_id=notification["user_id"]
-            )
-            
-            logger.debug(f"📝 Notification logged to GolemDB: {notification['id']}")
+                "user_id": notification["user_id"]
+            })
+        except asyncio.QueueFull:
+            logger.debug(f"GolemDB log queue full - dropped notification {notification['id']}")
+    
+    async def _golem_log_worker(self):
+        """Write queued notification events to GolemDB, up to a batch per call"""
+        while True:
+            batch = [await self._golem_log_queue.get()]
+            while len(batch) < GOLEM_LOG_BATCH_SIZE and not self._golem_log_queue.empty():
+                batch.append(self._golem_log_queue.get_nowait())
             
-        except Exception as e:
-            logger.debug(f"Failed to log notification to GolemDB: {e}")
+            # Shielded so close() can cancel the worker without interrupting a write
+            self._golem_log_write = asyncio.ensure_future(self.golem_service.log_events_batch(batch))
+            try:
+                if await asyncio.shield(self._golem_log_write):
+                    logger.debug(f"📝 Logged {len(batch)} notifications to GolemDB")
+                else:
+                    logger.debug(f"Failed to log {len(batch)} notifications to GolemDB")
+            except Exception as e:
+                # Keep the worker alive - one bad batch shouldn't stop all later logging
+                logger.error(f"Error logging {len(batch)} notifications to GolemDB: {e}")
+            self._golem_log_write = None
     
     async def _send_to_user_websockets(self, user_id: str, notification: Dict):
         """Send to WebSocket connections (from your existing code)"""
-        user_websockets = self.user_connections.get(user_id, [])
+        # With shared state, the worker holding the user's socket may be a different process
+        if await shared_state.publish_alert(user_id, notification):
+            return
+        
+        await self.deliver_to_local_websockets(user_id, notification)
+    
+    async def deliver_to_local_websockets(self, user_id: str, notification: Dict):
+        """Send to WebSocket connections held by this worker"""
+        user_websockets = self.user_connections.get(user_id)
         
         if not user_websockets:
             return
             
-        active_connections = []
-        for websocket in user_websockets:
-            try:
-                await websocket.send_text(json.dumps({
-                    "type": "enhanced_alert_notification",
-                    "data": notification
-                }))
-                active_connections.append(websocket)
-            except:
-                pass
-        
-        self.user_connections[user_id] = active_connections
+        # Encode once and fan out concurrently; disconnected sockets are dropped
+        payload = serialization.dumps({
+            "type": "enhanced_alert_notification",
+            "data": notification
+        })
+        targets = list(user_websockets)
+        results = await asyncio.gather(
+            *(websocket.send_text(payload) for websocket in targets),
+            return_exceptions=True
+        )
+        
+        unexpected = None
+        for websocket, result in zip(targets, results):
+            if isinstance(result, WEBSOCKET_GONE_ERRORS):
+                self.remove_websocket_connection(websocket, user_id)
+            elif isinstance(result, Exception) and unexpected is None:
+                unexpected = result
+        
+        if unexpected is not None:
+            raise unexpected
     
-    async def _send_console_notification(self, notification: Dict):
+    async def _send_console_notification(self, notification: Dict, now: Optional[datetime] = None):
         """Enhanced console notification"""
         personalization = notification.get("personalization", {})
         user_type = personalization.get("user_type", "")
         
-        print(f"\n{'='*60}")
-        print(f"🚨 ENHANCED ALERT TRIGGERED! {f'({user_type})' if user_type else ''}")
-        print(f"{'='*60}")
-        print(f"Title: {notification['title']}")
-        print(f"Message: {notification['message']}")
+        rule = "=" * 60
+        lines = [
+            "",
+            rule,
+            f"🚨 ENHANCED ALERT TRIGGERED! {f'({user_type})' if user_type else ''}",
+            rule,
+            f"Title: {notification['title']}",
+            f"Message: {notification['message']}",
+        ]
         if personalization:
-            print(f"Personalization: {personalization}")
-        print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"{'='*60}\n")
+            lines.append(f"Personalization: {personalization}")
+        lines.append(f"Time: {(now or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')}")
+        lines.append(rule)
+        
+        # One write instead of a print per line
+        sys.stdout.write("\n".join(lines) + "\n\n")
     
     # Keep existing methods for compatibility
     def add_websocket_connection(self, websocket, user_id: str = "anonymous"):
         """Add WebSocket connection"""
-        if user_id not in self.user_connections:
-            self.user_connections[user_id] = []
-        self.user_connections[user_id].append(websocket)
+        self.user_connections.setdefault(user_id, set()).add(websocket)
+        self._connection_users[websocket] = user_id
     
     def remove_websocket_connection(self, websocket, user_id: str = None):
         """Remove WebSocket connection"""
-        if user_id and user_id in self.user_connections:
-            if websocket in self.user_connections[user_id]:
-                self.user_connections[user_id].remove(websocket)
-        else:
-            for uid, connections in list(self.user_connections.items()):
-                if websocket in connections:
-                    connections.remove(websocket)
-                    break
+        user_id = self._connection_users.pop(websocket, user_id)
+        connections = self.user_connections.get(user_id)
+        if connections is None:
+            return
+        
+        connections.discard(websocket)
+        if not connections:
+            del self.user_connections[user_id]
     
     async def get_recent_notifications(self, user_id: str = None, limit: int = 10) -> List[Dict]:
         """Get recent notifications with insights"""
-        if user_id:
-            user_notifications = [
-                notif for notif in self.notifications 
-                if notif["user_id"] == user_id
-            ]
-            return user_notifications[-limit:]
-        return self.notifications[-limit:]
+        source = self.user_notifications.get(user_id, ()) if user_id else self.notifications
+        recent = list(islice(reversed(source), limit))
+        recent.reverse()
+        return recent
     
     async def get_service_status(self) -> Dict:
         """Get enhanced service status"""
-        total_connections = sum(len(conns) for conns in self.user_connections.values())
-        
         return {
             "service": "Enhanced Notification Service",
-            "total_websocket_connections": total_connections,
+            "total_websocket_connections": len(self._connection_users),
             "active_users": len(self.user_connections),
-            "total_notifications": len(self.notifications),
+            "total_notifications": self._next_id,
             "email_stats": self.email_stats,
             "golemdb_integration": bool(self.golem_service),
             "cached_insights": len(self.user_insights),
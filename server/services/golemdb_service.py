@@ -1,12 +1,14 @@
 # services/golemdb_service.py - Production GolemDB Integration for tokenTalk
 import asyncio
+import functools
 import logging
-import json
 import uuid
 import os
+import time
+from collections import OrderedDict
 from datetime import datetime
 from typing import Dict, List, Optional, Any
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, field
 
 # GolemDB imports
 try:
@@ -22,12 +24,25 @@ try:
 except ImportError:
     GOLEM_AVAILABLE = False
 
-from database import AlertCondition, User, Alert
+# Annotations that are the same on every entity of a kind - built once and shared
+if GOLEM_AVAILABLE:
+    ANN_APP = Annotation(key="app", value="tokenTalk")
+    ANN_TYPE_USER_PROFILE = Annotation(key="type", value="user_profile")
+    ANN_TYPE_ALERT_CONFIG = Annotation(key="type", value="alert_config")
+    ANN_TYPE_ALERT_TRIGGER = Annotation(key="type", value="alert_trigger")
+    ANN_TYPE_APP_EVENT = Annotation(key="type", value="app_event")
+    ANN_TYPE_PRICE_DATA = Annotation(key="type", value="price_data")
+    ANN_EVENT_ALERT_TRIGGERED = Annotation(key="event_type", value="alert_triggered")
+    ANN_VERSION_1 = Annotation(key="version", value=1)
+
+from database import AlertCondition, User, Alert, condition_to_dict
+from utils import serialization
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 load_dotenv()
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class GolemConfig:
     """GolemDB configuration"""
     private_key: str = os.getenv("GOLEM_PRIVATE_KEY", "")
@@ -36,6 +51,50 @@ class GolemConfig:
     chain_id: int = int(os.getenv("GOLEM_CHAIN_ID", "60138453033"))
     btl_default: int = 7200  # ~4 hours default expiration
     btl_permanent: int = 525600  # ~1 year for important data
+    mock_cap: int = int(os.getenv("TOKENTALK_MOCK_CAP", "100000"))  # max entities kept in mock mode
+    private_key_bytes: bytes = field(init=False, default=b"")
+    
+    def __post_init__(self):
+        if self.private_key:
+            try:
+                object.__setattr__(self, "private_key_bytes", bytes.fromhex(self.private_key.removeprefix("0x")))
+            except ValueError:
+                logger.warning("⚠️ GOLEM_PRIVATE_KEY is not valid hex")
+
+WRITE_BATCH_SIZE = 64  # entities per create_entities call
+WRITE_BATCH_LINGER = 0.05  # seconds to collect more entities before writing
+PROFILE_CACHE_TTL = 300  # seconds
+THREAD_DECODE_THRESHOLD = 32  # decode larger result sets in a worker thread
+BALANCE_REFRESH_INTERVAL = 10  # seconds between balance RPCs for get_status()
+
+# Query templates - ids are escaped with _query_value() before substitution
+USER_PROFILE_QUERY = 'type="user_profile" && user_id="{}" && app="tokenTalk"'
+USER_EVENTS_QUERY = 'app="tokenTalk" && user_id="{}"'
+
+def _query_value(value: str) -> str:
+    """Escape a value for use inside a double-quoted query string"""
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+def _decode_all(values: List[bytes]) -> List[Dict]:
+    return [serialization.loads(value) for value in values]
+
+def _golem_op(action: str, default=None, level: int = logging.ERROR, count_errors: bool = True):
+    """Log a failed service call as "Error {action}" and return `default` instead.
+
+    A callable default (e.g. list) is called so each failure gets a fresh value.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await fn(self, *args, **kwargs)
+            except Exception as e:
+                logger.log(level, f"Error {action}: {e}")
+                if count_errors:
+                    self.metrics["errors"] += 1
+                return default() if callable(default) else default
+        return wrapper
+    return decorator
 
 class TokenTalkGolemService:
     """Production GolemDB service for tokenTalk"""
@@ -45,9 +104,21 @@ class TokenTalkGolemService:
         self.client: Optional[GolemBaseClient] = None
         self.connected = False
         self.mock_mode = False
+        self._owner_address: Optional[str] = None
+        self._balance_cache = (0, 0.0)  # (wei, monotonic time fetched)
         
         # Local fallback storage
-        self.local_entities = {}
+        self.local_entities = OrderedDict()  # least recently written first
+        self._local_by_user: Dict[str, List[str]] = {}  # user_id -> entity ids, oldest first
+        self._local_types = set()
+        
+        # Coalesced entity creates: (GolemBaseCreate, future) pairs
+        self._write_queue: asyncio.Queue = asyncio.Queue()
+        self._writer_task: Optional[asyncio.Task] = None
+        
+        # Profiles read from the chain, plus queries in flight so concurrent misses share one RPC
+        self._profile_cache = TTLCache(maxsize=10_000, ttl=PROFILE_CACHE_TTL)
+        self._profile_queries: Dict[str, asyncio.Task] = {}
         
         # Metrics
         self.metrics = {
@@ -73,21 +144,23 @@ class TokenTalkGolemService:
             self.mock_mode = True
             return True
         
+        if not self.config.private_key_bytes:
+            logger.warning("⚠️ Invalid GOLEM_PRIVATE_KEY, using mock mode")
+            self.mock_mode = True
+            return True
+        
         try:
-            # Convert private key
-            private_key_hex = self.config.private_key.replace("0x", "")
-            private_key_bytes = bytes.fromhex(private_key_hex)
-            
             # Create client
             self.client = await GolemBaseClient.create_rw_client(
                 rpc_url=self.config.rpc_url,
                 ws_url=self.config.ws_url,
-                private_key=private_key_bytes
+                private_key=self.config.private_key_bytes
             )
             
             # Test connection
-            owner_address = self.client.get_account_address()
+            owner_address = self._owner_address = self.client.get_account_address()
             balance = await self.client.http_client().eth.get_balance(owner_address)
+            self._balance_cache = (balance, time.monotonic())
             
             if balance == 0:
                 logger.warning("⚠️ GolemDB account has 0 ETH - operations will fail")
@@ -130,296 +203,399 @@ class TokenTalkGolemService:
         except Exception as e:
             logger.warning(f"Event monitoring setup failed: {e}")
     
+    def _store_local(self, entity_id: str, data: Dict):
+        """Store a mock-mode entity, indexing new ids by user and type and evicting past mock_cap"""
+        if entity_id not in self.local_entities:
+            user_id = data.get("user_id")
+            if user_id is not None:
+                self._local_by_user.setdefault(user_id, []).append(entity_id)
+            self._local_types.add(data.get("type", "unknown"))
+        self.local_entities[entity_id] = data
+        self.local_entities.move_to_end(entity_id)
+        
+        # Evict least recently written entities past the cap
+        while len(self.local_entities) > self.config.mock_cap:
+            evicted_id, evicted = self.local_entities.popitem(last=False)
+            user_id = evicted.get("user_id")
+            entity_ids = self._local_by_user.get(user_id)
+            if entity_ids is not None:
+                entity_ids.remove(evicted_id)
+                if not entity_ids:
+                    del self._local_by_user[user_id]
+    
+    # Batched writes
+    async def _create_entities(self, entities: List) -> List:
+        """Queue entities for the next batched create_entities call and wait for their receipts"""
+        if self._writer_task is None:
+            self._writer_task = asyncio.create_task(self._write_worker())
+        
+        loop = asyncio.get_running_loop()
+        futures = []
+        for entity in entities:
+            future = loop.create_future()
+            self._write_queue.put_nowait((entity, future))
+            futures.append(future)
+        
+        return list(await asyncio.gather(*futures))
+    
+    async def _write_worker(self):
+        while True:
+            batch = [await self._write_queue.get()]
+            await asyncio.sleep(WRITE_BATCH_LINGER)
+            while len(batch) < WRITE_BATCH_SIZE and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            
+            try:
+                receipts = await self.client.create_entities([entity for entity, _ in batch])
+                self.metrics["blockchain_operations"] += 1
+                for (_, future), receipt in zip(batch, receipts):
+                    if not future.done():
+                        future.set_result(receipt)
+                
+                # zip() stops at the shorter list - fail callers whose entity got no receipt
+                if len(receipts) != len(batch):
+                    logger.error(f"GolemDB returned {len(receipts)} receipts for {len(batch)} entities")
+                    error = RuntimeError(f"No GolemDB receipt ({len(receipts)} for {len(batch)} entities)")
+                    for _, future in batch[len(receipts):]:
+                        if not future.done():
+                            future.set_exception(error)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+    
+    async def flush(self):
+        """Wait until every queued entity has been written"""
+        if self._writer_task:
+            await self._write_queue.join()
+    
     # User Operations
+    @_golem_op("creating user profile")
     async def create_user_profile(self, user_id: str, email: str = None, **metadata) -> str:
         """Store user profile on GolemDB"""
-        try:
-            profile_data = {
-                "user_id": user_id,
-                "email": email,
-                "created_at": datetime.now().isoformat(),
-                "preferences": metadata.get("preferences", {"email_notifications": True}),
-                "app": "tokenTalk",
-                "version": "1.0"
-            }
-            
-            if self.mock_mode:
-                entity_id = f"user_{user_id}"
-                self.local_entities[entity_id] = profile_data
-                logger.info(f"🔄 User profile stored in mock mode: {user_id}")
-                self.metrics["entities_created"] += 1
-                return entity_id
-            
-            # Create on GolemDB
-            entity = GolemBaseCreate(
-                data=json.dumps(profile_data).encode('utf-8'),
-                btl=self.config.btl_permanent,  # Long-lived user data
-                string_annotations=[
-                    Annotation(key="type", value="user_profile"),
-                    Annotation(key="app", value="tokenTalk"),
-                    Annotation(key="user_id", value=user_id),
-                    Annotation(key="email", value=email or ""),
-                ],
-                numeric_annotations=[
-                    Annotation(key="created_timestamp", value=int(datetime.now().timestamp())),
-                    Annotation(key="version", value=1)
-                ]
-            )
-            
-            receipts = await self.client.create_entities([entity])
-            entity_key = receipts[0].entity_key
-            
+        now = datetime.now()
+        profile_data = {
+            "user_id": user_id,
+            "email": email,
+            "created_at": now.isoformat(),
+            "preferences": metadata.get("preferences", {"email_notifications": True}),
+            "app": "tokenTalk",
+            "version": "1.0"
+        }
+        
+        if self.mock_mode:
+            entity_id = f"user_{user_id}"
+            self._store_local(entity_id, profile_data)
+            logger.info(f"🔄 User profile stored in mock mode: {user_id}")
             self.metrics["entities_created"] += 1
-            self.metrics["blockchain_operations"] += 1
-            
-            logger.info(f"✅ User profile created on GolemDB: {user_id}")
-            return str(entity_key)
-            
-        except Exception as e:
-            logger.error(f"Error creating user profile: {e}")
-            self.metrics["errors"] += 1
-            return None
+            return entity_id
+        
+        # Create on GolemDB
+        entity = GolemBaseCreate(
+            data=serialization.dumps_bytes(profile_data),
+            btl=self.config.btl_permanent,  # Long-lived user data
+            string_annotations=[
+                ANN_TYPE_USER_PROFILE,
+                ANN_APP,
+                Annotation(key="user_id", value=user_id),
+                Annotation(key="email", value=email or ""),
+            ],
+            numeric_annotations=[
+                Annotation(key="created_timestamp", value=int(now.timestamp())),
+                ANN_VERSION_1
+            ]
+        )
+        
+        receipts = await self._create_entities([entity])
+        entity_key = receipts[0].entity_key
+        self._profile_cache.set(user_id, profile_data)
+        
+        self.metrics["entities_created"] += 1
+        
+        logger.info(f"✅ User profile created on GolemDB: {user_id}")
+        return str(entity_key)
     
+    @_golem_op("getting user profile")
     async def get_user_profile(self, user_id: str) -> Optional[Dict]:
         """Get user profile from GolemDB"""
-        try:
-            if self.mock_mode:
-                entity_id = f"user_{user_id}"
-                profile = self.local_entities.get(entity_id)
-                if profile:
-                    self.metrics["entities_queried"] += 1
-                return profile
-            
-            # Query GolemDB
-            results = await self.client.query_entities(
-                f'type="user_profile" && user_id="{user_id}" && app="tokenTalk"'
-            )
-            
-            if results:
-                profile_data = json.loads(results[0].storage_value.decode('utf-8'))
+        if self.mock_mode:
+            entity_id = f"user_{user_id}"
+            profile = self.local_entities.get(entity_id)
+            if profile:
                 self.metrics["entities_queried"] += 1
-                return profile_data
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error getting user profile: {e}")
-            self.metrics["errors"] += 1
-            return None
+            return profile
+        
+        cached = self._profile_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        query = self._profile_queries.get(user_id)
+        if query is None:
+            query = self._profile_queries[user_id] = asyncio.create_task(self._query_user_profile(user_id))
+            query.add_done_callback(lambda _: self._profile_queries.pop(user_id, None))
+        
+        return await asyncio.shield(query)
+    
+    async def _query_user_profile(self, user_id: str) -> Optional[Dict]:
+        # Query GolemDB
+        results = await self.client.query_entities(
+            USER_PROFILE_QUERY.format(_query_value(user_id))
+        )
+        
+        if results:
+            profile_data = serialization.loads(results[0].storage_value)
+            self.metrics["entities_queried"] += 1
+            self._profile_cache.set(user_id, profile_data)
+            return profile_data
+        
+        return None
     
+    @_golem_op("updating user email", default=False)
     async def update_user_email(self, user_id: str, new_email: str) -> bool:
         """Update user email on GolemDB"""
-        try:
-            if self.mock_mode:
-                entity_id = f"user_{user_id}"
-                if entity_id in self.local_entities:
-                    self.local_entities[entity_id]["email"] = new_email
-                    self.local_entities[entity_id]["updated_at"] = datetime.now().isoformat()
-                    logger.info(f"🔄 User email updated in mock mode: {user_id}")
-                    return True
-                return False
-            
-            # Find existing profile
-            results = await self.client.query_entities(
-                f'type="user_profile" && user_id="{user_id}" && app="tokenTalk"'
-            )
-            
-            if not results:
-                return False
-            
-            # Update with new email
-            entity_key = results[0].entity_key
-            old_data = json.loads(results[0].storage_value.decode('utf-8'))
-            
-            updated_data = old_data.copy()
-            updated_data["email"] = new_email
-            updated_data["updated_at"] = datetime.now().isoformat()
-            
-            update = GolemBaseUpdate(
-                entity_key=entity_key,
-                data=json.dumps(updated_data).encode('utf-8'),
-                btl=self.config.btl_permanent,
-                string_annotations=[
-                    Annotation(key="type", value="user_profile"),
-                    Annotation(key="app", value="tokenTalk"),
-                    Annotation(key="user_id", value=user_id),
-                    Annotation(key="email", value=new_email),
-                ],
-                numeric_annotations=[
-                    Annotation(key="updated_timestamp", value=int(datetime.now().timestamp())),
-                    Annotation(key="version", value=old_data.get("version", 1) + 1)
-                ]
-            )
-            
-            await self.client.update_entities([update])
-            
-            self.metrics["entities_updated"] += 1
-            self.metrics["blockchain_operations"] += 1
-            
-            logger.info(f"✅ User email updated on GolemDB: {user_id}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error updating user email: {e}")
-            self.metrics["errors"] += 1
+        self._profile_cache.pop(user_id)
+        now = datetime.now()
+        if self.mock_mode:
+            entity_id = f"user_{user_id}"
+            if entity_id in self.local_entities:
+                self.local_entities[entity_id]["email"] = new_email
+                self.local_entities[entity_id]["updated_at"] = now.isoformat()
+                logger.info(f"🔄 User email updated in mock mode: {user_id}")
+                return True
             return False
+        
+        # Find existing profile
+        results = await self.client.query_entities(
+            USER_PROFILE_QUERY.format(_query_value(user_id))
+        )
+        
+        if not results:
+            return False
+        
+        # Update with new email
+        entity_key = results[0].entity_key
+        old_data = serialization.loads(results[0].storage_value)
+        
+        updated_data = old_data.copy()
+        updated_data["email"] = new_email
+        updated_data["updated_at"] = now.isoformat()
+        
+        update = GolemBaseUpdate(
+            entity_key=entity_key,
+            data=serialization.dumps_bytes(updated_data),
+            btl=self.config.btl_permanent,
+            string_annotations=[
+                ANN_TYPE_USER_PROFILE,
+                ANN_APP,
+                Annotation(key="user_id", value=user_id),
+                Annotation(key="email", value=new_email),
+            ],
+            numeric_annotations=[
+                Annotation(key="updated_timestamp", value=int(now.timestamp())),
+                Annotation(key="version", value=old_data.get("version", 1) + 1)
+            ]
+        )
+        
+        await self.client.update_entities([update])
+        self._profile_cache.set(user_id, updated_data)
+        
+        self.metrics["entities_updated"] += 1
+        self.metrics["blockchain_operations"] += 1
+        
+        logger.info(f"✅ User email updated on GolemDB: {user_id}")
+        return True
     
     # Alert Operations
+    @_golem_op("storing alert config", default=False)
     async def store_alert_config(self, alert_id: str, user_id: str, condition: AlertCondition, message: str) -> bool:
         """Store alert configuration as audit trail"""
-        try:
-            alert_data = {
-                "alert_id": alert_id,
-                "user_id": user_id,
-                "condition": asdict(condition),
-                "message": message,
-                "created_at": datetime.now().isoformat(),
-                "app": "tokenTalk",
-                "type": "alert_config"
-            }
-            
-            if self.mock_mode:
-                self.local_entities[f"alert_{alert_id}"] = alert_data
-                self.metrics["entities_created"] += 1
-                return True
-            
-            entity = GolemBaseCreate(
-                data=json.dumps(alert_data).encode('utf-8'),
-                btl=self.config.btl_default,
-                string_annotations=[
-                    Annotation(key="type", value="alert_config"),
-                    Annotation(key="app", value="tokenTalk"),
-                    Annotation(key="alert_id", value=alert_id),
-                    Annotation(key="user_id", value=user_id),
-                    Annotation(key="condition_type", value=condition.condition_type),
-                ],
-                numeric_annotations=[
-                    Annotation(key="threshold", value=int(condition.threshold * 100)),  # Store as cents
-                    Annotation(key="created_timestamp", value=int(datetime.now().timestamp()))
-                ]
-            )
-            
-            await self.client.create_entities([entity])
-            
+        now = datetime.now()
+        alert_data = {
+            "alert_id": alert_id,
+            "user_id": user_id,
+            "condition": condition_to_dict(condition),
+            "message": message,
+            "created_at": now.isoformat(),
+            "app": "tokenTalk",
+            "type": "alert_config"
+        }
+        
+        if self.mock_mode:
+            self._store_local(f"alert_{alert_id}", alert_data)
             self.metrics["entities_created"] += 1
-            self.metrics["blockchain_operations"] += 1
-            
             return True
-            
-        except Exception as e:
-            logger.error(f"Error storing alert config: {e}")
-            self.metrics["errors"] += 1
-            return False
+        
+        entity = GolemBaseCreate(
+            data=serialization.dumps_bytes(alert_data),
+            btl=self.config.btl_default,
+            string_annotations=[
+                ANN_TYPE_ALERT_CONFIG,
+                ANN_APP,
+                Annotation(key="alert_id", value=alert_id),
+                Annotation(key="user_id", value=user_id),
+                Annotation(key="condition_type", value=condition.condition_type),
+            ],
+            numeric_annotations=[
+                Annotation(key="threshold", value=round(condition.threshold * 100)),  # Store as cents
+                Annotation(key="created_timestamp", value=int(now.timestamp()))
+            ]
+        )
+        
+        await self._create_entities([entity])
+        
+        self.metrics["entities_created"] += 1
+        
+        return True
     
+    @_golem_op("logging alert trigger", default=False)
     async def log_alert_trigger(self, alert_id: str, trigger_data: Dict) -> bool:
         """Log alert trigger event"""
-        try:
-            event_data = {
-                "event_type": "alert_triggered",
-                "alert_id": alert_id,
-                "trigger_data": trigger_data,
-                "timestamp": datetime.now().isoformat(),
+        now = datetime.now()
+        event_data = {
+            "event_type": "alert_triggered",
+            "alert_id": alert_id,
+            "trigger_data": trigger_data,
+            "timestamp": now.isoformat(),
+            "app": "tokenTalk"
+        }
+        
+        if self.mock_mode:
+            event_id = f"trigger_{alert_id}_{int(now.timestamp())}"
+            self._store_local(event_id, event_data)
+            self.metrics["events_logged"] += 1
+            return True
+        
+        entity = GolemBaseCreate(
+            data=serialization.dumps_bytes(event_data),
+            btl=self.config.btl_permanent,  # Keep trigger history
+            string_annotations=[
+                ANN_TYPE_ALERT_TRIGGER,
+                ANN_APP,
+                Annotation(key="alert_id", value=alert_id),
+                ANN_EVENT_ALERT_TRIGGERED,
+            ],
+            numeric_annotations=[
+                Annotation(key="trigger_timestamp", value=int(now.timestamp()))
+            ]
+        )
+        
+        await self._create_entities([entity])
+        
+        self.metrics["events_logged"] += 1
+        
+        return True
+    
+    async def log_event(self, event_type: str, event_data: Dict, user_id: str = None) -> bool:
+        """Log a single app event"""
+        return await self.log_events_batch([
+            {"event_type": event_type, "event_data": event_data, "user_id": user_id}
+        ])
+    
+    @_golem_op("logging events", default=False)
+    async def log_events_batch(self, events: List[Dict]) -> bool:
+        """Log app events ({event_type, event_data, user_id}) in one blockchain call"""
+        if not events:
+            return True
+        
+        now = datetime.now()
+        timestamp = now.isoformat()
+        records = [
+            {
+                "event_type": event["event_type"],
+                "user_id": event.get("user_id"),
+                "data": event["event_data"],
+                "timestamp": timestamp,
                 "app": "tokenTalk"
             }
-            
-            if self.mock_mode:
-                event_id = f"trigger_{alert_id}_{int(datetime.now().timestamp())}"
-                self.local_entities[event_id] = event_data
-                self.metrics["events_logged"] += 1
-                return True
-            
-            entity = GolemBaseCreate(
-                data=json.dumps(event_data).encode('utf-8'),
-                btl=self.config.btl_permanent,  # Keep trigger history
-                string_annotations=[
-                    Annotation(key="type", value="alert_trigger"),
-                    Annotation(key="app", value="tokenTalk"),
-                    Annotation(key="alert_id", value=alert_id),
-                    Annotation(key="event_type", value="alert_triggered"),
-                ],
-                numeric_annotations=[
-                    Annotation(key="trigger_timestamp", value=int(datetime.now().timestamp()))
-                ]
-            )
-            
-            await self.client.create_entities([entity])
-            
-            self.metrics["events_logged"] += 1
-            self.metrics["blockchain_operations"] += 1
-            
+            for event in events
+        ]
+        
+        if self.mock_mode:
+            for record in records:
+                self._store_local(f"event_{uuid.uuid4()}", record)
+            self.metrics["events_logged"] += len(records)
             return True
+        
+        timestamp_annotation = Annotation(key="timestamp", value=int(now.timestamp()))
+        entities = []
+        for record in records:
+            string_annotations = [
+                ANN_TYPE_APP_EVENT,
+                ANN_APP,
+                Annotation(key="event_type", value=record["event_type"]),
+            ]
+            if record["user_id"]:
+                string_annotations.append(Annotation(key="user_id", value=record["user_id"]))
             
-        except Exception as e:
-            logger.error(f"Error logging alert trigger: {e}")
-            self.metrics["errors"] += 1
-            return False
+            entities.append(GolemBaseCreate(
+                data=serialization.dumps_bytes(record),
+                btl=self.config.btl_default,
+                string_annotations=string_annotations,
+                numeric_annotations=[timestamp_annotation]
+            ))
+        
+        await self._create_entities(entities)
+        
+        self.metrics["events_logged"] += len(records)
+        
+        return True
     
     # Analytics Operations
+    @_golem_op("storing price analytics", default=False, level=logging.DEBUG, count_errors=False)
     async def store_price_analytics(self, symbol: str, price: float, volume: float = None, **metadata) -> bool:
         """Store price data for analytics"""
-        try:
-            price_data = {
-                "symbol": symbol,
-                "price": price,
-                "volume": volume,
-                "timestamp": datetime.now().isoformat(),
-                "metadata": metadata,
-                "app": "tokenTalk"
-            }
-            
-            if self.mock_mode:
-                price_id = f"price_{symbol}_{int(datetime.now().timestamp())}"
-                self.local_entities[price_id] = price_data
-                return True
-            
-            entity = GolemBaseCreate(
-                data=json.dumps(price_data).encode('utf-8'),
-                btl=self.config.btl_default,
-                string_annotations=[
-                    Annotation(key="type", value="price_data"),
-                    Annotation(key="app", value="tokenTalk"),
-                    Annotation(key="symbol", value=symbol),
-                    Annotation(key="source", value=metadata.get("source", "redstone")),
-                ],
-                numeric_annotations=[
-                    Annotation(key="price_cents", value=int(price * 100)),
-                    Annotation(key="timestamp", value=int(datetime.now().timestamp()))
-                ]
-            )
-            
-            await self.client.create_entities([entity])
-            self.metrics["blockchain_operations"] += 1
+        now = datetime.now()
+        price_data = {
+            "symbol": symbol,
+            "price": price,
+            "volume": volume,
+            "timestamp": now.isoformat(),
+            "metadata": metadata,
+            "app": "tokenTalk"
+        }
+        
+        if self.mock_mode:
+            price_id = f"price_{symbol}_{int(now.timestamp())}"
+            self._store_local(price_id, price_data)
             return True
-            
-        except Exception as e:
-            logger.debug(f"Error storing price analytics: {e}")  # Debug level since this is non-critical
-            return False
+        
+        entity = GolemBaseCreate(
+            data=serialization.dumps_bytes(price_data),
+            btl=self.config.btl_default,
+            string_annotations=[
+                ANN_TYPE_PRICE_DATA,
+                ANN_APP,
+                Annotation(key="symbol", value=symbol),
+                Annotation(key="source", value=metadata.get("source", "redstone")),
+            ],
+            numeric_annotations=[
+                Annotation(key="price_cents", value=round(price * 100)),
+                Annotation(key="timestamp", value=int(now.timestamp()))
+            ]
+        )
+        
+        await self._create_entities([entity])
+        return True
     
+    @_golem_op("getting user analytics", default=list, count_errors=False)
     async def get_user_analytics(self, user_id: str, limit: int = 100) -> List[Dict]:
         """Get user's alert history and analytics"""
-        try:
-            if self.mock_mode:
-                results = []
-                for key, entity in self.local_entities.items():
-                    if entity.get("user_id") == user_id:
-                        results.append(entity)
-                return results[-limit:]
-            
-            # Query user's alerts and triggers
-            alert_results = await self.client.query_entities(
-                f'app="tokenTalk" && user_id="{user_id}"'
-            )
-            
-            analytics = []
-            for result in alert_results:
-                data = json.loads(result.storage_value.decode('utf-8'))
-                analytics.append(data)
-            
-            return analytics[-limit:]
-            
-        except Exception as e:
-            logger.error(f"Error getting user analytics: {e}")
-            return []
+        if self.mock_mode:
+            entity_ids = self._local_by_user.get(user_id, [])
+            return [self.local_entities[entity_id] for entity_id in entity_ids[-limit:]]
+        
+        # Query user's alerts and triggers
+        alert_results = await self.client.query_entities(
+            USER_EVENTS_QUERY.format(_query_value(user_id))
+        )
+        
+        values = [result.storage_value for result in alert_results[-limit:]]
+        if len(values) > THREAD_DECODE_THRESHOLD:
+            return await asyncio.to_thread(_decode_all, values)
+        return _decode_all(values)
     
     # Status and Management
     async def get_status(self) -> Dict:
@@ -440,11 +616,10 @@ class TokenTalkGolemService:
         
         if self.connected and self.client:
             try:
-                owner_address = self.client.get_account_address()
-                balance = await self.client.http_client().eth.get_balance(owner_address)
+                balance = await self._get_balance()
                 
                 status["blockchain"] = {
-                    "address": owner_address,
+                    "address": self._owner_address,
                     "balance_eth": balance / 10**18,
                     "balance_wei": balance
                 }
@@ -454,14 +629,20 @@ class TokenTalkGolemService:
         if self.mock_mode:
             status["mock_data"] = {
                 "entities_stored": len(self.local_entities),
-                "entity_types": list(set(
-                    entity.get("type", "unknown") 
-                    for entity in self.local_entities.values()
-                ))
+                "entity_types": list(self._local_types)
             }
         
         return status
     
+    async def _get_balance(self) -> int:
+        """Account balance in wei, refreshed at most every BALANCE_REFRESH_INTERVAL"""
+        balance, fetched_at = self._balance_cache
+        now = time.monotonic()
+        if now - fetched_at >= BALANCE_REFRESH_INTERVAL:
+            balance = await self.client.http_client().eth.get_balance(self._owner_address)
+            self._balance_cache = (balance, now)
+        return balance
+    
     async def export_mock_data(self) -> Dict:
         """Export mock data for analysis"""
         return {
@@ -472,6 +653,11 @@ class TokenTalkGolemService:
     
     async def close(self):
         """Close service"""
+        if self._writer_task:
+            await self.flush()
+            self._writer_task.cancel()
+            self._writer_task = None
+        
         if self.client:
             try:
                 await self.client.disconnect()
@@ -492,6 +678,16 @@ class TokenTalkHybridDatabase:
         self.sync_user_profiles = True
         self.log_alert_triggers = True
         self.store_price_analytics = False  # Optional for performance
+        
+        # GolemDB mirroring runs after the SQLite write returns
+        self._background_tasks = set()
+        self._synced_users = set()  # user_ids known to have a GolemDB profile
+    
+    def _run_in_background(self, coro):
+        """Run a GolemDB write without awaiting it"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
     
     async def initialize(self) -> bool:
         """Initialize hybrid database"""
@@ -524,19 +720,24 @@ class TokenTalkHybridDatabase:
         sqlite_user = await self.sqlite_db.get_or_create_user(user_id, email)
         
         # Secondary: GolemDB sync (user data ownership)
-        if self.golem_enabled and self.sync_user_profiles:
-            try:
-                # Check if profile exists
-                profile = await self.golem.get_user_profile(user_id)
-                if not profile:
-                    # Create profile on GolemDB
-                    await self.golem.create_user_profile(user_id, email)
-                    logger.info(f"👤 User profile synced to GolemDB: {user_id}")
-            except Exception as e:
-                logger.warning(f"GolemDB user sync failed: {e}")
+        if self.golem_enabled and self.sync_user_profiles and user_id not in self._synced_users:
+            self._run_in_background(self._sync_user_profile(user_id, email))
         
         return sqlite_user
     
+    async def _sync_user_profile(self, user_id: str, email: str = None):
+        try:
+            # Check if profile exists
+            profile = await self.golem.get_user_profile(user_id)
+            if profile:
+                self._synced_users.add(user_id)
+            elif await self.golem.create_user_profile(user_id, email):
+                # Created profile on GolemDB
+                self._synced_users.add(user_id)
+                logger.info(f"👤 User profile synced to GolemDB: {user_id}")
+        except Exception as e:
+            logger.warning(f"GolemDB user sync failed: {e}")
+    
     async def update_user_email(self, user_id: str, email: str) -> bool:
         """Update user email in both systems"""
         # Primary: SQLite
@@ -544,14 +745,17 @@ class TokenTalkHybridDatabase:
         
         # Secondary: GolemDB sync
         if self.golem_enabled and sqlite_success and self.sync_user_profiles:
-            try:
-                await self.golem.update_user_email(user_id, email)
-                logger.info(f"📧 Email updated on GolemDB: {user_id}")
-            except Exception as e:
-                logger.warning(f"GolemDB email update failed: {e}")
+            self._run_in_background(self._sync_user_email(user_id, email))
         
         return sqlite_success
     
+    async def _sync_user_email(self, user_id: str, email: str):
+        try:
+            await self.golem.update_user_email(user_id, email)
+            logger.info(f"📧 Email updated on GolemDB: {user_id}")
+        except Exception as e:
+            logger.warning(f"GolemDB email update failed: {e}")
+    
     # Enhanced Alert Operations
     async def create_alert(self, user_id: str, user_email: str, condition: AlertCondition, message: str) -> str:
         """Create alert with GolemDB audit trail"""
@@ -560,39 +764,57 @@ class TokenTalkHybridDatabase:
         
         # Secondary: GolemDB audit trail
         if self.golem_enabled:
-            try:
-                await self.golem.store_alert_config(alert_id, user_id, condition, message)
-                logger.info(f"📝 Alert config stored on GolemDB: {alert_id[:8]}")
-            except Exception as e:
-                logger.warning(f"GolemDB alert storage failed: {e}")
+            self._run_in_background(self._store_alert_audit(alert_id, user_id, condition, message))
         
         return alert_id
     
+    async def _store_alert_audit(self, alert_id: str, user_id: str, condition: AlertCondition, message: str):
+        try:
+            await self.golem.store_alert_config(alert_id, user_id, condition, message)
+            logger.info(f"📝 Alert config stored on GolemDB: {alert_id[:8]}")
+        except Exception as e:
+            logger.warning(f"GolemDB alert storage failed: {e}")
+    
     async def log_alert_trigger(self, alert_id: str, price_data: Dict):
         """Log alert trigger with immutable audit trail"""
         # Primary: SQLite
-        await self.sqlite_db.log_alert_trigger(alert_id, price_data)
+        if not (self.golem_enabled and self.log_alert_triggers):
+            await self.sqlite_db.log_alert_trigger(alert_id, price_data)
+            return
         
-        # Secondary: GolemDB (immutable audit)
-        if self.golem_enabled and self.log_alert_triggers:
-            try:
-                await self.golem.log_alert_trigger(alert_id, price_data)
-                logger.info(f"🔥 Alert trigger logged on GolemDB: {alert_id[:8]}")
-            except Exception as e:
-                logger.warning(f"GolemDB trigger logging failed: {e}")
+        # Secondary: GolemDB (immutable audit), written concurrently
+        sqlite_result, golem_result = await asyncio.gather(
+            self.sqlite_db.log_alert_trigger(alert_id, price_data),
+            self.golem.log_alert_trigger(alert_id, price_data),
+            return_exceptions=True
+        )
+        
+        if isinstance(golem_result, Exception):
+            logger.warning(f"GolemDB trigger logging failed: {golem_result}")
+        else:
+            logger.info(f"🔥 Alert trigger logged on GolemDB: {alert_id[:8]}")
+        if isinstance(sqlite_result, Exception):
+            raise sqlite_result
     
     # Analytics Operations
     async def log_price_data(self, symbol: str, price: float, timestamp: int):
         """Log price data with optional GolemDB analytics"""
         # Primary: SQLite
-        await self.sqlite_db.log_price_data(symbol, price, timestamp)
+        if not (self.golem_enabled and self.store_price_analytics):
+            await self.sqlite_db.log_price_data(symbol, price, timestamp)
+            return
         
-        # Secondary: GolemDB analytics (optional)
-        if self.golem_enabled and self.store_price_analytics:
-            try:
-                await self.golem.store_price_analytics(symbol, price)
-            except Exception as e:
-                logger.debug(f"GolemDB price analytics failed: {e}")
+        # Secondary: GolemDB analytics (optional), written concurrently
+        sqlite_result, golem_result = await asyncio.gather(
+            self.sqlite_db.log_price_data(symbol, price, timestamp),
+            self.golem.store_price_analytics(symbol, price),
+            return_exceptions=True
+        )
+        
+        if isinstance(golem_result, Exception):
+            logger.debug(f"GolemDB price analytics failed: {golem_result}")
+        if isinstance(sqlite_result, Exception):
+            raise sqlite_result
     
     async def get_user_analytics(self, user_id: str) -> Dict:
         """Get comprehensive user analytics"""
@@ -667,7 +889,10 @@ class TokenTalkHybridDatabase:
     
     async def close(self):
         """Close hybrid database"""
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
         await self.golem.close()
+        await self.sqlite_db.close()
 
 # Easy integration function
 async def create_tokenTalk_golem_hybrid(sqlite_db, golem_config: GolemConfig = None):
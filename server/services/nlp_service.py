@@ -1,15 +1,131 @@
 # services/nlp_service.py - Ollama-focused with easy API switching
 import aiohttp
-import json
+import logging
 import re
 from typing import Dict, List, Optional
 import asyncio
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime
 
 from config import settings
+from utils import serialization
+from utils.cache import TTLCache
 
-@dataclass
+logger = logging.getLogger(__name__)
+
+# Fallback patterns - each captures {tok} and {val}. Literal patterns are
+# unambiguous enough to answer without asking a model.
+BASIC_PATTERNS = (
+    ("above", "price_above", True, r"(?P<{tok}>\w+)\s+(?:hits|reaches|goes above|above|over)\s+\$?(?P<{val}>\d+\.?\d*)"),
+    ("when", "price_above", False, r"when\s+(?P<{tok}>\w+)\s+\$?(?P<{val}>\d+\.?\d*)"),
+    ("notify", "price_above", False, r"(?:alert|notify|tell).*?(?P<{tok}>\w+).*?(?P<{val}>\d+\.?\d*)"),
+    ("change", "price_change", True, r"(?P<{tok}>\w+)\s+(?:drops|falls)\s+(?P<{val}>\d+)%"),
+    ("below", "price_below", True, r"(?P<{tok}>\w+)\s+(?:drops|falls|goes below|below|under)\s+\$?(?P<{val}>\d+\.?\d*)"),
+)
+
+# All patterns fused into one alternation so a message is scanned once; each
+# alternative is a named group, so match.lastgroup identifies which matched
+BASIC_PATTERN = re.compile(
+    "|".join(
+        f"(?P<{name}>{pattern.format(tok=name + '_tok', val=name + '_val')})"
+        for name, _, _, pattern in BASIC_PATTERNS
+    ),
+    re.IGNORECASE
+)
+# group -> (condition_type, literal, token group, value group, value is a percentage)
+BASIC_PATTERN_FIELDS = {
+    name: (condition_type, literal, name + "_tok", name + "_val", condition_type == "price_change")
+    for name, condition_type, literal, _ in BASIC_PATTERNS
+}
+LITERAL_MATCH_CONFIDENCE = 0.95
+
+# First "{" to last "}" - markdown fences around the object don't matter
+JSON_OBJECT_PATTERN = re.compile(r"(?s)\{.*\}")
+
+# Session-wide default; _check_ollama overrides it with a shorter probe timeout
+REQUEST_TIMEOUT = 30
+
+# Repeated chat messages skip the model round trip; low-confidence parses aren't cached
+PARSE_CACHE_SIZE = 512
+PARSE_CACHE_TTL = 300  # short, so a misparse doesn't stick around
+MIN_CACHED_CONFIDENCE = 0.5
+# Context fields that can change how a message parses; counts and timestamps don't
+PARSE_CACHE_CONTEXT_KEYS = ("tokens_watched", "query_type")
+
+SYSTEM_PROMPT = """You are a crypto price alert parser. Convert natural language into structured JSON alerts.
+
+SUPPORTED CONDITIONS:
+- price_above: Token goes above price threshold  
+- price_below: Token goes below price threshold
+- price_change: Token changes by percentage (negative for drops)
+- relative_change: Complex multi-token conditions
+
+TOKENS: BTC, ETH, AAVE, UNI, SUSHI, COMP, MKR, SNX, CRV, 1INCH
+GROUPS: "DeFi tokens" = all DeFi tokens above
+
+REQUIRED JSON FORMAT:
+{
+  "intent": "create_alert",
+  "valid": true,
+  "condition": {
+    "condition_type": "price_above|price_below|price_change|relative_change",
+    "tokens": ["ETH"],
+    "threshold": 4000.0,
+    "timeframe": "24h"
+  },
+  "confidence": 0.9,
+  "explanation": "Will alert when ETH goes above $4000"
+}
+
+EXAMPLES:
+- "Alert when ETH hits $4000" → price_above, ["ETH"], 4000
+- "Bitcoin drops 15%" → price_change, ["BTC"], -0.15
+- "I want ethereum at five thousand" → price_above, ["ETH"], 5000
+
+Return ONLY valid JSON. For non-alerts, set "valid": false."""
+
+# Prompt scaffolding shared by every parse request
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+CLAUDE_PROMPT_PREFIX = SYSTEM_PROMPT + "\n\n"
+
+# Stands in for the user prompt while the Ollama payload is pre-encoded
+USER_PROMPT_PLACEHOLDER = "\x00user_prompt\x00"
+JSON_HEADERS = {"content-type": "application/json"}
+
+class _JSONObjectEnd:
+    """Spots where the first top-level JSON object in streamed text closes.
+
+    Braces inside JSON strings (e.g. a "reasoning" value) don't count;
+    prose before the object is skipped.
+    """
+    __slots__ = ("depth", "in_string", "escaped")
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, text: str) -> bool:
+        """Consume the next piece of text; True once the object has closed"""
+        for char in text:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.depth > 0
+            elif char == "{":
+                self.depth += 1
+            elif char == "}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+@dataclass(slots=True)
 class ParsedCondition:
     condition_type: str  # "price_above", "price_below", "price_change", "relative_change"
     tokens: List[str]
@@ -24,8 +140,10 @@ class NLPService:
         self.session = None
         self.ollama_available = False
         self.ollama_model = None
+        self._ollama_payload_parts = None  # (prefix, suffix) encoded around the user prompt
+        self._parse_cache = TTLCache(maxsize=PARSE_CACHE_SIZE, ttl=PARSE_CACHE_TTL)
         
-        # Token mapping
+        # Token mapping (keys are lowercase aliases)
         self.token_mapping = {
             "bitcoin": "BTC", "btc": "BTC",
             "ethereum": "ETH", "eth": "ETH", "ether": "ETH",
@@ -39,11 +157,30 @@ class NLPService:
         }
         
         self.defi_tokens = ["AAVE", "UNI", "SUSHI", "COMP", "MKR", "SNX", "CRV", "1INCH"]
+        
+        # Longest aliases first so "sushiswap" wins over "sushi"
+        aliases = sorted(self.token_mapping, key=len, reverse=True)
+        self._token_re = re.compile(r"\b(" + "|".join(map(re.escape, aliases)) + r")\b", re.IGNORECASE)
+    
+    def _normalize_token(self, raw: str, key: str) -> str:
+        """Map a case-folded alias to its symbol, or upper-case unknown tokens"""
+        symbol = self.token_mapping.get(key)
+        return symbol if symbol is not None else raw.upper()
     
     async def init(self):
         """Initialize the service and check Ollama availability"""
         if not self.session:
-            self.session = aiohttp.ClientSession()
+            connector = aiohttp.TCPConnector(
+                limit=32,
+                limit_per_host=16,
+                keepalive_timeout=60,
+                ttl_dns_cache=300
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+                json_serialize=serialization.dumps
+            )
         
         await self._check_ollama()
     
@@ -67,68 +204,125 @@ class NLPService:
                     if models:
                         self.ollama_available = True
                         self.ollama_model = models[0]  # Use first available
-                        print(f"✅ Ollama connected: {self.ollama_model}")
+                        self._ollama_payload_parts = self._encode_ollama_payload()
+                        logger.info(f"✅ Ollama connected: {self.ollama_model}")
                         return True
                     else:
-                        print("⚠️ Ollama running but no models installed")
+                        logger.warning("⚠️ Ollama running but no models installed")
                         
         except Exception as e:
-            print(f"⚠️ Ollama not available: {e}")
+            logger.warning(f"⚠️ Ollama not available: {e}")
         
         self.ollama_available = False
         return False
     
+    def _encode_ollama_payload(self):
+        """Encode the chat payload once, split where the user prompt goes"""
+        payload = serialization.dumps_bytes({
+            "model": self.ollama_model,
+            "messages": [SYSTEM_MESSAGE, {"role": "user", "content": USER_PROMPT_PLACEHOLDER}],
+            "stream": True,
+            "options": {
+                "temperature": 0.1,
+                "num_predict": 500
+            }
+        })
+        prefix, suffix = payload.split(serialization.dumps_bytes(USER_PROMPT_PLACEHOLDER))
+        return prefix, suffix
+    
     async def parse_message(self, message: str, user_context: Optional[Dict] = None) -> Optional[ParsedCondition]:
         """Parse message using best available method"""
         if not self.session:
             await self.init()
         
-        # Try Ollama first
+        # Plain "ETH above 4000" style alerts don't need a model
+        literal = await self._parse_with_basic(message, literal_only=True)
+        if literal:
+            return literal
+        
+        cache_key = self._parse_cache_key(message, user_context)
+        cached = self._parse_cache.get(cache_key)
+        if cached:
+            return replace(cached, tokens=list(cached.tokens))
+        
+        result = await self._parse_uncached(message, user_context)
+        if result and result.confidence >= MIN_CACHED_CONFIDENCE:
+            self._parse_cache.set(cache_key, replace(result, tokens=list(result.tokens)))
+        return result
+    
+    @staticmethod
+    def _parse_cache_key(message: str, user_context: Optional[Dict]) -> tuple:
+        """Normalized message plus only the context fields that affect parsing"""
+        context = user_context or {}
+        tokens = context.get("tokens_watched")
+        return (
+            " ".join(message.lower().split()),
+            tuple(sorted(tokens)) if tokens else None,
+            context.get("query_type"),
+        )
+    
+    async def _parse_uncached(self, message: str, user_context: Optional[Dict] = None) -> Optional[ParsedCondition]:
+        """Race the model backends, falling back to basic patterns"""
+        # Race every available model backend; the first one to answer decides,
+        # including a None answer for messages that aren't alerts
+        tasks = {}
         if self.ollama_available:
-            try:
-                return await self._parse_with_ollama(message, user_context)
-            except Exception as e:
-                print(f"Ollama parsing failed, falling back to basic: {e}")
+            tasks[asyncio.create_task(self._parse_with_ollama(message, user_context))] = "Ollama"
         
         # Easy switch point for APIs - just change this condition
         if settings.USE_CLOUD_API and settings.has_api_key():
-            try:
-                return await self._parse_with_cloud_api(message, user_context)
-            except Exception as e:
-                print(f"Cloud API parsing failed, falling back to basic: {e}")
+            tasks[asyncio.create_task(self._parse_with_cloud_api(message, user_context))] = "Cloud API"
+        
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.warning(f"{tasks[task]} parsing failed: {e}")
+                        continue
+                    return result
+        finally:
+            for task in pending:
+                task.cancel()
         
-        # Always fallback to basic patterns
+        # No backend available, or every backend failed - fall back to basic patterns
         return await self._parse_with_basic(message)
     
     async def _parse_with_ollama(self, message: str, user_context: Optional[Dict] = None) -> Optional[ParsedCondition]:
         """Parse using Ollama"""
-        system_prompt = self._create_system_prompt()
         user_prompt = self._create_user_prompt(message, user_context)
         
-        payload = {
-            "model": self.ollama_model,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            "stream": False,
-            "options": {
-                "temperature": 0.1,
-                "num_predict": 500
-            }
-        }
+        prefix, suffix = self._ollama_payload_parts
         
         async with self.session.post(
             f"{settings.OLLAMA_URL}/api/chat",
-            json=payload,
-            timeout=30
+            data=prefix + serialization.dumps_bytes(user_prompt) + suffix,
+            headers=JSON_HEADERS
         ) as resp:
-            if resp.status == 200:
-                data = await resp.json()
-                response_text = data["message"]["content"].strip()
-                return self._parse_json_response(response_text)
-            else:
+            if resp.status != 200:
                 raise Exception(f"Ollama API error: {resp.status}")
+            
+            # Read NDJSON chunks until the JSON object closes, then hang up so
+            # Ollama stops generating the rest of the num_predict budget
+            parts = []
+            object_end = _JSONObjectEnd()
+            async for line in resp.content:
+                if not line.strip():
+                    continue
+                chunk = serialization.loads(line)
+                content = chunk.get("message", {}).get("content", "")
+                parts.append(content)
+                
+                if object_end.feed(content):
+                    resp.close()
+                    break
+                if chunk.get("done"):
+                    break
+            
+            return self._parse_json_response("".join(parts).strip())
     
     async def _parse_with_cloud_api(self, message: str, user_context: Optional[Dict] = None) -> Optional[ParsedCondition]:
         """Parse using cloud API (Claude/OpenAI) - Easy to switch"""
@@ -145,7 +339,6 @@ class NLPService:
     
     async def _parse_with_claude(self, message: str, user_context: Optional[Dict] = None) -> Optional[ParsedCondition]:
         """Parse using Claude API"""
-        system_prompt = self._create_system_prompt()
         user_prompt = self._create_user_prompt(message, user_context)
         
         headers = {
@@ -157,165 +350,125 @@ class NLPService:
         payload = {
             "model": "claude-3-haiku-20240307",
             "max_tokens": 500,
-            "messages": [{"role": "user", "content": f"{system_prompt}\n\n{user_prompt}"}]
+            "messages": [{"role": "user", "content": CLAUDE_PROMPT_PREFIX + user_prompt}]
         }
         
         async with self.session.post(
             "https://api.anthropic.com/v1/messages",
             json=payload,
-            headers=headers,
-            timeout=30
+            headers=headers
         ) as resp:
             if resp.status == 200:
-                data = await resp.json()
+                data = await resp.json(loads=serialization.loads)
                 response_text = data["content"][0]["text"].strip()
                 return self._parse_json_response(response_text)
             else:
                 raise Exception(f"Claude API error: {resp.status}")
     
-    async def _parse_with_basic(self, message: str) -> Optional[ParsedCondition]:
-        """Fallback basic pattern matching"""
-        message_lower = message.lower()
+    async def _parse_with_basic(self, message: str, literal_only: bool = False) -> Optional[ParsedCondition]:
+        """Fallback basic pattern matching
         
-        # Simple regex patterns for common cases
-        patterns = {
-            "price_above": [
-                r"(\w+)\s+(?:hits|reaches|goes above|above|over)\s+\$?(\d+\.?\d*)",
-                r"when\s+(\w+)\s+\$?(\d+\.?\d*)",
-                r"(?:alert|notify|tell).*?(\w+).*?(\d+\.?\d*)"
-            ],
-            "price_below": [
-                r"(\w+)\s+(?:drops|falls|goes below|below|under)\s+\$?(\d+\.?\d*)"
-            ],
-            "price_change": [
-                r"(\w+)\s+(?:drops|falls)\s+(\d+)%"
-            ]
-        }
+        With literal_only, only strict phrasings naming a single known token
+        match, and the result is confident enough to skip the models.
+        """
+        match = BASIC_PATTERN.search(message)
+        if not match:
+            return None
         
-        for condition_type, pattern_list in patterns.items():
-            for pattern in pattern_list:
-                match = re.search(pattern, message_lower, re.IGNORECASE)
-                if match:
-                    token_raw = match.group(1).upper()
-                    value = float(match.group(2))
-                    
-                    # Normalize token name
-                    token = self.token_mapping.get(token_raw.lower(), token_raw)
-                    
-                    # Convert percentage to decimal for price_change
-                    if condition_type == "price_change":
-                        value = -value / 100  # Make negative for drops
-                    
-                    return ParsedCondition(
-                        condition_type=condition_type,
-                        tokens=[token],
-                        threshold=value,
-                        timeframe="24h",
-                        confidence=0.7,
-                        explanation=f"Pattern match: {condition_type} for {token}"
-                    )
+        condition_type, literal, token_group, value_group, percentage = BASIC_PATTERN_FIELDS[match.lastgroup]
+        token_raw = match.group(token_group)
+        value = float(match.group(value_group))
+        key = token_raw.casefold()
+        
+        if literal_only:
+            if not literal or key not in self.token_mapping:
+                return None
+            # Several tokens named may be a relative condition - leave those to the models
+            named = {self.token_mapping[alias.casefold()] for alias in self._token_re.findall(message)}
+            if len(named) > 1:
+                return None
+        
+        # Normalize token name, preferring a known token named anywhere in the message
+        if key not in self.token_mapping:
+            known = self._token_re.search(message)
+            if known:
+                token_raw = known.group(1)
+                key = token_raw.casefold()
+        token = self._normalize_token(token_raw, key)
         
-        return None
+        # Convert percentage to decimal for price_change
+        if percentage:
+            value = -value / 100  # Make negative for drops
+        
+        return ParsedCondition(
+            condition_type=condition_type,
+            tokens=[token],
+            threshold=value,
+            timeframe="24h",
+            confidence=LITERAL_MATCH_CONFIDENCE if literal_only else 0.7,
+            explanation=f"Pattern match: {condition_type} for {token}"
+        )
     
     def _parse_json_response(self, response_text: str) -> Optional[ParsedCondition]:
         """Parse JSON response from AI models"""
         try:
-            # Clean up response (remove markdown if present)
-            if "```json" in response_text:
-                start = response_text.find("```json") + 7
-                end = response_text.find("```", start)
-                response_text = response_text[start:end].strip()
-            elif response_text.startswith("```") and response_text.endswith("```"):
-                response_text = response_text[3:-3].strip()
-            
             # Find JSON object
-            json_start = response_text.find("{")
-            json_end = response_text.rfind("}") + 1
-            if json_start != -1 and json_end > json_start:
-                response_text = response_text[json_start:json_end]
+            match = JSON_OBJECT_PATTERN.search(response_text)
+            if match:
+                response_text = match.group(0)
             
-            parsed_data = json.loads(response_text)
+            parsed_data = serialization.loads(response_text)
+            
+            pget = parsed_data.get
             
             # Validate response structure
-            if not parsed_data.get("valid", False):
+            if not pget("valid", False):
                 return None
             
-            if parsed_data.get("intent") != "create_alert":
+            if pget("intent") != "create_alert":
                 return None
             
-            condition_data = parsed_data.get("condition", {})
+            condition_data = pget("condition", {})
             if not condition_data:
                 return None
+            cget = condition_data.get
             
             # Normalize tokens
-            raw_tokens = condition_data.get("tokens", [])
-            normalized_tokens = []
-            
-            for token in raw_tokens:
-                normalized = self.token_mapping.get(token.lower(), token.upper())
-                normalized_tokens.append(normalized)
+            raw_tokens = cget("tokens", [])
+            keys = [str(token).casefold() for token in raw_tokens]
             
             # Handle special cases
-            if any("defi" in str(token).lower() for token in raw_tokens):
+            if any("defi" in key for key in keys):
                 normalized_tokens = self.defi_tokens
+            else:
+                mapping_get = self.token_mapping.get
+                normalized_tokens = [
+                    mapping_get(key) or str(token).upper() for token, key in zip(raw_tokens, keys)
+                ]
             
             return ParsedCondition(
-                condition_type=condition_data.get("condition_type", ""),
+                condition_type=cget("condition_type", ""),
                 tokens=normalized_tokens,
-                threshold=float(condition_data.get("threshold", 0)),
-                timeframe=condition_data.get("timeframe", "24h"),
-                secondary_condition=condition_data.get("secondary_condition"),
-                confidence=float(parsed_data.get("confidence", 0.8)),
-                explanation=parsed_data.get("explanation", "")
+                threshold=float(cget("threshold", 0)),
+                timeframe=cget("timeframe", "24h"),
+                secondary_condition=cget("secondary_condition"),
+                confidence=float(pget("confidence", 0.8)),
+                explanation=pget("explanation", "")
             )
             
-        except json.JSONDecodeError as e:
-            print(f"JSON parse error: {e}")
-            print(f"Response: {response_text[:200]}...")
+        except serialization.JSONDecodeError as e:
+            logger.warning(f"JSON parse error: {e}")
+            logger.debug("Response: %.200s...", response_text)
             return None
         except Exception as e:
-            print(f"Response parsing error: {e}")
+            logger.warning(f"Response parsing error: {e}")
             return None
     
-    def _create_system_prompt(self) -> str:
-        """System prompt for AI models"""
-        return """You are a crypto price alert parser. Convert natural language into structured JSON alerts.
-
-SUPPORTED CONDITIONS:
-- price_above: Token goes above price threshold  
-- price_below: Token goes below price threshold
-- price_change: Token changes by percentage (negative for drops)
-- relative_change: Complex multi-token conditions
-
-TOKENS: BTC, ETH, AAVE, UNI, SUSHI, COMP, MKR, SNX, CRV, 1INCH
-GROUPS: "DeFi tokens" = all DeFi tokens above
-
-REQUIRED JSON FORMAT:
-{
-  "intent": "create_alert",
-  "valid": true,
-  "condition": {
-    "condition_type": "price_above|price_below|price_change|relative_change",
-    "tokens": ["ETH"],
-    "threshold": 4000.0,
-    "timeframe": "24h"
-  },
-  "confidence": 0.9,
-  "explanation": "Will alert when ETH goes above $4000"
-}
-
-EXAMPLES:
-- "Alert when ETH hits $4000" → price_above, ["ETH"], 4000
-- "Bitcoin drops 15%" → price_change, ["BTC"], -0.15
-- "I want ethereum at five thousand" → price_above, ["ETH"], 5000
-
-Return ONLY valid JSON. For non-alerts, set "valid": false."""
-
     def _create_user_prompt(self, message: str, user_context: Optional[Dict] = None) -> str:
         """User prompt with optional context"""
         context_str = ""
         if user_context:
-            context_str = f" Context: {json.dumps(user_context)}"
+            context_str = f" Context: {serialization.dumps(user_context)}"
         
         return f'Parse: "{message}"{context_str}'
     
@@ -329,8 +482,8 @@ Return ONLY valid JSON. For non-alerts, set "valid": false."""
 
 I can set up crypto price alerts! 📈"""
         
-        # Try Ollama for response generation if available
-        if self.ollama_available:
+        # The template covers simple alerts; only relative ones are worth a model call
+        if self.ollama_available and parsed_condition.condition_type == "relative_change":
             try:
                 return await self._generate_ollama_response(parsed_condition, original_message)
             except:
@@ -338,6 +491,7 @@ I can set up crypto price alerts! 📈"""
         
         # Fallback to simple response
         return self._generate_simple_response(parsed_condition)
+    
     async def _generate_ollama_response(self, condition: ParsedCondition, original_message: str) -> str:
         """Generate response using Ollama"""
         prompt = f"""Generate a friendly crypto alert confirmation (under 50 words):
@@ -377,36 +531,6 @@ I can set up crypto price alerts! 📈"""
                 return response
 
         raise Exception("Ollama response generation failed")
-#     async def _generate_ollama_response(self, condition: ParsedCondition, original_message: str) -> str:
-#         """Generate response using Ollama"""
-#         prompt = f"""Generate a friendly crypto alert confirmation (under 50 words):
-
-# Alert: {condition.condition_type}
-# Tokens: {condition.tokens}  
-# Threshold: {condition.threshold}
-# Message: "{original_message}"
-
-# Reply with ✅ emoji and confirmation."""
-
-#         payload = {
-#             "model": self.ollama_model,
-#             "prompt": prompt,
-#             "stream": False,
-#             "options": {"num_predict": 100, "temperature": 0.3}
-#         }
-        
-#         async with self.session.post(f"{settings.OLLAMA_URL}/api/generate", json=payload) as resp:
-#             if resp.status == 200:
-#                 data = await resp.json()
-#                 response = data["response"].strip()
-                
-#                 # Ensure it starts with checkmark
-#                 if not response.startswith("✅"):
-#                     response = "✅ " + response
-                    
-#                 return response
-        
-#         raise Exception("Ollama response generation failed")
     
     def _generate_simple_response(self, condition: ParsedCondition) -> str:
         """Simple response fallback"""
@@ -1,23 +1,103 @@
 # services/notification_service.py - Updated with Resend email support
 import asyncio
 import logging
-from typing import Dict, List
+import sys
+import aiohttp
+from collections import deque
+from itertools import islice
+from typing import Dict, List, Optional
 from datetime import datetime
-import json
+from html import escape
+from string import Template
 
 from config import settings
+from database import db
+from utils import serialization
+from utils.cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
+EMAIL_BATCH_SIZE = 100  # Resend's per-request limit for /emails/batch
+EMAIL_BATCH_LINGER = 0.25  # seconds to wait for more emails before sending a batch
+EMAIL_BATCH_RETRIES = 3
+EMAIL_RETRY_BACKOFF = 0.5  # seconds, doubled on each retry
+EMAIL_DEDUPE_WINDOW = 60  # seconds during which a repeat of the same alert email is skipped
+
+class ResendRejected(RuntimeError):
+    """Resend refused the request with a non-retryable 4xx (e.g. an invalid address)"""
+
+class ResendRateLimited(RuntimeError):
+    """Resend answered 429; retry_after is how long it asked us to wait"""
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Alert email - built once; values are HTML-escaped on substitution
+EMAIL_TEMPLATE = Template("""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <title>tokenTalk Alert</title>
+            <style>
+                body { font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }
+                .container { max-width: 600px; margin: 0 auto; background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }
+                .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 8px 8px 0 0; text-align: center; }
+                .content { padding: 20px; }
+                .prices { background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 15px 0; }
+                .footer { text-align: center; color: #666; font-size: 12px; padding-top: 20px; border-top: 1px solid #eee; }
+                .btn { display: inline-block; background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; margin: 10px 0; }
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <div class="header">
+                    <h1>🪨 tokenTalk</h1>
+                    <h2>$title</h2>
+                </div>
+                <div class="content">
+                    <p>Your crypto price alert has been triggered!</p>
+                    <p><strong>Alert Message:</strong> $message</p>
+                    
+                    <div class="prices">
+                        <h3>💰 Current Prices:</h3>
+                        <ul>
+                            $prices_html
+                        </ul>
+                    </div>
+                    
+                    <p><strong>Triggered at:</strong> $triggered_at</p>
+                    
+                    <p>Stay on top of your crypto investments with tokenTalk!</p>
+                </div>
+                <div class="footer">
+                    <p>This alert was sent by tokenTalk - AI-powered crypto price alerts</p>
+                    <p>Powered by RedStone oracles and delivered via Resend</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """)
+
 class NotificationService:
     def __init__(self):
-        self.notifications = []  # In-memory store for demo
+        self.notifications = deque(maxlen=settings.NOTIFICATION_BUFFER)  # In-memory store for demo
+        self.user_notifications: Dict[str, deque] = {}  # user_id -> recent notifications
+        self._next_id = 0
         self.user_connections = {}  # Store WebSocket connections by user_id
+        self._connection_users = {}  # Reverse index: websocket -> user_id
         self.email_stats = {
             "sent": 0,
             "failed": 0,
+            "deduplicated": 0,
             "last_sent": None
         }
+        self.session: Optional[aiohttp.ClientSession] = None  # pooled connections to Resend
+        self._email_queue: asyncio.Queue = asyncio.Queue()
+        self._email_task: Optional[asyncio.Task] = None
+        self._recent_emails = TTLCache(maxsize=10_000, ttl=EMAIL_DEDUPE_WINDOW)  # (user_id, alert_id) already emailed
+        self._queued_emails = set()  # (user_id, alert_id) waiting on the batch worker
         
     async def send_alert_notification(self, alert_data: Dict):
         """Send alert notification via multiple channels"""
@@ -26,16 +106,23 @@ class NotificationService:
             notification = self._format_alert_notification(alert_data)
             
             # Store notification (in production, you'd use a proper queue)
-            self.notifications.append({
-                "id": len(self.notifications) + 1,
+            user_id = alert_data["user_id"]
+            self._next_id += 1
+            stored = {
+                "id": self._next_id,
                 "alert_id": alert_data["alert_id"],
-                "user_id": alert_data["user_id"], 
+                "user_id": user_id, 
                 "user_email": alert_data["user_email"],
                 "message": notification["message"],
                 "type": "alert_triggered",
                 "timestamp": datetime.now().isoformat(),
                 "data": alert_data
-            })
+            }
+            self.notifications.append(stored)
+            user_buffer = self.user_notifications.get(user_id)
+            if user_buffer is None:
+                user_buffer = self.user_notifications[user_id] = deque(maxlen=settings.USER_NOTIFICATION_BUFFER)
+            user_buffer.append(stored)
             
             # Send via WebSocket (real-time) to specific user
             await self._send_to_user_websockets(alert_data["user_id"], notification)
@@ -96,28 +183,29 @@ class NotificationService:
         }
     
     async def _send_email_notification(self, alert_data: Dict, notification: Dict):
-        """Send email notification via Resend"""
+        """Queue an email notification for the Resend batch worker"""
         if not settings.ENABLE_EMAIL_NOTIFICATIONS or not settings.has_resend_key():
             logger.debug("Email notifications disabled or no Resend key")
             return
         
+        # The same alert firing again within the window doesn't send another email
+        dedupe_key = (alert_data["user_id"], alert_data["alert_id"])
+        if dedupe_key in self._recent_emails or dedupe_key in self._queued_emails:
+            self.email_stats["deduplicated"] += 1
+            logger.debug(f"Skipping duplicate email for alert {alert_data['alert_id'][:8]}")
+            return
+        
         try:
             # Get user email from database
-            from database import db
-            user_email = await db.get_user_email(alert_data["user_email"])
+            user_email = await db.get_user_email(alert_data["user_id"])
             
             if not user_email:
-                logger.debug(f"No email address for user {alert_data['user_email']}")
+                logger.debug(f"No email address for user {alert_data['user_id']}")
                 return
             
-            # Import Resend
-            import resend
-            resend.api_key = settings.RESEND_API_KEY
-            
             # Create HTML email content
             html_content = self._create_email_html(notification, alert_data)
             
-            # Send email
             params = {
                 "from": settings.FROM_EMAIL,
                 "to": [user_email],
@@ -126,155 +214,224 @@ class NotificationService:
                 "text": notification["message"]  # Fallback text version
             }
             
-            # Send the email
-            response = resend.Emails.send(params)
-            
-            # Update stats
-            self.email_stats["sent"] += 1
-            self.email_stats["last_sent"] = datetime.now().isoformat()
-            
-            logger.info(f"📧 Email sent to {user_email} via Resend (ID: {response.get('id', 'unknown')})")
+            # Sent with other emails queued in the same window
+            if self._email_task is None:
+                self._email_task = asyncio.create_task(self._email_batch_worker())
+            self._email_queue.put_nowait((dedupe_key, params))
+            self._queued_emails.add(dedupe_key)
             
-        except ImportError:
-            logger.error("Resend package not installed. Run: pip install resend")
-            self.email_stats["failed"] += 1
         except Exception as e:
-            logger.error(f"Failed to send email via Resend: {e}")
+            logger.error(f"Failed to queue email for Resend: {e}")
             self.email_stats["failed"] += 1
     
+    async def _email_batch_worker(self):
+        """Send queued emails to Resend, up to a batch per request"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._email_queue.get()]
+            deadline = loop.time() + EMAIL_BATCH_LINGER
+            while len(batch) < EMAIL_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._email_queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            
+            await self._send_email_batch(batch)
+    
+    async def _send_email_batch(self, batch: List[tuple]):
+        """Post one batch of (dedupe_key, params) to Resend.
+
+        Resend rejects the whole batch if any email is invalid, so a rejected
+        batch is re-sent one email at a time to deliver the valid ones.
+        """
+        try:
+            response = await self._post_with_retries(
+                [params for _, params in batch], settings.RESEND_BATCH_API_URL
+            )
+        except ResendRejected as e:
+            logger.warning(f"Resend rejected a batch of {len(batch)} emails, sending individually: {e}")
+            for item in batch:
+                await self._send_single_email(item)
+            return
+        except Exception as e:
+            logger.error(f"Failed to send {len(batch)} emails via Resend: {e}")
+            self._finish_emails(batch, sent=False)
+            return
+        
+        self._finish_emails(batch, sent=True)
+        logger.info(f"📧 Sent {len(response.get('data', []))} emails via Resend batch")
+    
+    async def _send_single_email(self, item: tuple):
+        dedupe_key, params = item
+        try:
+            await self._post_with_retries(params, settings.RESEND_API_URL)
+        except Exception as e:
+            logger.error(f"Failed to send email for alert {dedupe_key[1][:8]} via Resend: {e}")
+            self._finish_emails([item], sent=False)
+            return
+        self._finish_emails([item], sent=True)
+    
+    def _finish_emails(self, items: List[tuple], sent: bool):
+        """Update stats; only emails Resend accepted suppress repeats of their alert"""
+        for dedupe_key, _ in items:
+            self._queued_emails.discard(dedupe_key)
+            if sent:
+                self._recent_emails.set(dedupe_key, True)
+        
+        if sent:
+            self.email_stats["sent"] += len(items)
+            self.email_stats["last_sent"] = datetime.now().isoformat()
+        else:
+            self.email_stats["failed"] += len(items)
+    
+    async def _post_with_retries(self, params, url: str) -> Dict:
+        """Post to Resend, retrying rate limits and transient errors with exponential backoff"""
+        delay = EMAIL_RETRY_BACKOFF
+        for attempt in range(EMAIL_BATCH_RETRIES + 1):
+            try:
+                return await self._post_resend_email(params, url)
+            except ResendRejected:
+                raise  # Retrying won't change a validation error
+            except Exception as e:
+                if attempt == EMAIL_BATCH_RETRIES:
+                    raise
+                wait = max(delay, e.retry_after) if isinstance(e, ResendRateLimited) else delay
+                logger.warning(f"Resend request failed, retrying in {wait}s: {e}")
+                await asyncio.sleep(wait)
+                delay *= 2
+    
+    async def _post_resend_email(self, params, url: str = settings.RESEND_API_URL) -> Dict:
+        """Send through the Resend REST API on a shared, non-blocking session"""
+        if not self.session:
+            self.session = aiohttp.ClientSession(
+                headers={"Authorization": f"Bearer {settings.RESEND_API_KEY}"},
+                timeout=aiohttp.ClientTimeout(total=15)
+            )
+        
+        async with self.session.post(url, json=params) as response:
+            if response.status == 429:
+                headers = response.headers
+                retry_after = headers.get("retry-after") or headers.get("ratelimit-reset") or 0
+                try:
+                    retry_after = float(retry_after)
+                except ValueError:
+                    retry_after = 0.0
+                raise ResendRateLimited(f"Resend API rate limited: {await response.text()}", retry_after)
+            if 400 <= response.status < 500:
+                raise ResendRejected(f"Resend API rejected the request {response.status}: {await response.text()}")
+            if response.status >= 400:
+                raise RuntimeError(f"Resend API error {response.status}: {await response.text()}")
+            return await response.json()
+    
+    async def close(self):
+        """Stop the email worker, sending queued emails, and close the Resend HTTP session"""
+        if self._email_task:
+            self._email_task.cancel()
+            self._email_task = None
+            
+            pending = []
+            while not self._email_queue.empty():
+                pending.append(self._email_queue.get_nowait())
+            for start in range(0, len(pending), EMAIL_BATCH_SIZE):
+                await self._send_email_batch(pending[start:start + EMAIL_BATCH_SIZE])
+        
+        if self.session:
+            await self.session.close()
+            self.session = None
+    
     def _create_email_html(self, notification: Dict, alert_data: Dict) -> str:
         """Create HTML email content"""
-        prices_html = ""
-        for token, price_data in alert_data.get("prices", {}).items():
-            prices_html += f"<li><strong>{token}:</strong> {price_data['formatted']}</li>"
+        prices_html = "".join(
+            f"<li><strong>{escape(token)}:</strong> {escape(price_data['formatted'])}</li>"
+            for token, price_data in alert_data.get("prices", {}).items()
+        )
         
-        return f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <title>tokenTalk Alert</title>
-            <style>
-                body {{ font-family: Arial, sans-serif; margin: 20px; background-color: #f5f5f5; }}
-                .container {{ max-width: 600px; margin: 0 auto; background-color: white; padding: 20px; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 8px 8px 0 0; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .prices {{ background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 15px 0; }}
-                .footer {{ text-align: center; color: #666; font-size: 12px; padding-top: 20px; border-top: 1px solid #eee; }}
-                .btn {{ display: inline-block; background-color: #007bff; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; margin: 10px 0; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🪨 tokenTalk</h1>
-                    <h2>{notification["title"]}</h2>
-                </div>
-                <div class="content">
-                    <p>Your crypto price alert has been triggered!</p>
-                    <p><strong>Alert Message:</strong> {alert_data.get("message", "Price alert triggered")}</p>
-                    
-                    <div class="prices">
-                        <h3>💰 Current Prices:</h3>
-                        <ul>
-                            {prices_html}
-                        </ul>
-                    </div>
-                    
-                    <p><strong>Triggered at:</strong> {alert_data.get("triggered_at", datetime.now().isoformat())}</p>
-                    
-                    <p>Stay on top of your crypto investments with tokenTalk!</p>
-                </div>
-                <div class="footer">
-                    <p>This alert was sent by tokenTalk - AI-powered crypto price alerts</p>
-                    <p>Powered by RedStone oracles and delivered via Resend</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
+        return EMAIL_TEMPLATE.substitute(
+            title=escape(notification["title"]),
+            message=escape(alert_data.get("message", "Price alert triggered")),
+            prices_html=prices_html,
+            triggered_at=escape(alert_data.get("triggered_at", datetime.now().isoformat()))
+        )
     
     async def _send_to_user_websockets(self, user_id: str, notification: Dict):
         """Send notification to specific user's WebSocket connections"""
-        user_websockets = self.user_connections.get(user_id, [])
+        user_websockets = self.user_connections.get(user_id)
         
         if not user_websockets:
             logger.debug(f"No WebSocket connections for user {user_id}")
             return
             
-        # Remove closed connections and send to active ones
-        active_connections = []
-        for websocket in user_websockets:
-            try:
-                await websocket.send_text(json.dumps({
-                    "type": "alert_notification",
-                    "data": notification
-                }))
-                active_connections.append(websocket)
-            except:
-                # Connection closed, don't re-add to active list
-                pass
+        # Encode once and fan out concurrently
+        payload = serialization.dumps({
+            "type": "alert_notification",
+            "data": notification
+        })
+        targets = list(user_websockets)
+        results = await asyncio.gather(
+            *(websocket.send_text(payload) for websocket in targets),
+            return_exceptions=True
+        )
+        
+        # Remove closed connections
+        sent = 0
+        for websocket, result in zip(targets, results):
+            if isinstance(result, Exception):
+                self.remove_websocket_connection(websocket, user_id)
+            else:
+                sent += 1
         
-        self.user_connections[user_id] = active_connections
-        logger.debug(f"Sent notification to {len(active_connections)} connections for user {user_id}")
+        logger.debug(f"Sent notification to {sent} connections for user {user_id}")
     
     async def _send_console_notification(self, notification: Dict):
         """Send notification to console (for development)"""
-        print(f"\n{'='*60}")
-        print(f"🚨 ALERT TRIGGERED!")
-        print(f"{'='*60}")
-        print(f"Title: {notification['title']}")
-        print(f"Message: {notification['message']}")
-        print(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print(f"{'='*60}\n")
+        rule = "=" * 60
+        sys.stdout.write("\n".join([
+            "",
+            rule,
+            "🚨 ALERT TRIGGERED!",
+            rule,
+            f"Title: {notification['title']}",
+            f"Message: {notification['message']}",
+            f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            rule,
+        ]) + "\n\n")
     
     def add_websocket_connection(self, websocket, user_id: str = "anonymous"):
         """Add a WebSocket connection for a specific user"""
-        if user_id not in self.user_connections:
-            self.user_connections[user_id] = []
-        
-        self.user_connections[user_id].append(websocket)
-        logger.info(f"Added WebSocket for user {user_id}. Total connections: {sum(len(conns) for conns in self.user_connections.values())}")
+        self.user_connections.setdefault(user_id, set()).add(websocket)
+        self._connection_users[websocket] = user_id
+        logger.info(f"Added WebSocket for user {user_id}. Total connections: {len(self._connection_users)}")
     
     def remove_websocket_connection(self, websocket, user_id: str = None):
         """Remove a WebSocket connection"""
-        if user_id and user_id in self.user_connections:
-            if websocket in self.user_connections[user_id]:
-                self.user_connections[user_id].remove(websocket)
-                if not self.user_connections[user_id]:  # Remove empty user entry
-                    del self.user_connections[user_id]
-        else:
-            # Remove from all users if user_id not specified
-            for uid, connections in list(self.user_connections.items()):
-                if websocket in connections:
-                    connections.remove(websocket)
-                    if not connections:
-                        del self.user_connections[uid]
-                    break
+        user_id = self._connection_users.pop(websocket, user_id)
+        connections = self.user_connections.get(user_id)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:  # Remove empty user entry
+                del self.user_connections[user_id]
         
-        total_connections = sum(len(conns) for conns in self.user_connections.values())
-        logger.info(f"Removed WebSocket connection. Total connections: {total_connections}")
+        logger.info(f"Removed WebSocket connection. Total connections: {len(self._connection_users)}")
     
     async def get_recent_notifications(self, user_id: str = None, limit: int = 10) -> List[Dict]:
         """Get recent notifications for a user or all users"""
-        if user_id:
-            user_notifications = [
-                notif for notif in self.notifications 
-                if notif["user_id"] == user_id
-            ]
-            return user_notifications[-limit:]
-        
-        return self.notifications[-limit:]
+        source = self.user_notifications.get(user_id, ()) if user_id else self.notifications
+        recent = list(islice(reversed(source), limit))
+        recent.reverse()
+        return recent
     
     async def get_service_status(self) -> Dict:
         """Get notification service status"""
-        total_connections = sum(len(conns) for conns in self.user_connections.values())
+        total_connections = len(self._connection_users)
         
         return {
             "service": "Notification Service",
             "total_websocket_connections": total_connections,
             "active_users": len(self.user_connections),
-            "total_notifications": len(self.notifications),
+            "total_notifications": self._next_id,
             "user_connections": {uid: len(conns) for uid, conns in self.user_connections.items()},
             "email_stats": self.email_stats,
             "capabilities": {
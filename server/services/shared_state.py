@@ -0,0 +1,219 @@
+# services/shared_state.py - Optional Redis backend shared across uvicorn workers
+import asyncio
+import logging
+import os
+import socket
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# Redis is optional - without it every worker keeps its own in-process state
+try:
+    import redis.asyncio as aioredis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+from config import settings
+from utils import serialization
+
+logger = logging.getLogger(__name__)
+
+# Compare-and-act on the leader key in one step, so a lock that expired and was
+# taken by another worker between our GET and the write is never renewed or deleted
+RENEW_LEADER_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_LEADER_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class SharedState:
+    """Cross-worker state: engine leader lock, latest prices and alert pub/sub"""
+
+    PRICES_KEY = "tokentalk:prices"
+    LEADER_KEY = "tokentalk:engine:leader"
+    ALERT_CHANNEL_PREFIX = "tokentalk:alerts:"
+    INDEX_CHANNEL = "tokentalk:alert-index"
+
+    def __init__(self):
+        self.redis = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._pubsub = None
+        self._subscriber_task: Optional[asyncio.Task] = None
+        self._index_pubsub = None
+        self._index_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.redis is not None
+
+    async def init(self):
+        """Connect to Redis if REDIS_URL is configured"""
+        if self.redis is not None or not settings.REDIS_URL:
+            return
+
+        if not REDIS_AVAILABLE:
+            logger.warning("⚠️ REDIS_URL is set but the redis package is not installed - using in-process state")
+            return
+
+        try:
+            client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+            await client.ping()
+            self.redis = client
+            logger.info(f"✅ Shared state connected to Redis as worker {self.worker_id}")
+        except Exception as e:
+            logger.warning(f"⚠️ Redis unavailable, using in-process state: {e}")
+
+    # Alert engine leadership
+    async def acquire_leader(self, ttl: int) -> bool:
+        """Claim (or renew) the single alert engine leader slot"""
+        if not self.enabled:
+            return True  # Single process - always the leader
+
+        try:
+            if await self.redis.set(self.LEADER_KEY, self.worker_id, nx=True, ex=ttl):
+                return True
+
+            renewed = await self.redis.eval(RENEW_LEADER_SCRIPT, 1, self.LEADER_KEY, self.worker_id, ttl)
+            return bool(renewed)
+        except Exception as e:
+            logger.warning(f"Leader election failed: {e}")
+            return False
+
+    async def release_leader(self):
+        """Give up leadership so another worker can take over immediately"""
+        if not self.enabled:
+            return
+
+        try:
+            await self.redis.eval(RELEASE_LEADER_SCRIPT, 1, self.LEADER_KEY, self.worker_id)
+        except Exception as e:
+            logger.debug(f"Leader release failed: {e}")
+
+    # Price cache
+    async def store_prices(self, prices: Dict[str, Dict]):
+        """Publish the latest engine prices for every worker"""
+        if not self.enabled or not prices:
+            return
+
+        try:
+            await self.redis.hset(
+                self.PRICES_KEY,
+                mapping={symbol: serialization.dumps(data) for symbol, data in prices.items()}
+            )
+        except Exception as e:
+            logger.debug(f"Failed to store shared prices: {e}")
+
+    async def get_prices(self, symbols: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Read prices published by the engine leader"""
+        if not self.enabled:
+            return {}
+
+        try:
+            if symbols:
+                values = await self.redis.hmget(self.PRICES_KEY, symbols)
+                raw = dict(zip(symbols, values))
+            else:
+                raw = await self.redis.hgetall(self.PRICES_KEY)
+            return {symbol: serialization.loads(value) for symbol, value in raw.items() if value}
+        except Exception as e:
+            logger.debug(f"Failed to read shared prices: {e}")
+            return {}
+
+    # Alert fan-out
+    async def publish_alert(self, user_id: str, message: Dict) -> bool:
+        """Publish a user notification to every worker. Returns False if not shared."""
+        if not self.enabled:
+            return False
+
+        try:
+            await self.redis.publish(f"{self.ALERT_CHANNEL_PREFIX}{user_id}", serialization.dumps(message))
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to publish alert for {user_id}: {e}")
+            return False
+
+    async def subscribe_alerts(self, handler: Callable[[str, Dict], Awaitable[None]]):
+        """Forward published user notifications to a local handler"""
+        if not self.enabled or self._subscriber_task:
+            return
+
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.psubscribe(f"{self.ALERT_CHANNEL_PREFIX}*")
+        self._subscriber_task = asyncio.create_task(self._alert_listener(handler))
+
+    async def _alert_listener(self, handler: Callable[[str, Dict], Awaitable[None]]):
+        prefix_len = len(self.ALERT_CHANNEL_PREFIX)
+
+        async for message in self._pubsub.listen():
+            if message.get("type") != "pmessage":
+                continue
+
+            try:
+                user_id = message["channel"][prefix_len:]
+                await handler(user_id, serialization.loads(message["data"]))
+            except Exception as e:
+                logger.error(f"Error dispatching shared alert: {e}")
+
+    # Alert index changes (web workers -> alert engine leader)
+    async def publish_index_change(self, change: Dict):
+        """Tell the process running the alert engine which alert changed and how"""
+        if not self.enabled:
+            return
+
+        try:
+            await self.redis.publish(self.INDEX_CHANNEL, serialization.dumps({"worker": self.worker_id, **change}))
+        except Exception as e:
+            logger.debug(f"Failed to publish alert index change: {e}")
+
+    async def subscribe_index_changes(self, handler: Callable[[Dict], None]):
+        """Call handler with each alert change another process reports"""
+        if not self.enabled or self._index_task:
+            return
+
+        self._index_pubsub = self.redis.pubsub()
+        await self._index_pubsub.subscribe(self.INDEX_CHANNEL)
+        self._index_task = asyncio.create_task(self._index_listener(handler))
+
+    async def _index_listener(self, handler: Callable[[Dict], None]):
+        async for message in self._index_pubsub.listen():
+            if message.get("type") != "message":
+                continue
+
+            try:
+                change = serialization.loads(message["data"])
+                # Skip our own changes - the local index already has them
+                if change.get("worker") != self.worker_id:
+                    handler(change)
+            except Exception as e:
+                logger.error(f"Error applying alert index change: {e}")
+
+    async def close(self):
+        """Stop the subscribers and close the Redis connection"""
+        for task in (self._subscriber_task, self._index_task):
+            if task:
+                task.cancel()
+        self._subscriber_task = None
+        self._index_task = None
+
+        for pubsub in (self._pubsub, self._index_pubsub):
+            if pubsub:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+        self._pubsub = None
+        self._index_pubsub = None
+
+        if self.redis:
+            await self.release_leader()
+            await self.redis.close()
+            self.redis = None
+
+# Global shared state instance
+shared_state = SharedState()
@@ -0,0 +1,107 @@
+# test_alert_evaluator.py - Unit tests for batch alert condition evaluation
+import random
+from array import array
+
+import pytest
+
+from services import alert_evaluator
+from services.alert_evaluator import (
+    NO_PRICE, OP_PRICE_ABOVE, OP_PRICE_BELOW, OP_PRICE_CHANGE, OP_RELATIVE_CHANGE, ConditionBatch
+)
+
+def evaluate_one(*args, **kwargs) -> int:
+    batch = ConditionBatch()
+    batch.add(*args, **kwargs)
+    return batch.evaluate()[0]
+
+def test_empty_batch():
+    assert len(ConditionBatch().evaluate()) == 0
+
+def test_price_above_and_below_include_threshold():
+    assert evaluate_one(OP_PRICE_ABOVE, 100.0, 100.0) == 1
+    assert evaluate_one(OP_PRICE_ABOVE, 99.9, 100.0) == 0
+    assert evaluate_one(OP_PRICE_BELOW, 100.0, 100.0) == 1
+    assert evaluate_one(OP_PRICE_BELOW, 100.1, 100.0) == 0
+
+def test_price_change_uses_threshold_sign():
+    # +10% rise wanted
+    assert evaluate_one(OP_PRICE_CHANGE, 110.0, 0.10, hist_price=100.0) == 1
+    assert evaluate_one(OP_PRICE_CHANGE, 109.0, 0.10, hist_price=100.0) == 0
+    assert evaluate_one(OP_PRICE_CHANGE, 80.0, 0.10, hist_price=100.0) == 0
+    # -10% drop wanted
+    assert evaluate_one(OP_PRICE_CHANGE, 90.0, -0.10, hist_price=100.0) == 1
+    assert evaluate_one(OP_PRICE_CHANGE, 120.0, -0.10, hist_price=100.0) == 0
+    # zero threshold never matches
+    assert evaluate_one(OP_PRICE_CHANGE, 120.0, 0.0, hist_price=100.0) == 0
+
+def test_price_change_without_usable_history():
+    assert evaluate_one(OP_PRICE_CHANGE, 200.0, 0.10) == 0
+    assert evaluate_one(OP_PRICE_CHANGE, 200.0, 0.10, hist_price=0.0) == 0
+
+def test_relative_change():
+    # Token dropped 10% while the secondary stayed within 2%
+    assert evaluate_one(OP_RELATIVE_CHANGE, 90.0, -0.05, hist_price=100.0,
+                        sec_price=101.0, sec_hist_price=100.0, sec_threshold=0.02) == 1
+    # Secondary moved too much
+    assert evaluate_one(OP_RELATIVE_CHANGE, 90.0, -0.05, hist_price=100.0,
+                        sec_price=95.0, sec_hist_price=100.0, sec_threshold=0.02) == 0
+    # Token didn't drop far enough
+    assert evaluate_one(OP_RELATIVE_CHANGE, 97.0, -0.05, hist_price=100.0,
+                        sec_price=100.0, sec_hist_price=100.0, sec_threshold=0.02) == 0
+
+def test_relative_change_without_secondary_never_matches():
+    assert evaluate_one(OP_RELATIVE_CHANGE, 90.0, -0.05, hist_price=100.0) == 0
+    assert evaluate_one(OP_RELATIVE_CHANGE, 90.0, -0.05, hist_price=100.0,
+                        sec_price=NO_PRICE, sec_hist_price=100.0, sec_threshold=0.02) == 0
+    assert evaluate_one(OP_RELATIVE_CHANGE, 90.0, -0.05, hist_price=100.0,
+                        sec_price=100.0, sec_hist_price=0.0, sec_threshold=0.02) == 0
+
+def test_rows_are_evaluated_independently():
+    batch = ConditionBatch()
+    batch.add(OP_PRICE_ABOVE, 5.0, 10.0)
+    batch.add(OP_PRICE_ABOVE, 15.0, 10.0)
+    batch.add(OP_PRICE_CHANGE, 50.0, -0.25, hist_price=100.0)
+    batch.add(OP_PRICE_BELOW, 15.0, 10.0)
+    assert len(batch) == 4
+    assert list(batch.evaluate()) == [0, 1, 1, 0]
+
+def random_batch(rows: int, seed: int = 7) -> ConditionBatch:
+    """Rows covering every op, including missing and zero history prices"""
+    rng = random.Random(seed)
+
+    def maybe_price():
+        return rng.choice([NO_PRICE, 0.0, rng.uniform(0.5, 200.0)])
+
+    batch = ConditionBatch()
+    for _ in range(rows):
+        op = rng.choice([OP_PRICE_ABOVE, OP_PRICE_BELOW, OP_PRICE_CHANGE, OP_RELATIVE_CHANGE])
+        price = rng.uniform(0.5, 200.0)
+        if op in (OP_PRICE_ABOVE, OP_PRICE_BELOW):
+            threshold = rng.uniform(0.5, 200.0)
+        else:
+            threshold = rng.uniform(-0.5, 0.5)
+        batch.add(op, price, threshold, hist_price=maybe_price(), sec_price=maybe_price(),
+                  sec_hist_price=maybe_price(), sec_threshold=rng.uniform(0.0, 0.2))
+    return batch
+
+def run_kernel(kernel, batch: ConditionBatch) -> list:
+    out = array("b", bytes(len(batch)))
+    kernel(batch.ops, batch.prices, batch.hist_prices, batch.thresholds,
+           batch.sec_prices, batch.sec_hist_prices, batch.sec_thresholds, out)
+    return list(out)
+
+def test_random_batch_hits_every_outcome():
+    results = run_kernel(getattr(alert_evaluator._evaluate_rows, "py_func", alert_evaluator._evaluate_rows),
+                         random_batch(2000))
+    assert 0 < sum(results) < len(results)
+
+def test_compiled_kernel_matches_python():
+    pytest.importorskip("numba")
+    if not alert_evaluator.NUMBA_AVAILABLE:
+        pytest.skip("numba failed to import in alert_evaluator")
+
+    batch = random_batch(2000)
+    compiled = run_kernel(alert_evaluator._evaluate_rows, batch)
+    python = run_kernel(alert_evaluator._evaluate_rows.py_func, batch)
+    assert compiled == python
+    assert list(batch.evaluate()) == compiled
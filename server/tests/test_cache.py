@@ -0,0 +1,131 @@
+# test_cache.py - Unit tests for the in-process caches
+import asyncio
+
+import pytest
+
+from utils import cache
+from utils.cache import TTLCache, async_ttl_cache
+
+class Clock:
+    """Stand-in for time.monotonic that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "monotonic", clock)
+    return clock
+
+def test_get_set_pop_clear(clock):
+    c = TTLCache(maxsize=4, ttl=10)
+    assert c.get("a") is None
+    assert c.get("a", "default") == "default"
+
+    c.set("a", 1)
+    c.set("b", None)
+    assert c.get("a") == 1
+    assert "b" in c  # a cached None still counts as present
+    assert len(c) == 2
+
+    assert c.pop("a") == 1
+    assert c.pop("a", "gone") == "gone"
+    c.clear()
+    assert len(c) == 0 and "b" not in c
+
+def test_entry_expires_after_ttl(clock):
+    c = TTLCache(maxsize=4, ttl=10)
+    c.set("a", 1)
+
+    clock.now += 9.999
+    assert c.get("a") == 1
+
+    clock.now += 0.001
+    assert c.get("a") is None
+    assert "a" not in c
+    assert len(c) == 0  # expired entries are dropped on read
+
+def test_per_entry_ttl_overrides_default(clock):
+    c = TTLCache(maxsize=4, ttl=10)
+    c.set("short", 1, ttl=1)
+    c.set("long", 2)
+
+    clock.now += 5
+    assert c.get("short") is None
+    assert c.get("long") == 2
+
+def test_set_restarts_ttl(clock):
+    c = TTLCache(maxsize=4, ttl=10)
+    c.set("a", 1)
+    clock.now += 8
+    c.set("a", 2)
+    clock.now += 8
+    assert c.get("a") == 2
+
+def test_evicts_least_recently_set(clock):
+    c = TTLCache(maxsize=2, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.set("c", 3)
+    assert len(c) == 2
+    assert "a" not in c
+    assert c.get("b") == 2 and c.get("c") == 3
+
+def test_get_refreshes_recency(clock):
+    c = TTLCache(maxsize=2, ttl=10)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert "b" not in c
+    assert c.get("a") == 1 and c.get("c") == 3
+
+def test_async_ttl_cache_shares_one_refresh(clock):
+    calls = []
+
+    @async_ttl_cache(ttl=10)
+    async def fetch(symbol):
+        calls.append(symbol)
+        await asyncio.sleep(0)
+        return {"symbol": symbol}
+
+    async def run():
+        return await asyncio.gather(*(fetch("ETH") for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert calls == ["ETH"]
+    assert all(r == {"symbol": "ETH"} for r in results)
+
+def test_async_ttl_cache_expires_and_keys_on_arguments(clock):
+    calls = []
+
+    @async_ttl_cache(ttl=10)
+    async def fetch(symbol, currency="usd"):
+        calls.append((symbol, currency))
+        return {"symbol": symbol}
+
+    async def run():
+        await fetch("ETH")
+        await fetch("ETH")
+        await fetch("ETH", currency="eur")
+        clock.now += 10
+        await fetch("ETH")
+
+    asyncio.run(run())
+    assert calls == [("ETH", "usd"), ("ETH", "eur"), ("ETH", "usd")]
+
+def test_async_ttl_cache_hits_are_copies(clock):
+    @async_ttl_cache(ttl=10)
+    async def fetch():
+        return {"price": 1.0}
+
+    async def run():
+        first = await fetch()
+        first["price"] = 99.0
+        return await fetch()
+
+    assert asyncio.run(run()) == {"price": 1.0}
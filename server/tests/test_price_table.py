@@ -0,0 +1,86 @@
+# test_price_table.py - Unit tests for the alert engine's price history
+from utils.price_table import (
+    COARSE_HISTORY_INTERVAL, FINE_HISTORY_SPAN, MAX_LOOKBACK, PriceTable, ring_slots
+)
+
+INTERVAL = 30
+
+def fill(table, seconds, step=INTERVAL, start=INTERVAL):
+    """Price ETH at `start`, `start + step`, ... up to `seconds`; the price is the sample time"""
+    t = start
+    while t <= seconds:
+        table.set("ETH", float(t), None, float(t))
+        t += step
+    return t - step
+
+def test_unknown_symbol():
+    assert PriceTable().price_ago("ETH", 60) is None
+
+def test_history_too_short_returns_none():
+    table = PriceTable(history_interval=INTERVAL)
+    fill(table, 3600)
+    assert table.price_ago("ETH", 3600) is None
+    assert table.price_ago("ETH", 3600 - INTERVAL) == float(INTERVAL)
+
+def test_sample_exactly_at_target_is_used():
+    table = PriceTable(history_interval=INTERVAL)
+    last = fill(table, 3600)
+    assert table.price_ago("ETH", 600) == float(last - 600)
+
+def test_between_samples_uses_the_older_one():
+    table = PriceTable(history_interval=INTERVAL)
+    last = fill(table, 3600)
+    assert table.price_ago("ETH", 610) == float(last - 630)
+
+def test_updates_between_samples_dont_shift_history():
+    table = PriceTable(history_interval=INTERVAL)
+    last = fill(table, 3600)
+    table.set("ETH", 1.0, None, last + 10)  # too soon for a new sample
+    assert table.get("ETH") == 1.0
+    assert table.price_ago("ETH", 610) == float(last - 600)
+
+def test_full_day_lookback_at_steady_state():
+    # Well past the fine ring wrapping: 24h back must still resolve exactly
+    table = PriceTable(history_interval=INTERVAL)
+    last = fill(table, 3 * FINE_HISTORY_SPAN)
+    assert table.price_ago("ETH", FINE_HISTORY_SPAN) == float(last - FINE_HISTORY_SPAN)
+
+def test_seven_day_lookback_uses_coarse_history():
+    table = PriceTable(history_interval=INTERVAL)
+    last = fill(table, MAX_LOOKBACK + 2 * FINE_HISTORY_SPAN)
+    target = last - MAX_LOOKBACK
+    price = table.price_ago("ETH", MAX_LOOKBACK)
+    assert price is not None
+    assert target - COARSE_HISTORY_INTERVAL < price <= target
+
+def test_lookback_between_tiers():
+    table = PriceTable(history_interval=INTERVAL)
+    last = fill(table, MAX_LOOKBACK)
+    target = last - 2 * FINE_HISTORY_SPAN
+    price = table.price_ago("ETH", 2 * FINE_HISTORY_SPAN)
+    assert target - COARSE_HISTORY_INTERVAL < price <= target
+
+def test_stalled_updates():
+    # A gap in updates leaves the newest sample before the gap as the answer
+    table = PriceTable(history_interval=INTERVAL)
+    fill(table, 1800)
+    last = fill(table, 7200, start=5400)
+    assert table.price_ago("ETH", last - 3000) == 1800.0
+
+def test_ring_slots_cover_span_plus_one_interval():
+    assert ring_slots(FINE_HISTORY_SPAN, INTERVAL) == FINE_HISTORY_SPAN // INTERVAL + 1
+    assert ring_slots(100, 30) == 5
+
+def test_missing_source_timestamp_defaults_to_update_time():
+    table = PriceTable()
+    table.set("ETH", 1.0, None, 12.5)
+    assert table.timestamp("ETH") == 12500
+
+def test_many_tokens_grow_storage():
+    table = PriceTable(history_interval=INTERVAL)
+    for n in range(100):
+        table.set(f"T{n}", float(n), 0, 60.0)
+        table.set(f"T{n}", float(n) + 1, 0, 120.0)
+    assert len(table) == 100
+    assert table.get("T99") == 100.0
+    assert table.price_ago("T99", 60) == 99.0
@@ -0,0 +1,134 @@
+# test_shared_state.py - Unit tests for the cross-worker shared state
+import asyncio
+
+from services import shared_state as shared_state_module
+from services.shared_state import RELEASE_LEADER_SCRIPT, RENEW_LEADER_SCRIPT, SharedState
+
+class FakeRedis:
+    """Just enough of redis.asyncio for SharedState; the Lua scripts are emulated"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.hashes = {}
+        self.published = []
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = value
+        self.ttls[key] = ex
+        return True
+
+    async def eval(self, script, numkeys, key, worker_id, *args):
+        if self.values.get(key) != worker_id:
+            return 0
+        if script == RENEW_LEADER_SCRIPT:
+            self.ttls[key] = int(args[0])
+            return 1
+        if script == RELEASE_LEADER_SCRIPT:
+            del self.values[key]
+            return 1
+        raise AssertionError("unexpected script")
+
+    async def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    async def hmget(self, key, fields):
+        return [self.hashes.get(key, {}).get(field) for field in fields]
+
+    async def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    async def close(self):
+        pass
+
+def worker(redis, worker_id):
+    state = SharedState()
+    state.redis = redis
+    state.worker_id = worker_id
+    return state
+
+def test_disabled_without_redis(monkeypatch):
+    monkeypatch.setattr(shared_state_module.settings, "REDIS_URL", "")
+
+    async def run():
+        state = SharedState()
+        await state.init()
+        return (state.enabled, await state.acquire_leader(30), await state.get_prices(),
+                await state.publish_alert("u", {"x": 1}))
+
+    assert asyncio.run(run()) == (False, True, {}, False)
+
+def test_single_leader_renews_and_releases():
+    redis = FakeRedis()
+    a, b = worker(redis, "a"), worker(redis, "b")
+
+    async def run():
+        assert await a.acquire_leader(30)
+        assert not await b.acquire_leader(30)
+        assert await a.acquire_leader(45)  # renewal
+        assert redis.ttls[SharedState.LEADER_KEY] == 45
+
+        await b.release_leader()  # not the holder - no effect
+        assert redis.values[SharedState.LEADER_KEY] == "a"
+
+        await a.release_leader()
+        assert await b.acquire_leader(30)
+        assert not await a.acquire_leader(30)
+
+    asyncio.run(run())
+
+def test_expired_leader_cannot_renew_over_new_holder():
+    redis = FakeRedis()
+    a, b = worker(redis, "a"), worker(redis, "b")
+
+    async def run():
+        assert await a.acquire_leader(30)
+        del redis.values[SharedState.LEADER_KEY]  # lock expired
+        assert await b.acquire_leader(30)
+        assert not await a.acquire_leader(30)
+        await a.release_leader()
+        assert redis.values[SharedState.LEADER_KEY] == "b"
+
+    asyncio.run(run())
+
+def test_prices_round_trip():
+    redis = FakeRedis()
+    leader, web = worker(redis, "a"), worker(redis, "b")
+    prices = {"ETH": {"price": 3000.5, "timestamp": 1}, "BTC": {"price": 60000.0, "timestamp": 2}}
+
+    async def run():
+        await leader.store_prices(prices)
+        return await web.get_prices(["ETH", "SOL"]), await web.get_prices()
+
+    some, everything = asyncio.run(run())
+    assert some == {"ETH": prices["ETH"]}
+    assert everything == prices
+
+class FakePubSub:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def listen(self):
+        for message in self.messages:
+            yield message
+
+def test_index_listener_skips_own_changes():
+    redis = FakeRedis()
+    a, b = worker(redis, "a"), worker(redis, "b")
+    applied = []
+
+    async def run():
+        await a.publish_index_change({"op": "remove", "alert_id": "1"})
+        await b.publish_index_change({"op": "remove", "alert_id": "2"})
+        messages = [{"type": "subscribe", "data": 1}]
+        messages += [{"type": "message", "data": data} for _, data in redis.published]
+        a._index_pubsub = FakePubSub(messages)
+        await a._index_listener(applied.append)
+
+    asyncio.run(run())
+    assert applied == [{"worker": "b", "op": "remove", "alert_id": "2"}]
@@ -0,0 +1,80 @@
+# utils/cache.py - Small in-process caches
+import asyncio
+import copy
+import functools
+import time
+from collections import OrderedDict
+
+def async_ttl_cache(ttl: float):
+    """Cache a coroutine function's result for `ttl` seconds.
+
+    Callers that miss share one refresh: the first takes the lock and
+    recomputes, the rest wait on the lock and then read the fresh entry.
+    Hits return a shallow copy so callers can't mutate the cached value.
+    """
+    def decorator(fn):
+        lock = asyncio.Lock()
+        entries = {}  # key -> (expires_at, value)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+
+            entry = entries.get(key)
+            if entry and time.monotonic() < entry[0]:
+                return copy.copy(entry[1])
+
+            async with lock:
+                entry = entries.get(key)
+                if entry and time.monotonic() < entry[0]:
+                    return copy.copy(entry[1])
+
+                value = await fn(*args, **kwargs)
+                entries[key] = (time.monotonic() + ttl, value)
+
+            return copy.copy(value)
+
+        return wrapper
+    return decorator
+
+class TTLCache:
+    """Size-bounded mapping whose entries expire `ttl` seconds after being set.
+
+    Least recently used entries are evicted once `maxsize` is reached.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if time.monotonic() >= entry[0]:
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def set(self, key, value, ttl: float = None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._entries.clear()
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+_MISSING = object()
@@ -0,0 +1,174 @@
+# utils/price_table.py - Compact latest-price store for the alert engine
+import math
+from array import array
+from typing import Dict, List, Optional
+
+GROW_BY = 64  # slots added at a time
+
+# History tiers: fine samples for the last day, coarse ones back to the
+# longest supported timeframe ("7d")
+FINE_HISTORY_SPAN = 86400  # seconds
+MAX_LOOKBACK = 7 * 86400  # seconds
+COARSE_HISTORY_INTERVAL = 900  # seconds between coarse samples
+
+def ring_slots(span: float, interval: float) -> int:
+    """Slots a ring sampled every `interval` needs to reach `span` back from any update"""
+    return math.ceil(span / interval) + 1
+
+class SampleRing:
+    """Per-token ring buffers of price samples taken at most once every `interval` seconds.
+
+    Token i owns prices/times[i*slots:(i+1)*slots]. Samples aren't evenly
+    spaced (updates can stall), so each slot records when it was taken.
+    """
+
+    __slots__ = ("interval", "slots", "prices", "times", "head", "last")
+
+    def __init__(self, interval: float, slots: int):
+        self.interval = interval
+        self.slots = slots
+        self.prices = array("d")
+        self.times = array("d")  # epoch seconds each slot was sampled
+        self.head = array("q")  # samples written per token
+        self.last = array("d")  # epoch seconds of each token's latest sample
+
+    def grow(self, tokens: int):
+        self.prices.extend([0.0] * (tokens * self.slots))
+        self.times.extend([0.0] * (tokens * self.slots))
+        self.head.extend([0] * tokens)
+        self.last.extend([0.0] * tokens)
+
+    def record(self, i: int, price: float, at: float):
+        """Sample token i's price unless the last sample is under `interval` old"""
+        if at - self.last[i] < self.interval:
+            return
+        head = self.head[i]
+        pos = i * self.slots + head % self.slots
+        self.prices[pos] = price
+        self.times[pos] = at
+        self.head[i] = head + 1
+        self.last[i] = at
+
+    def at_or_before(self, i: int, target: float) -> Optional[float]:
+        """Price of token i's newest retained sample taken at or before `target`"""
+        slots = self.slots
+        base = i * slots
+        head = self.head[i]
+        count = min(head, slots)
+        oldest = head - count  # logical index k lives at base + (oldest + k) % slots
+
+        # Sample times increase with k: find the last sample taken at or before target
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[base + (oldest + mid) % slots] <= target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+        return self.prices[base + (oldest + lo - 1) % slots]
+
+class PriceTable:
+    """Latest price per token as parallel typed arrays (structure of arrays).
+
+    Each token gets a fixed slot on first sight; prices, source timestamps
+    (ms) and local update times (epoch seconds) live in contiguous
+    `array` buffers instead of one dict per token per fetch.
+
+    Price history for price_ago() is kept in two SampleRings: one sampled
+    every `history_interval` seconds covering FINE_HISTORY_SPAN, and one
+    sampled every `coarse_interval` seconds covering MAX_LOOKBACK. Each is
+    sized one interval past its span, so at steady state a lookback up to
+    MAX_LOOKBACK always finds a sample.
+    """
+
+    __slots__ = ("tokens", "token_index", "prices", "price_ts", "updated_at", "_filled", "history")
+
+    def __init__(self, history_interval: float = 30, coarse_interval: float = COARSE_HISTORY_INTERVAL):
+        self.tokens: List[str] = []
+        self.token_index: Dict[str, int] = {}
+        self.prices = array("d")
+        self.price_ts = array("q")
+        self.updated_at = array("d")
+        self._filled = array("b")  # 1 once the slot has a price
+
+        # Finest first - price_ago uses the first ring that reaches back far enough
+        self.history = (
+            SampleRing(history_interval, ring_slots(FINE_HISTORY_SPAN, history_interval)),
+            SampleRing(coarse_interval, ring_slots(MAX_LOOKBACK, coarse_interval)),
+        )
+
+    def _slot(self, symbol: str) -> int:
+        i = self.token_index.get(symbol)
+        if i is None:
+            i = len(self.tokens)
+            self.tokens.append(symbol)
+            self.token_index[symbol] = i
+            if i >= len(self.prices):
+                self.prices.extend([0.0] * GROW_BY)
+                self.price_ts.extend([0] * GROW_BY)
+                self.updated_at.extend([0.0] * GROW_BY)
+                self._filled.extend([0] * GROW_BY)
+                for ring in self.history:
+                    ring.grow(GROW_BY)
+        return i
+
+    def set(self, symbol: str, price: float, timestamp_ms: Optional[float], updated_at: float):
+        i = self._slot(symbol)
+        self.prices[i] = price
+        # Feeds that don't stamp their quotes get the time we received them
+        self.price_ts[i] = int(timestamp_ms) if timestamp_ms is not None else int(updated_at * 1000)
+        self.updated_at[i] = updated_at
+        self._filled[i] = 1
+
+        for ring in self.history:
+            ring.record(i, price, updated_at)
+
+    def index_of(self, symbol: str) -> Optional[int]:
+        i = self.token_index.get(symbol)
+        if i is None or not self._filled[i]:
+            return None
+        return i
+
+    def get(self, symbol: str) -> Optional[float]:
+        """Latest price for a token, or None if it has never been priced"""
+        i = self.index_of(symbol)
+        return None if i is None else self.prices[i]
+
+    def timestamp(self, symbol: str) -> Optional[int]:
+        i = self.index_of(symbol)
+        return None if i is None else self.price_ts[i]
+
+    def updated(self, symbol: str) -> Optional[float]:
+        """When the token was last priced locally (epoch seconds)"""
+        i = self.index_of(symbol)
+        return None if i is None else self.updated_at[i]
+
+    def price_ago(self, symbol: str, seconds: float) -> Optional[float]:
+        """Latest sampled price taken at least `seconds` before the last update.
+
+        Lookbacks past FINE_HISTORY_SPAN come from the coarse ring, so the
+        sample may be up to coarse_interval older than asked for. None until
+        that much history has been collected; lookbacks past MAX_LOOKBACK
+        aren't supported.
+        """
+        i = self.index_of(symbol)
+        if i is None:
+            return None
+
+        target = self.updated_at[i] - seconds
+        for ring in self.history:
+            price = ring.at_or_before(i, target)
+            if price is not None:
+                return price
+        return None
+
+    def symbols(self) -> List[str]:
+        return [symbol for i, symbol in enumerate(self.tokens) if self._filled[i]]
+
+    def __contains__(self, symbol: str) -> bool:
+        return self.index_of(symbol) is not None
+
+    def __len__(self) -> int:
+        return sum(self._filled[:len(self.tokens)])
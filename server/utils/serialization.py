@@ -0,0 +1,48 @@
+# utils/serialization.py - JSON encoding for hot paths (websockets, pub/sub)
+import dataclasses
+import json
+from datetime import date, datetime
+from typing import Any, Union
+
+# orjson is optional - fall back to the stdlib encoder when it isn't installed
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can catch either
+JSONDecodeError = json.JSONDecodeError
+
+def _default(obj: Any):
+    """Encode the types orjson handles natively when using the stdlib encoder"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+if ORJSON_AVAILABLE:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize to UTF-8 JSON bytes"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+
+    def dumps(obj: Any) -> str:
+        """Serialize to a JSON string (for text websocket frames)"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode()
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return orjson.loads(data)
+else:
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize to UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+    def dumps(obj: Any) -> str:
+        """Serialize to a JSON string (for text websocket frames)"""
+        return json.dumps(obj, default=_default, separators=(",", ":"))
+
+    def loads(data: Union[str, bytes]) -> Any:
+        return json.loads(data)